@@ -0,0 +1,141 @@
+"""Time to reach a rolling dogtoy: stop-and-look versus detect-while-walking.
+
+Both modes walk a sim_robot.SimulatedRobot towards a toy served by a stub NetworkComputeBridge.
+The toy keeps rolling for a while after it is first seen.
+
+stop-and-look: walk to where the toy was seen, look again, and walk again if it has moved
+more than the threshold (what fetch.py does without --detect-while-walking).
+
+detect-while-walking: fetch.approach_while_detecting, re-sending the goal on the way.
+
+    python benchmark_approach.py --speed 0.3 --roll-time 4 --trials 5
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+import fetch
+import ncb_stub
+from command_executor import TrajectoryExecutor
+from sim_robot import SimulatedRobot
+
+
+class RollingTarget:
+    """A point that moves at speed (m/s) along heading for roll_time seconds after start()."""
+
+    def __init__(self, xyz, speed, heading, roll_time):
+        self.xyz = np.asarray(xyz, dtype=float)
+        self.velocity = speed * np.array([math.cos(heading), math.sin(heading), 0.0])
+        self.roll_time = roll_time
+        self.start_time = time.time()
+
+    def start(self):
+        self.start_time = time.time()
+
+    def __call__(self):
+        elapsed = min(time.time() - self.start_time, self.roll_time)
+        return tuple(self.xyz + self.velocity * elapsed)
+
+
+def stop_and_look(trajectory_executor, robot, detect, vision_tform_target, margin, threshold):
+    num_walks = 0
+    while True:
+        walk_rt_vision, heading_rt_vision = fetch.compute_stand_location_and_yaw(
+            vision_tform_target, robot, margin)
+        walk = trajectory_executor.walk_to(walk_rt_vision[0], walk_rt_vision[1],
+                                           heading_rt_vision)
+        walk.wait()
+        num_walks += 1
+
+        vision_tform_seen = detect()
+        if vision_tform_seen is None or fetch.pose_dist(vision_tform_seen,
+                                                        vision_tform_target) <= threshold:
+            return walk, num_walks
+        vision_tform_target = vision_tform_seen
+
+
+def detect_while_walking(trajectory_executor, robot, detect, vision_tform_target, margin,
+                         threshold):
+    walk, _ = fetch.approach_while_detecting(trajectory_executor, robot, detect,
+                                             vision_tform_target, margin, threshold)
+    return walk, 1 + walk.num_goal_updates
+
+
+def run_trial(mode, options, client, servicer, target):
+    robot = SimulatedRobot(latency=options.rpc_latency)
+    trajectory_executor = TrajectoryExecutor(robot, robot)
+
+    def detect():
+        _, _, vision_tform_obj = fetch.get_obj_and_img(client, 'stub-server', 'dogtoy-model',
+                                                       0.5, fetch.kImageSources, 'dogtoy')
+        return vision_tform_obj
+
+    target.start()
+    requests_before = servicer.num_requests
+    start = time.perf_counter()
+    vision_tform_target = detect()
+    walk, num_goals = mode(trajectory_executor, robot, detect, vision_tform_target, options.margin,
+                           options.threshold)
+    elapsed = time.perf_counter() - start
+
+    # How far the robot ended up from standing margin away from where the toy really is.
+    body = robot.vision_tform_body()
+    toy = target()
+    error = abs(math.hypot(toy[0] - body.x, toy[1] - body.y) - options.margin)
+    robot.shutdown()
+    return elapsed, num_goals, servicer.num_requests - requests_before, error, walk.status
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trials', default=5, type=int)
+    parser.add_argument('--distance', help='Initial distance to the toy (m)', default=4.0,
+                        type=float)
+    parser.add_argument('--speed', help='Toy speed after it is first seen (m/s)', default=0.3,
+                        type=float)
+    parser.add_argument('--roll-time', help='Seconds the toy keeps rolling', default=4.0,
+                        type=float)
+    parser.add_argument('--margin', help='Stand this far from the toy (m)', default=1.0,
+                        type=float)
+    parser.add_argument('--threshold', help='Goal refinement threshold (m)', default=0.3,
+                        type=float)
+    parser.add_argument('--ncb-latency', help='Stub NCB latency per request (s)', default=0.08,
+                        type=float)
+    parser.add_argument('--rpc-latency', help='Simulated robot RPC latency (s)', default=0.01,
+                        type=float)
+    options = parser.parse_args(argv)
+
+    target = RollingTarget((options.distance, 0.0, 0.0), options.speed, math.pi / 2,
+                           options.roll_time)
+    servicer = ncb_stub.StubNetworkComputeBridgeServicer(
+        latency=options.ncb_latency, hit_sources=fetch.kImageSources[:1], target_xyz=target)
+    server, port = ncb_stub.serve(servicer)
+    client = ncb_stub.create_client(port)
+
+    print('{:<22} {:>10} {:>10} {:>8} {:>9} {:>10}'.format('mode', 'mean (s)', 'max (s)',
+                                                           'goals', 'ncb reqs', 'error (m)'))
+    try:
+        for name, mode in (('stop-and-look', stop_and_look),
+                           ('detect-while-walking', detect_while_walking)):
+            results = [run_trial(mode, options, client, servicer, target)
+                       for _ in range(options.trials)]
+            times, goals, requests, errors, statuses = zip(*results)
+            print('{:<22} {:>10.2f} {:>10.2f} {:>8.1f} {:>9.1f} {:>10.3f}'.format(
+                name, np.mean(times), np.max(times), np.mean(goals), np.mean(requests),
+                np.mean(errors)))
+            failed = [status for status in statuses if status != 'arrived']
+            if failed:
+                print('  walks that did not arrive: ' + ', '.join(failed))
+    finally:
+        server.stop(0)
+
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,78 @@
+"""Latency of one fetch search cycle against a local stub NetworkComputeBridge.
+
+Compares the serial camera loop in fetch.get_obj_and_img with the concurrent search for 1..N
+cameras.  By default no camera sees the toy, which is the worst case for both modes.
+
+    python benchmark_camera_search.py --latency 0.08 --jitter 0.02 --cycles 20
+"""
+
+import argparse
+import sys
+import time
+from concurrent import futures
+
+import numpy as np
+
+import fetch
+import ncb_stub
+
+
+def run_cycles(client, sources, executor, cycles):
+    times = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        fetch.get_obj_and_img(client, 'stub-server', 'dogtoy-model', 0.5, sources, 'dogtoy',
+                              executor=executor)
+        times.append(time.perf_counter() - start)
+    return np.array(times) * 1000.0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cameras', help='Largest number of cameras to try', default=5,
+                        type=int)
+    parser.add_argument('--cycles', help='Search cycles per measurement', default=20, type=int)
+    parser.add_argument('--latency', help='Stub NCB latency per request (s)', default=0.08,
+                        type=float)
+    parser.add_argument('--jitter', help='Uniform +/- jitter on the latency (s)', default=0.02,
+                        type=float)
+    parser.add_argument('--hit-camera', help='Index of the camera that sees the toy',
+                        default=None, type=int)
+    options = parser.parse_args(argv)
+
+    sources = list(fetch.kImageSources)
+    while len(sources) < options.cameras:
+        sources.append('stub_camera_{}'.format(len(sources)))
+    sources = sources[:options.cameras]
+
+    hit_sources = []
+    if options.hit_camera is not None:
+        hit_sources.append(sources[options.hit_camera])
+
+    servicer = ncb_stub.StubNetworkComputeBridgeServicer(latency=options.latency,
+                                                         jitter=options.jitter,
+                                                         hit_sources=hit_sources)
+    server, port = ncb_stub.serve(servicer, max_workers=max(16, 2 * options.cameras))
+    client = ncb_stub.create_client(port)
+    executor = futures.ThreadPoolExecutor(max_workers=options.cameras)
+
+    print('{:>8} {:>22} {:>24} {:>8}'.format('cameras', 'serial mean/p95 (ms)',
+                                             'concurrent mean/p95 (ms)', 'speedup'))
+    try:
+        for num_cameras in range(1, options.cameras + 1):
+            serial = run_cycles(client, sources[:num_cameras], None, options.cycles)
+            concurrent = run_cycles(client, sources[:num_cameras], executor, options.cycles)
+            print('{:>8} {:>13.1f} / {:>6.1f} {:>15.1f} / {:>6.1f} {:>7.2f}x'.format(
+                num_cameras, serial.mean(), np.percentile(serial, 95), concurrent.mean(),
+                np.percentile(concurrent, 95),
+                serial.mean() / concurrent.mean()))
+    finally:
+        executor.shutdown(wait=False)
+        server.stop(None)
+
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
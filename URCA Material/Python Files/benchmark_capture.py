@@ -0,0 +1,93 @@
+"""capture_images.py against fake_spot.FakeRobot, no robot needed.
+
+Runs a fixed number of captures into a scratch folder (or --folder) and reports the capture
+rate, what ended up on disk and how many robot RPCs it took.  Latency, jitter and packet loss
+apply to every fake robot RPC.  Anything after -- goes to capture_images.py as is:
+
+    python benchmark_capture.py --captures 50 --latency 0.02 -- \\
+        --image-source frontleft_fisheye_image frontright_fisheye_image --pipeline
+
+With --images the fake cameras replay recorded ImageResponses (a folder of *.pb files, or a log
+from fetch.py --record) instead of blank frames.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bosdyn.api import image_pb2
+from bosdyn.client.image import ImageClient
+
+import capture_images
+from dataset_shards import DatasetReader
+from fake_spot import FakeRobot, load_messages
+from sim_robot import Link
+
+
+def folder_contents(folder):
+    """(frames, bytes) written under folder, as JPEGs or shard records."""
+    num_jpegs = 0
+    num_bytes = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            num_bytes += os.path.getsize(os.path.join(root, name))
+            num_jpegs += name.endswith('.jpg')
+    reader = DatasetReader(folder)
+    num_records = len(reader)
+    reader.close()
+    return num_jpegs + num_records, num_bytes
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--captures', default=20, type=int)
+    parser.add_argument('--period', help='Seconds between captures', default=0.0, type=float)
+    parser.add_argument('--latency', help='Robot RPC latency (s)', default=0.01, type=float)
+    parser.add_argument('--jitter', help='Robot RPC jitter (s)', default=0.0, type=float)
+    parser.add_argument('--loss', help='Fraction of robot RPCs lost', default=0.0, type=float)
+    parser.add_argument('--images', help='Recorded ImageResponses: .pb folder or log')
+    parser.add_argument('--folder', help='Write here and keep the output, instead of a scratch '
+                        'folder that is removed afterwards')
+    parser.add_argument('capture_args', nargs=argparse.REMAINDER,
+                        help='Extra capture_images.py arguments, after --')
+    options = parser.parse_args(argv)
+
+    link = Link(latency=options.latency, jitter=options.jitter, loss=options.loss)
+    images = load_messages(options.images, image_pb2.ImageResponse) if options.images else ()
+    robot = FakeRobot(link=link, images=images)
+
+    folder = options.folder or tempfile.mkdtemp(prefix='benchmark_capture_')
+    capture_args = [arg for arg in options.capture_args if arg != '--']
+    start = time.perf_counter()
+    try:
+        # The hostname goes first: a trailing nargs='+' option like --image-source would take it.
+        finished = capture_images.main(['fake-spot', '--folder', folder, '--captures',
+                                        str(options.captures), '--period', str(options.period)] +
+                                       capture_args, robot=robot)
+        elapsed = time.perf_counter() - start
+        num_frames, num_bytes = folder_contents(folder)
+    finally:
+        robot.shutdown()
+        if not options.folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if not finished:
+        print('Capture failed.')
+        return False
+
+    image_client = robot.ensure_client(ImageClient.default_service_name)
+    print()
+    print('captures: {} in {:.2f} s, {:.2f} captures/s'.format(options.captures, elapsed,
+                                                               options.captures / elapsed))
+    print('written: {} frames, {:.1f} MB'.format(num_frames, num_bytes / 1e6))
+    print('image requests: {}, robot RPCs: {} ({} lost)'.format(image_client.num_requests,
+                                                               link.num_calls, link.num_lost))
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""Compare one-JPEG-per-frame folders with record shards (dataset_shards.py).
+
+Writes the same synthetic frames both ways into a temporary folder, then reads them back: once
+in order and once shuffled, decoding every image, the way a training loop would.
+
+    python benchmark_dataset_format.py --frames 2000 --width 640 --height 480
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from dataset_shards import DatasetReader, ShardWriter
+
+
+def synthetic_frames(count, width, height, rng):
+    """JPEG bytes of noisy gradients, so they compress roughly like camera images."""
+    base = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    frames = []
+    for i in range(count):
+        noise = rng.integers(0, 32, (height, width), dtype=np.uint8)
+        img = cv2.cvtColor(np.roll(base, i * 7, axis=1) // 2 + noise, cv2.COLOR_GRAY2BGR)
+        frames.append(cv2.imencode('.jpg', img)[1].tobytes())
+    return frames
+
+
+def metadata_for(i):
+    return {
+        'source': 'frontleft_fisheye_image',
+        'acquisition_time': 1700000000.0 + i * 0.7,
+        'vision_tform_body': [0.1 * i, 0.0, 0.5, 1.0, 0.0, 0.0, 0.0],
+    }
+
+
+def write_jpegs(folder, frames):
+    for i, data in enumerate(frames):
+        path = os.path.join(folder, 'frontleft_fisheye_image_{:0>4d}.jpg'.format(i))
+        with open(path, 'wb') as out:
+            out.write(data)
+
+
+def write_shards(folder, frames, shard_bytes):
+    writer = ShardWriter(folder, prefix='frontleft_fisheye_image', max_shard_bytes=shard_bytes)
+    for i, data in enumerate(frames):
+        writer.write(data, metadata_for(i))
+    writer.close()
+
+
+def read_jpegs(folder, shuffle, rng):
+    paths = sorted(glob.glob(os.path.join(folder, '*.jpg')))
+    if shuffle:
+        rng.shuffle(paths)
+    for path in paths:
+        cv2.imread(path)
+    return len(paths)
+
+
+def read_shards(folder, shuffle, rng, batch_size):
+    reader = DatasetReader(folder, sources='frontleft_fisheye_image')
+    count = 0
+    seed = int(rng.integers(1 << 31))
+    for images, _ in reader.iter_batches(batch_size, shuffle=shuffle, seed=seed):
+        count += len(images)
+    reader.close()
+    return count
+
+
+def folder_bytes(folder):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(folder, '*')))
+
+
+def report(name, frames, num_bytes, elapsed):
+    print('{:<24} {:>10.1f} frames/s {:>10.1f} MB/s'.format(
+        name, frames / elapsed, num_bytes / elapsed / 1e6))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', default=2000, type=int)
+    parser.add_argument('--width', default=640, type=int)
+    parser.add_argument('--height', default=480, type=int)
+    parser.add_argument('--shard-size-mb', default=64, type=float)
+    parser.add_argument('--batch-size', default=32, type=int)
+    parser.add_argument('--dir', help='Where to put the temporary folders (default: system tmp). '
+                        'Use the disk you will train from.', default=None)
+    parser.add_argument('--seed', default=0, type=int)
+    options = parser.parse_args(argv)
+
+    rng = np.random.default_rng(options.seed)
+    frames = synthetic_frames(options.frames, options.width, options.height, rng)
+    payload_bytes = sum(len(data) for data in frames)
+    print('{} frames, {:.1f} KiB average'.format(len(frames), payload_bytes / len(frames) / 1024))
+
+    root = tempfile.mkdtemp(dir=options.dir)
+    try:
+        jpeg_folder = os.path.join(root, 'jpeg')
+        shard_folder = os.path.join(root, 'shard')
+        os.makedirs(jpeg_folder)
+        os.makedirs(shard_folder)
+
+        start = time.perf_counter()
+        write_jpegs(jpeg_folder, frames)
+        report('write, jpeg files', len(frames), payload_bytes, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        write_shards(shard_folder, frames, int(options.shard_size_mb * 1024 * 1024))
+        report('write, shards', len(frames), payload_bytes, time.perf_counter() - start)
+
+        print('on disk: jpeg {} files {:.1f} MB, shards {} files {:.1f} MB'.format(
+            len(os.listdir(jpeg_folder)), folder_bytes(jpeg_folder) / 1e6,
+            len(os.listdir(shard_folder)), folder_bytes(shard_folder) / 1e6))
+
+        # Reads include decoding, since that is what training pays for.  The OS page cache is
+        # warm after writing; drop it first to measure cold reads.
+        for shuffle in (False, True):
+            order = 'shuffled' if shuffle else 'sequential'
+            start = time.perf_counter()
+            count = read_jpegs(jpeg_folder, shuffle, rng)
+            report('read, jpeg, ' + order, count, payload_bytes, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            count = read_shards(shard_folder, shuffle, rng, options.batch_size)
+            report('read, shards, ' + order, count, payload_bytes, time.perf_counter() - start)
+    finally:
+        shutil.rmtree(root)
+
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,95 @@
+"""End-to-end fetch cycles against fake_spot.FakeRobot, no robot or Core I/O needed.
+
+Runs fetch.main for a few cycles with tracing on and reports the cycle time, where it went and
+how many RPCs it took.  Latency, jitter and packet loss apply to every fake robot RPC; the
+NetworkComputeBridge has its own latency and loss, as it sits behind another hop.  Anything
+after -- goes to fetch.py as is:
+
+    python benchmark_fetch_cycle.py --cycles 5 --latency 0.02 --loss 0.01 -- --concurrent-search
+
+With --images and --detections the fakes replay recorded ImageResponses and
+NetworkComputeResponses (folders of *.pb files, or a log from fetch.py --record) instead of the
+made-up scene.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from bosdyn.api import image_pb2, network_compute_bridge_pb2
+
+import fetch
+import tracing
+from fake_spot import (FakeRobot, ReplayNetworkComputeBridgeServicer,
+                       SceneNetworkComputeBridgeServicer, load_messages)
+from sim_robot import Link
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cycles', default=5, type=int)
+    parser.add_argument('--latency', help='Robot RPC latency (s)', default=0.01, type=float)
+    parser.add_argument('--jitter', help='Robot RPC jitter (s)', default=0.0, type=float)
+    parser.add_argument('--loss', help='Fraction of robot RPCs lost', default=0.0, type=float)
+    parser.add_argument('--ncb-latency', help='NCB latency per request (s)', default=0.08,
+                        type=float)
+    parser.add_argument('--ncb-loss', help='Fraction of NCB requests lost', default=0.0,
+                        type=float)
+    parser.add_argument('--toy', help='Dogtoy position in vision (m)', nargs=2, type=float,
+                        default=(3.0, 0.0), metavar=('X', 'Y'))
+    parser.add_argument('--person', help='Person position in vision (m)', nargs=2, type=float,
+                        default=(0.0, 4.0), metavar=('X', 'Y'))
+    parser.add_argument('--images', help='Recorded ImageResponses: .pb folder or log')
+    parser.add_argument('--detections', help='Recorded NetworkComputeResponses: .pb folder or log')
+    parser.add_argument('fetch_args', nargs=argparse.REMAINDER,
+                        help='Extra fetch.py arguments, after --')
+    options = parser.parse_args(argv)
+
+    link = Link(latency=options.latency, jitter=options.jitter, loss=options.loss)
+    if options.detections:
+        ncb_servicer = ReplayNetworkComputeBridgeServicer(
+            load_messages(options.detections, network_compute_bridge_pb2.NetworkComputeResponse),
+            latency=options.ncb_latency)
+    else:
+        ncb_servicer = SceneNetworkComputeBridgeServicer(
+            objects={'dogtoy': tuple(options.toy) + (0.0,),
+                     'person': tuple(options.person) + (0.0,)},
+            models={'dogtoy-model': ['dogtoy'], 'person-model': ['person']},
+            latency=options.ncb_latency, loss=options.ncb_loss)
+    images = load_messages(options.images, image_pb2.ImageResponse) if options.images else ()
+    robot = FakeRobot(link=link, ncb_servicer=ncb_servicer, images=images)
+
+    fetch_args = [arg for arg in options.fetch_args if arg != '--']
+    tracer = tracing.enable()
+    try:
+        fetch.main(['--headless', '--cycles', str(options.cycles), '-s', 'fake-ncb', '-m',
+                    'dogtoy-model', '-p', 'person-model'] + fetch_args + ['fake-spot'],
+                   robot=robot)
+    finally:
+        robot.shutdown()
+
+    cycles = np.array([event['dur'] / 1e6 for event in tracer.events if event['name'] == 'cycle'])
+    if len(cycles) == 0:
+        print('No fetch cycle finished.')
+        return False
+
+    print()
+    print('cycles: {}  mean {:.2f} s  p50 {:.2f} s  p95 {:.2f} s'.format(
+        len(cycles), np.mean(cycles), np.percentile(cycles, 50), np.percentile(cycles, 95)))
+    print()
+    print(tracing.summary())
+    print()
+    body = robot.body
+    print('per cycle: {:.1f} commands, {:.1f} feedback requests, {:.1f} state requests, '
+          '{:.1f} NCB requests'.format(body.num_commands / len(cycles),
+                                       body.num_feedback_requests / len(cycles),
+                                       body.num_state_requests / len(cycles),
+                                       ncb_servicer.num_requests / len(cycles)))
+    print('robot RPCs: {} ({} lost)'.format(link.num_calls, link.num_lost))
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
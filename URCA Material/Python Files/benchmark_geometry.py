@@ -0,0 +1,135 @@
+"""Check geometry.py against the scalar helpers in fetch.py, then time both on many candidates.
+
+The checks draw random targets, robot poses and polygons and fail loudly if the vectorized
+results disagree with compute_stand_location_and_yaw, pose_dist or find_center_px.
+
+    python benchmark_geometry.py --candidates 1000 --trials 200
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bosdyn.api import geometry_pb2, robot_state_pb2
+from bosdyn.client import frame_helpers, math_helpers
+
+import fetch
+import geometry
+
+
+class StaticRobotState:
+    """Stands in for a RobotStateClient with the body at a fixed pose in vision."""
+
+    def __init__(self, x, y, z, yaw):
+        self.position = np.array([x, y, z])
+        self.state = robot_state_pb2.RobotState()
+        edges = self.state.kinematic_state.transforms_snapshot.child_to_parent_edge_map
+        edges[frame_helpers.VISION_FRAME_NAME].parent_frame_name = ''
+        edge = edges[frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME]
+        edge.parent_frame_name = frame_helpers.VISION_FRAME_NAME
+        body_pose = math_helpers.SE3Pose(x, y, z, math_helpers.Quat.from_yaw(yaw))
+        edge.parent_tform_child.CopyFrom(body_pose.to_proto())
+
+    def get_robot_state(self):
+        return self.state
+
+
+def random_polygon(rng):
+    polygon = geometry_pb2.Polygon()
+    for x, y in rng.uniform(0, 640, (4, 2)):
+        vertex = polygon.vertexes.add()
+        vertex.x = x
+        vertex.y = y
+    return polygon
+
+
+def angle_error(a, b):
+    return np.abs(np.arctan2(np.sin(a - b), np.cos(a - b)))
+
+
+def check(rng, trials):
+    worst_tilted_yaw = 0.0
+    for _ in range(trials):
+        robot = StaticRobotState(*rng.uniform(-10, 10, 3), yaw=rng.uniform(-np.pi, np.pi))
+        margin = rng.uniform(0.5, 3.0)
+
+        # Targets level with the body: positions and yaws must both match.
+        # Tilted targets: positions must match; yaw can differ (see geometry.py).
+        for z_offset in (0.0, rng.uniform(-1.0, 1.0)):
+            xyz = robot.position + np.append(rng.uniform(-5, 5, 2), z_offset)
+            target = math_helpers.SE3Pose(xyz[0], xyz[1], xyz[2], math_helpers.Quat())
+
+            position, yaw = fetch.compute_stand_location_and_yaw(target, robot, margin)
+            positions, yaws = fetch.compute_stand_locations_and_yaws(target, robot, [margin])
+            assert np.allclose(positions[0], position, atol=1e-9), (positions[0], position)
+            if z_offset == 0.0:
+                assert angle_error(yaws[0], yaw) < 1e-9, (yaws[0], yaw)
+            else:
+                worst_tilted_yaw = max(worst_tilted_yaw, angle_error(yaws[0], yaw))
+
+        poses = [math_helpers.SE3Pose(*rng.uniform(-5, 5, 3), rot=math_helpers.Quat())
+                 for _ in range(2)]
+        distance = geometry.pairwise_distances(geometry.positions_of(poses[:1]),
+                                               geometry.positions_of(poses[1:]))[0, 0]
+        assert abs(distance - fetch.pose_dist(poses[0], poses[1])) < 1e-9
+
+        polygon = random_polygon(rng)
+        center = geometry.polygon_centers(geometry.polygon_vertices([polygon]))[0]
+        assert np.allclose(center, fetch.find_center_px(polygon), atol=1e-4)
+
+    print('All {} checks passed (largest yaw difference for tilted targets: {:.4f} rad)'.format(
+        trials, worst_tilted_yaw))
+
+
+def bench(rng, candidates, repeat):
+    robot = StaticRobotState(1.0, 2.0, 0.0, yaw=0.3)
+    targets = [
+        math_helpers.SE3Pose(x, y, z, math_helpers.Quat())
+        for x, y, z in rng.uniform(-5, 5, (candidates, 3))
+    ]
+    polygons = [random_polygon(rng) for _ in range(candidates)]
+
+    def scalar():
+        for target, polygon in zip(targets, polygons):
+            fetch.compute_stand_location_and_yaw(target, robot, 1.0)
+            fetch.find_center_px(polygon)
+        for target in targets:
+            fetch.pose_dist(target, targets[0])
+
+    def vectorized():
+        # Converting from protos is part of the real cost, so it is timed too.
+        positions = geometry.positions_of(targets)
+        geometry.stand_poses(positions, robot.position, 1.0)
+        geometry.polygon_centers(geometry.polygon_vertices(polygons))
+        geometry.pairwise_distances(positions, positions[:1])
+
+    results = []
+    for name, fn in (('scalar', scalar), ('vectorized', vectorized)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0 / repeat
+        results.append(elapsed_ms)
+        print('{:<12} {:>10.2f} ms per {} candidates'.format(name, elapsed_ms, candidates))
+    print('speedup: {:.1f}x'.format(results[0] / results[1]))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidates', default=1000, type=int)
+    parser.add_argument('--repeat', help='Timed passes', default=10, type=int)
+    parser.add_argument('--trials', help='Random property checks', default=200, type=int)
+    parser.add_argument('--seed', default=0, type=int)
+    options = parser.parse_args(argv)
+
+    rng = np.random.default_rng(options.seed)
+    check(rng, options.trials)
+    bench(rng, options.candidates, options.repeat)
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
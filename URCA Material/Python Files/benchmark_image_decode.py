@@ -0,0 +1,190 @@
+"""Per-frame cost of turning an ImageResponse into something we can show or save.
+
+Compares the old copying decode (np.fromstring + imdecode + GRAY2BGR + overlay) with the
+image_utils path, with and without a viewer.  Reports microseconds and bytes allocated per
+frame.
+
+Payloads are serialized image_pb2.ImageResponse messages, one per file, e.g. written with
+open(path, 'wb').write(image_response.SerializeToString()), or a response log written by
+fetch.py --record.  Without --payloads, JPEG and RAW frames are generated.
+
+    python benchmark_image_decode.py --payloads recorded_responses/ --repeat 200
+    python benchmark_image_decode.py --payloads run.log
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from bosdyn.api import image_pb2, network_compute_bridge_pb2
+
+import fetch
+import frame_filter
+import image_utils
+import ncb_stub
+import response_log
+
+
+def load_payloads(folder):
+    if os.path.isfile(folder):
+        return list(response_log.read_images(folder))
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(folder, '*.pb'))):
+        response = image_pb2.ImageResponse()
+        with open(path, 'rb') as payload_file:
+            response.ParseFromString(payload_file.read())
+        payloads.append(response)
+    return payloads
+
+
+def generate_payloads(rows=480, cols=640):
+    # Smooth gradients plus noise compress roughly like a fisheye frame.
+    gradient = np.add.outer(np.arange(rows), np.arange(cols)) % 256
+    noise = np.random.randint(0, 32, (rows, cols))
+    pixels = (gradient + noise).clip(0, 255).astype(np.uint8)
+
+    jpeg = image_pb2.ImageResponse()
+    jpeg.source.name = 'frontleft_fisheye_image'
+    jpeg.shot.image.format = image_pb2.Image.FORMAT_JPEG
+    jpeg.shot.image.rows = rows
+    jpeg.shot.image.cols = cols
+    jpeg.shot.image.data = cv2.imencode('.jpg', pixels)[1].tobytes()
+
+    raw = image_pb2.ImageResponse()
+    raw.source.name = 'right_fisheye_image'
+    raw.shot.image.format = image_pb2.Image.FORMAT_RAW
+    raw.shot.image.pixel_format = image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8
+    raw.shot.image.rows = rows
+    raw.shot.image.cols = cols
+    raw.shot.image.data = pixels.tobytes()
+    return [jpeg, raw]
+
+
+def as_ncb_response(image_response):
+    # What get_obj_and_img gets back: the frame plus a detection to draw.
+    response = network_compute_bridge_pb2.NetworkComputeResponse()
+    response.image_response.CopyFrom(image_response)
+    ncb_stub.add_stub_object(response, 'dogtoy', 0.9, (2.0, 0.0, 0.0))
+    return response
+
+
+def legacy_preview(response):
+    # get_bounding_box_image as it was: np.fromstring copies the bytes before decoding.
+    image = response.image_response.shot.image
+    img = np.frombuffer(image.data, dtype=np.uint8).copy()
+    if image.format == image_pb2.Image.FORMAT_RAW:
+        img = img.reshape(image.rows, image.cols)
+    else:
+        img = cv2.imdecode(img, -1)
+    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return image_utils.draw_detections(img, response.object_in_image)
+
+
+def pooled_preview(pool):
+    return lambda response: fetch.get_bounding_box_image(response, pool)
+
+
+def headless(response):
+    # With no viewer, get_obj_and_img never touches the pixels.
+    return None
+
+
+def legacy_capture(response):
+    image_response = response.image_response
+    img = np.frombuffer(image_response.shot.image.data, dtype=np.uint8).copy()
+    img = cv2.imdecode(img, -1)
+    rotate_code = image_utils.rotation_for_source(image_response.source.name)
+    if rotate_code is not None:
+        img = cv2.rotate(img, rotate_code)
+    return img
+
+
+def pooled_capture(pool):
+
+    def capture(response):
+        image_response = response.image_response
+        img = image_utils.decode_image(image_response.shot.image)
+        rotate_code = image_utils.rotation_for_source(image_response.source.name)
+        return image_utils.rotate(img, rotate_code, pool)
+
+    return capture
+
+
+def dhash(response):
+    # The near-duplicate filter's extra cost on top of the capture decode.
+    return frame_filter.dhash(image_utils.decode_image(response.image_response.shot.image))
+
+
+def measure(fn, responses, repeat):
+    # Warm up any pools and caches.
+    for response in responses:
+        fn(response)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            fn(response)
+    us_per_frame = (time.perf_counter() - start) * 1e6 / (repeat * len(responses))
+
+    allocated = 0
+    tracemalloc.start()
+    for response in responses:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn(response)
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return us_per_frame, allocated / len(responses)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--payloads',
+                        help='Folder of serialized ImageResponse .pb files, or a response log')
+    parser.add_argument('--repeat', help='Passes over the payloads', default=200, type=int)
+    options = parser.parse_args(argv)
+
+    if options.payloads:
+        image_responses = load_payloads(options.payloads)
+        if not image_responses:
+            print('Error: no payloads found in ' + options.payloads)
+            return False
+    else:
+        image_responses = generate_payloads()
+    responses = [as_ncb_response(image_response) for image_response in image_responses]
+
+    # capture_images.py only ever sees compressed frames.
+    compressed = [
+        response for response in responses
+        if response.image_response.shot.image.format != image_pb2.Image.FORMAT_RAW
+    ]
+
+    cases = [
+        ('preview, legacy', legacy_preview, responses),
+        ('preview, image_utils', pooled_preview(image_utils.BufferPool()), responses),
+        ('preview, headless', headless, responses),
+        ('capture, legacy', legacy_capture, compressed),
+        ('capture, image_utils', pooled_capture(image_utils.BufferPool(depth=1)), compressed),
+        ('capture, decode + dhash', dhash, compressed),
+    ]
+
+    print('{} frames x {} passes'.format(len(responses), options.repeat))
+    print('{:<24} {:>12} {:>16}'.format('path', 'us/frame', 'KiB alloc/frame'))
+    for name, fn, frames in cases:
+        if not frames:
+            continue
+        us_per_frame, allocated = measure(fn, frames, options.repeat)
+        print('{:<24} {:>12.1f} {:>16.1f}'.format(name, us_per_frame, allocated / 1024.0))
+
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -5,34 +5,222 @@
 # Development Kit License (20191101-BDSDK-SL).
 
 import argparse
+import json
+import math
 import os
 import sys
 import time
 
 import cv2
-import numpy as np
 
 import bosdyn.client
 import bosdyn.client.util
+from bosdyn.client import frame_helpers
 from bosdyn.client.image import ImageClient
+from bosdyn.client.robot_state import RobotStateClient
 
+import image_utils
+from capture_pipeline import CapturePipeline, Frame, next_free_index
+from capture_scheduler import MotionScheduler, TimeScheduler
+from dataset_shards import ShardWriter
+from frame_filter import DuplicateFilter
+from robot_state_cache import RobotStateStreamer
 
-def main(argv):
+
+def frame_metadata(image_response):
+    """Source, acquisition time and, when the snapshot has it, the body pose in vision."""
+    shot = image_response.shot
+    metadata = {
+        'source': image_response.source.name,
+        'acquisition_time': shot.acquisition_time.seconds + shot.acquisition_time.nanos * 1e-9,
+    }
+    try:
+        vision_tform_body = frame_helpers.get_a_tform_b(shot.transforms_snapshot,
+                                                        frame_helpers.VISION_FRAME_NAME,
+                                                        frame_helpers.BODY_FRAME_NAME)
+    except frame_helpers.ValidateFrameTreeError:
+        vision_tform_body = None
+    if vision_tform_body is not None:
+        metadata['vision_tform_body'] = [
+            vision_tform_body.x, vision_tform_body.y, vision_tform_body.z,
+            vision_tform_body.rot.w, vision_tform_body.rot.x, vision_tform_body.rot.y,
+            vision_tform_body.rot.z
+        ]
+    return metadata
+
+
+class FrameNamer:
+    """Hands out <source>_NNNN.jpg paths, numbered per camera.
+
+    With more than one source, each camera's frames go in their own <folder>/<source>/
+    subfolder.
+    """
+
+    def __init__(self, folder, sources):
+        self.folders = {}
+        self.counters = {}
+        for source in sources:
+            source_folder = folder
+            if len(sources) > 1:
+                source_folder = os.path.join(folder, source)
+                if not os.path.exists(source_folder):
+                    os.makedirs(source_folder)
+            self.folders[source] = source_folder
+            # Pick up numbering after any images already in the folder.
+            self.counters[source] = next_free_index(source_folder, source)
+
+    def next_path(self, source):
+        path = os.path.join(self.folders[source],
+                            source + '_{:0>4d}'.format(self.counters[source]) + '.jpg')
+        self.counters[source] += 1
+        return path
+
+
+class JpegSink:
+    """Writes every frame as its own <source>_NNNN.jpg.
+
+    Frame metadata goes to a metadata.jsonl next to the images, one line per file.
+    """
+
+    encodes = False
+
+    def __init__(self, folder, sources):
+        self.namer = FrameNamer(folder, sources)
+        self.metadata_files = {
+            source: open(os.path.join(self.namer.folders[source], 'metadata.jsonl'), 'a')
+            for source in set(sources)
+        }
+
+    def write(self, frame):
+        path = self.namer.next_path(frame.source)
+        cv2.imwrite(path, frame.img)
+        if frame.metadata is not None:
+            line = dict(frame.metadata, file=os.path.basename(path))
+            self.metadata_files[frame.source].write(json.dumps(line) + '\n')
+        return path
+
+    def close(self):
+        for metadata_file in self.metadata_files.values():
+            metadata_file.close()
+
+
+class ShardSink:
+    """Appends frames, with their metadata, to one set of record shards per camera."""
+
+    encodes = True
+
+    def __init__(self, folder, sources, max_shard_bytes):
+        self.writers = {
+            source: ShardWriter(folder, prefix=source, max_shard_bytes=max_shard_bytes)
+            for source in sources
+        }
+
+    def write(self, frame):
+        writer = self.writers[frame.source]
+        writer.write(frame.data, frame.metadata)
+        return '{} record {}'.format(frame.source, writer.num_records - 1)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def create_sink(options):
+    if options.format == 'shard':
+        return ShardSink(options.folder, options.image_source,
+                         int(options.shard_size_mb * 1024 * 1024))
+    return JpegSink(options.folder, options.image_source)
+
+
+def create_scheduler(robot, options):
+    if options.trigger == 'time':
+        return TimeScheduler(options.period)
+
+    # Captures come at most max_rate times a second, so checking the pose more often than that
+    # only costs state RPCs.  The cache stays fresh for two periods, so the scheduler's polls
+    # never block on an RPC of their own.
+    period = 1.0 / options.max_rate
+    robot_state_client = robot.ensure_client(RobotStateClient.default_service_name)
+    state_streamer = RobotStateStreamer(robot_state_client, period=period,
+                                        max_age=2.0 * period).start()
+    return MotionScheduler(state_streamer, min_distance=options.min_distance,
+                           min_angle=math.radians(options.min_angle), min_interval=period,
+                           max_interval=options.max_interval, poll_period=period)
+
+
+def prepare_frame(frame, sink, pool=None, duplicates=None):
+    """Decode, rotate and encode a frame for sink.  Returns False if it is a near-duplicate."""
+    frame.img = image_utils.decode_image(frame.image_response.shot.image)
+
+    # Hash before rotating; the rotation is the same for every frame of a camera.
+    if duplicates is not None and not duplicates.accept(frame.source, frame.img):
+        return False
+
+    # Approximately rotate the image to level.
+    rotate_code = image_utils.rotation_for_source(frame.source)
+    frame.img = image_utils.rotate(frame.img, rotate_code, pool)
+    metadata = frame_metadata(frame.image_response)
+    metadata.update(frame.metadata or {})
+    frame.metadata = metadata
+    if sink.encodes:
+        frame.data = cv2.imencode('.jpg', frame.img)[1]
+    return True
+
+
+def main(argv, robot=None):
     parser = argparse.ArgumentParser()
     bosdyn.client.util.add_base_arguments(parser)
-    parser.add_argument('--image-source', help='Get image from source(s)',
-                        default='frontleft_fisheye_image')
+    parser.add_argument('--image-source', help='Get image from source(s)', nargs='+',
+                        default=['frontleft_fisheye_image'])
     parser.add_argument('--folder', help='Path to write images to', default='')
+    parser.add_argument('--period', help='Seconds between captures', default=0.7, type=float)
+    parser.add_argument('--trigger', choices=['time', 'motion'], default='time',
+                        help='Capture every --period seconds, or whenever the body has moved '
+                        '--min-distance or turned --min-angle since the last capture.')
+    parser.add_argument('--min-distance', help='Meters moved to trigger with --trigger motion',
+                        default=0.3, type=float)
+    parser.add_argument('--min-angle', help='Degrees turned to trigger with --trigger motion',
+                        default=15.0, type=float)
+    parser.add_argument('--max-rate', default=5.0, type=float,
+                        help='Captures per second at most with --trigger motion, which also '
+                        'checks the body pose this often')
+    parser.add_argument('--max-interval', default=None, type=float,
+                        help='With --trigger motion, also capture after this many seconds '
+                        'standing still.  Off by default.')
+    parser.add_argument('--format', choices=['jpeg', 'shard'], default='jpeg',
+                        help='One JPEG per frame, or frames appended to record shards with '
+                        'their metadata (see dataset_shards.py).')
+    parser.add_argument('--shard-size-mb', help='Start a new shard past this size',
+                        default=256, type=float)
+    parser.add_argument('--dedup-threshold', default=None, type=int,
+                        help='Skip frames whose 64-bit difference hash is within this many bits '
+                        'of a recent frame from the same camera (e.g. 6).  Off by default.')
+    parser.add_argument('--dedup-history', help='Recent frames per camera to compare against',
+                        default=8, type=int)
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Decode and write frames on background threads so fetching never '
+                        'waits on the disk.')
+    parser.add_argument('--workers', default=2, type=int,
+                        help='Decode threads with --pipeline.  Each camera sticks to one, so '
+                        'more workers than cameras don\'t help.')
+    parser.add_argument('--queue-size', help='Frames buffered per stage with --pipeline',
+                        default=8, type=int)
+    parser.add_argument('--captures', default=0, type=int,
+                        help='Stop after this many captures (0 runs until interrupted).')
     options = parser.parse_args(argv)
+    if options.max_rate <= 0:
+        parser.error('--max-rate must be greater than 0')
 
-    # Create robot object with an image client.
-    sdk = bosdyn.client.create_standard_sdk('image_capture')
-    robot = sdk.create_robot(options.hostname)
+    # Create robot object with an image client, unless the caller brought one (e.g. a
+    # fake_spot.FakeRobot).
+    if robot is None:
+        sdk = bosdyn.client.create_standard_sdk('image_capture')
+        robot = sdk.create_robot(options.hostname)
 
-    # Takeout before posting code
-    robot.authenticate('admin', 'vrs6i5jqhtun')
+        # Takeout before posting code
+        robot.authenticate('admin', 'vrs6i5jqhtun')
 
-    bosdyn.client.util.authenticate(robot)
+        bosdyn.client.util.authenticate(robot)
     robot.sync_with_directory()
     robot.time_sync.wait_for_sync()
 
@@ -43,46 +231,83 @@ def main(argv):
         print('Error: output folder does not exist: ' + options.folder)
         return
 
-    counter = 0
+    sink = create_sink(options)
+    duplicates = None
+    if options.dedup_threshold is not None:
+        duplicates = DuplicateFilter(options.dedup_threshold, options.dedup_history)
+    # Last, right before the loops that close it: a motion scheduler starts a streamer thread.
+    scheduler = create_scheduler(robot, options)
 
-    while True:
-        # We want to capture from one camera at a time.
+    if options.pipeline:
+        return capture_pipelined(image_client, scheduler, sink, duplicates, options)
 
-        # Capture and save images to disk
-        image_responses = image_client.get_image_from_sources([options.image_source])
+    # Each rotated frame is written out before the next one is decoded, so one buffer per
+    # shape can be reused.
+    pool = image_utils.BufferPool(depth=1)
 
-        dtype = np.uint8
+    try:
+        num_captures = 0
+        while options.captures == 0 or num_captures < options.captures:
+            num_captures += 1
+            # Wait until it's time (or the robot has moved enough) for the next capture.
+            trigger = scheduler.wait()
 
-        img = np.frombuffer(image_responses[0].shot.image.data, dtype=dtype)
-        img = cv2.imdecode(img, -1)
+            # Capture every camera in one request so the frames line up in time, then save
+            # them to disk.
+            image_responses = image_client.get_image_from_sources(options.image_source)
 
-        # Approximately rotate the image to level.
-        if image_responses[0].source.name[0:5] == "front":
-            img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+            for image_response in image_responses:
+                frame = Frame(image_response, dict(trigger))
+                if prepare_frame(frame, sink, pool, duplicates):
+                    print('Wrote: ' + sink.write(frame))
+                else:
+                    print('Skipped near-duplicate ' + frame.source + ' frame (' +
+                          duplicates.stats() + ')')
+    finally:
+        scheduler.close()
+        sink.close()
 
-        elif image_responses[0].source.name[0:5] == "right":
-            img = cv2.rotate(img, cv2.ROTATE_180)
+    return True
 
-        # Don't overwrite an existing image
-        while True:
-            image_saved_path = os.path.join(
-                options.folder,
-                image_responses[0].source.name + '_{:0>4d}'.format(counter) + '.jpg')
-            counter += 1
 
-            if not os.path.exists(image_saved_path):
-                break
+def capture_pipelined(image_client, scheduler, sink, duplicates, options):
+    # Fetch here, decode and rotate on the worker pool, write on the writer thread.  Frames stay
+    # alive across stages, so they don't share pooled buffers.
+    pipeline = CapturePipeline(lambda frame: prepare_frame(frame, sink, duplicates=duplicates),
+                               sink.write,
+                               workers=options.workers, queue_size=options.queue_size)
+    last_report = time.time()
 
-        cv2.imwrite(image_saved_path, img)
+    try:
+        num_captures = 0
+        while options.captures == 0 or num_captures < options.captures:
+            num_captures += 1
+            # The schedulers count from the previous capture, so the rate stays steady no matter
+            # how long the fetch took.
+            trigger = scheduler.wait()
+            image_responses = image_client.get_image_from_sources(options.image_source)
 
-        print('Wrote: ' + image_saved_path)
+            for image_response in image_responses:
+                pipeline.submit(Frame(image_response, dict(trigger)))
 
-        # Wait for some time so we can drive the robot to a new position.
-        time.sleep(0.7)
+            if time.time() - last_report > 5.0:
+                print(pipeline.stats() + ', ' + scheduler.stats())
+                if duplicates is not None:
+                    print(duplicates.stats())
+                last_report = time.time()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+        pipeline.close()
+        sink.close()
+        print('Final: ' + pipeline.stats() + ', ' + scheduler.stats())
+        if duplicates is not None:
+            print('Duplicates: ' + duplicates.stats())
 
     return True
 
 
 if __name__ == "__main__":
     if not main(sys.argv[1:]):
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
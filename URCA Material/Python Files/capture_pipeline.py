@@ -0,0 +1,128 @@
+"""Staged capture pipeline for capture_images.py.
+
+The caller fetches frames and submits them.  A pool of workers processes them (decode, rotate)
+and a single writer thread saves them.  Bounded queues sit between the stages; when the
+workers fall behind, submit() drops the new frame instead of stalling the fetch loop.  Every
+camera's frames go to the same worker, so each camera is processed and written in capture order.
+"""
+
+import os
+import queue
+import re
+import threading
+import time
+
+
+class Frame:
+    """One captured image on its way through the pipeline.
+
+    The stages fill in the decoded image, the encoded bytes and metadata as they need them.
+    """
+
+    def __init__(self, image_response, metadata=None):
+        self.image_response = image_response
+        self.source = image_response.source.name
+        self.img = None
+        self.data = None
+        self.metadata = metadata
+        self.stamp = time.time()
+
+
+def next_free_index(folder, prefix, extension='.jpg'):
+    """First index after every existing <prefix>_NNNN<extension> in folder, from one scan."""
+    pattern = re.compile(re.escape(prefix) + r'_(\d+)' + re.escape(extension) + '$')
+    highest = -1
+    for name in os.listdir(folder):
+        match = pattern.match(name)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest + 1
+
+
+class CapturePipeline:
+    """process(frame) runs on the worker pool and returns False to skip the frame;
+    write(frame) runs on the writer thread.
+
+    Cameras are assigned to workers round-robin as they first show up, so process() sees the
+    frames of one camera one at a time and in order.
+    """
+
+    def __init__(self, process, write, workers=2, queue_size=8):
+        self.process = process
+        self.write = write
+        self.num_submitted = 0
+        self.num_dropped = 0
+        self.num_skipped = 0
+        self.num_written = 0
+        self.start_time = time.time()
+
+        self._process_queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._worker_of_source = {}
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._process_loop, args=(process_queue,),
+                             name='capture worker {}'.format(i))
+            for i, process_queue in enumerate(self._process_queues)
+        ]
+        self._writer = threading.Thread(target=self._write_loop, name='capture writer')
+        for thread in self._workers + [self._writer]:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, frame):
+        """Queue a frame for processing.  Returns False if it was dropped."""
+        self.num_submitted += 1
+        worker = self._worker_of_source.setdefault(
+            frame.source, len(self._worker_of_source) % len(self._process_queues))
+        try:
+            self._process_queues[worker].put_nowait(frame)
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """Finish everything already queued, then stop the threads."""
+        for process_queue in self._process_queues:
+            process_queue.put(None)
+        for thread in self._workers:
+            thread.join()
+        self._write_queue.put(None)
+        self._writer.join()
+
+    def fps(self):
+        """Frames written per second since the pipeline started."""
+        return self.num_written / max(time.time() - self.start_time, 1e-6)
+
+    def stats(self):
+        return 'fps {:.2f}, submitted {}, dropped {}, skipped {}, written {}'.format(
+            self.fps(), self.num_submitted, self.num_dropped, self.num_skipped, self.num_written)
+
+    def _process_loop(self, process_queue):
+        while True:
+            frame = process_queue.get()
+            if frame is None:
+                return
+            try:
+                keep = self.process(frame) is not False
+            except Exception as err:
+                print('Failed to process a ' + frame.source + ' frame: ' + str(err))
+                keep = False
+            if not keep:
+                with self._lock:
+                    self.num_skipped += 1
+                continue
+            self._write_queue.put(frame)
+
+    def _write_loop(self):
+        while True:
+            frame = self._write_queue.get()
+            if frame is None:
+                return
+            try:
+                self.write(frame)
+            except Exception as err:
+                print('Failed to write a ' + frame.source + ' frame: ' + str(err))
+                continue
+            self.num_written += 1
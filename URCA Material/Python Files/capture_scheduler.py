@@ -0,0 +1,113 @@
+"""When capture_images.py should grab the next set of frames.
+
+TimeScheduler keeps the old fixed period.  MotionScheduler watches the body pose through a
+RobotStateStreamer and only fires once the robot has moved or turned far enough since the last
+capture, so a standing robot stores nothing and a walking one isn't held to a slow clock.
+
+Both have a wait() that blocks until the next capture and returns metadata about why it fired,
+to be stored with the frames, and a close() to call once capturing is over.
+"""
+
+import math
+import time
+
+from bosdyn.client import frame_helpers
+
+
+def rotation_angle(a, b):
+    """Angle (rad) of the rotation between two Quats."""
+    dot = abs(a.w * b.w + a.x * b.x + a.y * b.y + a.z * b.z)
+    return 2.0 * math.acos(min(1.0, dot))
+
+
+class TimeScheduler:
+    """Fires every period seconds, counting from the start of the previous capture."""
+
+    def __init__(self, period):
+        self.period = period
+        self.num_triggers = 0
+        self._last_time = None
+
+    def wait(self):
+        if self._last_time is not None:
+            time.sleep(max(0.0, self._last_time + self.period - time.time()))
+        self._last_time = time.time()
+        self.num_triggers += 1
+        return {'trigger': 'time'}
+
+    def stats(self):
+        return 'captures {}'.format(self.num_triggers)
+
+    def close(self):
+        pass
+
+
+class MotionScheduler:
+    """Fires when the body has moved min_distance (m) or turned min_angle (rad) since the last
+    capture, at most once every min_interval seconds.
+
+    With max_interval set it also fires after that many seconds without moving.  The body pose
+    comes from state_streamer's cache, so polling it costs no extra RPCs; the streamer's own
+    period sets how many it makes.  close() stops the streamer.
+    """
+
+    def __init__(self, state_streamer, min_distance=0.3, min_angle=math.radians(15),
+                 min_interval=0.2, max_interval=None, poll_period=0.05):
+        self.state_streamer = state_streamer
+        self.min_distance = min_distance
+        self.min_angle = min_angle
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.poll_period = poll_period
+        self.num_polls = 0
+        self.num_triggers = 0
+
+        self._last_pose = None
+        self._last_time = None
+
+    def _body_pose(self):
+        snapshot = self.state_streamer.get_transforms_snapshot()
+        return frame_helpers.get_vision_tform_body(snapshot)
+
+    def _trigger(self, pose, now):
+        """(reason or None, distance, angle) for the pose relative to the last capture."""
+        if self._last_pose is None:
+            return 'first', 0.0, 0.0
+
+        last = self._last_pose
+        distance = math.sqrt((pose.x - last.x)**2 + (pose.y - last.y)**2 + (pose.z - last.z)**2)
+        angle = rotation_angle(pose.rot, last.rot)
+        if distance >= self.min_distance:
+            return 'distance', distance, angle
+        if angle >= self.min_angle:
+            return 'angle', distance, angle
+        if self.max_interval is not None and now - self._last_time >= self.max_interval:
+            return 'interval', distance, angle
+        return None, distance, angle
+
+    def wait(self):
+        # Rate cap first, so a fast-walking robot can't flood the disk.
+        if self._last_time is not None:
+            time.sleep(max(0.0, self._last_time + self.min_interval - time.time()))
+
+        while True:
+            self.num_polls += 1
+            pose = self._body_pose()
+            now = time.time()
+            reason, distance, angle = self._trigger(pose, now)
+            if reason is not None:
+                break
+            time.sleep(self.poll_period)
+
+        self._last_pose = pose
+        self._last_time = now
+        self.num_triggers += 1
+        return {'trigger': reason, 'moved_m': distance, 'turned_rad': angle}
+
+    def stats(self):
+        return 'captures {}, pose polls {}, state RPCs {} (one per {:.2f} s)'.format(
+            self.num_triggers, self.num_polls, self.state_streamer.num_rpcs,
+            self.state_streamer.period)
+
+    def close(self):
+        self.state_streamer.stop()
@@ -0,0 +1,196 @@
+"""Trajectory commands that report back as soon as the robot arrives.
+
+Instead of a fixed end time and block_for_trajectory_cmd(timeout_sec=5), each walk gets an end
+time scaled from its distance and velocity limits, and returns a TrajectoryHandle.  The handle
+polls trajectory feedback without blocking, so the caller can keep detecting while the robot
+walks:
+
+    walk = executor.walk_to(x, y, yaw)
+    while not walk.poll():
+        ...  # look for the object
+    if walk.arrived:
+        ...
+
+or simply walk.wait().  walk.update_goal() re-targets a walk in flight without a new handle.
+"""
+
+import math
+import time
+
+from bosdyn.api import basic_command_pb2, geometry_pb2
+from bosdyn.client import frame_helpers
+from bosdyn.client.robot_command import RobotCommandBuilder
+
+kTrajectoryFeedback = basic_command_pb2.SE2TrajectoryCommand.Feedback
+kStatusProcessing = basic_command_pb2.RobotCommandFeedbackStatus.STATUS_PROCESSING
+
+# Seconds past a command's end time to keep listening for its last feedback.
+kTimeoutGrace = 0.5
+
+
+def get_walking_params(max_linear_vel, max_rotation_vel):
+    max_vel_linear = geometry_pb2.Vec2(x=max_linear_vel, y=max_linear_vel)
+    max_vel_se2 = geometry_pb2.SE2Velocity(linear=max_vel_linear, angular=max_rotation_vel)
+    vel_limit = geometry_pb2.SE2VelocityLimit(max_vel=max_vel_se2)
+    params = RobotCommandBuilder.mobility_params()
+    params.vel_limit.CopyFrom(vel_limit)
+    return params
+
+
+def trajectory_duration(distance, angle, max_linear_vel, max_rotation_vel, slack=1.5,
+                        margin=2.0):
+    """Seconds to allow for a walk of distance (m) and turn of angle (rad) at the given limits.
+
+    Counts the walk and the turn as if done one after the other, then adds slack for
+    acceleration and margin for starting up.
+    """
+    return (distance / max_linear_vel + abs(angle) / max_rotation_vel) * slack + margin
+
+
+def angle_diff(a, b):
+    return math.atan2(math.sin(a - b), math.cos(a - b))
+
+
+class TrajectoryHandle:
+    """One trajectory command in flight.
+
+    poll() never blocks: it checks the answer to the last feedback request and sends the next
+    one at most every poll_period seconds.  Once finished, arrived says whether the robot
+    reported reaching the goal, and status says why it stopped ('arrived', 'failed',
+    'timeout').
+    """
+
+    def __init__(self, executor, command_future, end_time, require_settled, max_linear_vel,
+                 max_rotation_vel):
+        self.executor = executor
+        self.end_time = end_time
+        self.require_settled = require_settled
+        self.max_linear_vel = max_linear_vel
+        self.max_rotation_vel = max_rotation_vel
+        self.start_time = time.time()
+        self.finished = False
+        self.arrived = False
+        self.status = None
+        self.elapsed = None
+        self.num_polls = 0
+        self.num_goal_updates = 0
+
+        self._command_future = command_future
+        self._feedback_future = None
+        self._last_poll = 0.0
+
+    def _finish(self, status):
+        self.finished = True
+        self.arrived = status == 'arrived'
+        self.status = status
+        self.elapsed = time.time() - self.start_time
+
+    def _check(self, feedback):
+        mobility_feedback = feedback.feedback.synchronized_feedback.mobility_command_feedback
+        if mobility_feedback.status != kStatusProcessing:
+            self._finish('failed')
+            return
+
+        trajectory_feedback = mobility_feedback.se2_trajectory_feedback
+        if trajectory_feedback.status != kTrajectoryFeedback.STATUS_AT_GOAL:
+            return
+        if self.require_settled and (trajectory_feedback.body_movement_status !=
+                                     kTrajectoryFeedback.BODY_STATUS_SETTLED):
+            return
+        self._finish('arrived')
+
+    def poll(self):
+        """True once the command has finished, one way or another."""
+        if self.finished:
+            return True
+
+        if self._feedback_future is not None and self._feedback_future.done():
+            feedback_future = self._feedback_future
+            self._feedback_future = None
+            try:
+                self._check(feedback_future.result())
+            except Exception as err:
+                # A lost feedback request is retried on the next poll.
+                print('Trajectory feedback failed: ' + str(err))
+            if self.finished:
+                return True
+
+        now = time.time()
+        if now > self.end_time + kTimeoutGrace:
+            self._finish('timeout')
+            return True
+
+        if (self._feedback_future is None and self._command_future.done() and
+                now - self._last_poll >= self.executor.poll_period):
+            try:
+                cmd_id = self._command_future.result()
+            except Exception as err:
+                print('Trajectory command failed: ' + str(err))
+                self._finish('failed')
+                return True
+            self._feedback_future = self.executor.command_client.robot_command_feedback_async(
+                cmd_id)
+            self._last_poll = now
+            self.num_polls += 1
+        return False
+
+    def update_goal(self, x, y, yaw):
+        """Send a new goal for this walk.  Feedback for the old command is ignored from here on.
+
+        Does nothing once the walk has finished.
+        """
+        if self.finished:
+            return
+        self._command_future, self.end_time = self.executor.send_walk(
+            x, y, yaw, self.max_linear_vel, self.max_rotation_vel)
+        self._feedback_future = None
+        self._last_poll = 0.0
+        self.num_goal_updates += 1
+
+    def wait(self):
+        """Block until the command finishes.  Returns True if the robot arrived."""
+        while not self.poll():
+            time.sleep(self.executor.poll_period / 4.0)
+        return self.arrived
+
+
+class TrajectoryExecutor:
+    """Sends SE2 trajectory commands in the vision frame and hands back TrajectoryHandles.
+
+    robot_state_client (a RobotStateClient or RobotStateStreamer) gives the start pose used to
+    scale each command's end time.
+    """
+
+    def __init__(self, command_client, robot_state_client, poll_period=0.05,
+                 require_settled=False):
+        self.command_client = command_client
+        self.robot_state_client = robot_state_client
+        self.poll_period = poll_period
+        self.require_settled = require_settled
+
+    def _body_pose(self):
+        return frame_helpers.get_a_tform_b(
+            self.robot_state_client.get_robot_state().kinematic_state.transforms_snapshot,
+            frame_helpers.VISION_FRAME_NAME, frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME)
+
+    def walk_to(self, x, y, yaw, max_linear_vel=0.5, max_rotation_vel=0.5):
+        """Start walking to (x, y) facing yaw, all in the vision frame."""
+        command_future, end_time = self.send_walk(x, y, yaw, max_linear_vel, max_rotation_vel)
+        return TrajectoryHandle(self, command_future, end_time, self.require_settled,
+                                max_linear_vel, max_rotation_vel)
+
+    def send_walk(self, x, y, yaw, max_linear_vel, max_rotation_vel):
+        """Send the trajectory command.  Returns the command future and its end time."""
+        start = self._body_pose()
+        distance = math.hypot(x - start.x, y - start.y)
+        angle = angle_diff(yaw, start.rot.to_yaw())
+        duration = trajectory_duration(distance, angle, max_linear_vel, max_rotation_vel)
+
+        se2_pose = geometry_pb2.SE2Pose(position=geometry_pb2.Vec2(x=x, y=y), angle=yaw)
+        move_cmd = RobotCommandBuilder.synchro_se2_trajectory_command(
+            se2_pose, frame_name=frame_helpers.VISION_FRAME_NAME,
+            params=get_walking_params(max_linear_vel, max_rotation_vel))
+        end_time = time.time() + duration
+        command_future = self.command_client.robot_command_async(command=move_cmd,
+                                                                 end_time_secs=end_time)
+        return command_future, end_time
@@ -0,0 +1,212 @@
+"""Sharded record files for captured training images.
+
+Instead of one JPEG per frame, frames are appended to large shard files:
+
+    <folder>/<prefix>-00000.rec   b'BODEREC1', then records of
+                                  [uint32 metadata length][uint32 data length][metadata][data]
+    <folder>/<prefix>-00000.idx   little-endian uint64 offset of every record in the .rec
+
+A record reaches the .rec before its offset goes into the .idx, so a capture that is killed
+mid-session at worst leaves index entries for records that were cut short; readers skip those.
+The metadata is UTF-8 JSON (source, timestamp, robot pose, ...) and the data is the encoded
+image.  The index makes random access O(1), and readers mmap the shard so records are sliced
+out without copying.  capture_images.py writes one prefix per camera; a DatasetReader reads
+every camera in the folder as one dataset, or only some of them:
+
+    reader = DatasetReader('dataset/', sources=['frontleft_fisheye_image'])
+    for images, metadata in reader.iter_batches(32):
+        ...
+"""
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+
+import cv2
+import numpy as np
+
+kMagic = b'BODEREC1'
+kRecordHeader = struct.Struct('<II')
+kOffset = struct.Struct('<Q')
+kShardPattern = re.compile(r'^(.+)-(\d{5})\.rec$')
+
+
+def shard_paths(folder, prefix, index):
+    base = os.path.join(folder, '{}-{:05d}'.format(prefix, index))
+    return base + '.rec', base + '.idx'
+
+
+def find_shards(folder, sources=None):
+    """Paths of every <prefix>-NNNNN.rec in folder, by prefix and then shard number.
+
+    sources limits them to those prefixes (camera names, for capture_images.py output).
+    """
+    found = []
+    for name in os.listdir(folder):
+        match = kShardPattern.match(name)
+        if match is None or (sources is not None and match.group(1) not in sources):
+            continue
+        found.append((match.group(1), int(match.group(2)), os.path.join(folder, name)))
+    return [path for _, _, path in sorted(found)]
+
+
+class ShardWriter:
+    """Appends records to <prefix>-NNNNN.rec shards, starting a new one past max_shard_bytes.
+
+    Existing shards are never touched; numbering continues after the last one in the folder.
+    """
+
+    def __init__(self, folder, prefix='frames', max_shard_bytes=256 * 1024 * 1024):
+        self.folder = folder
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.num_records = 0
+
+        existing = glob.glob(os.path.join(folder, prefix + '-*.rec'))
+        self._shard_index = len(existing)
+        self._rec_file = None
+        self._idx_file = None
+
+    def _open_next_shard(self):
+        self.close()
+        rec_path, idx_path = shard_paths(self.folder, self.prefix, self._shard_index)
+        while os.path.exists(rec_path):
+            self._shard_index += 1
+            rec_path, idx_path = shard_paths(self.folder, self.prefix, self._shard_index)
+        self._shard_index += 1
+
+        self._rec_file = open(rec_path, 'wb')
+        self._idx_file = open(idx_path, 'wb')
+        self._rec_file.write(kMagic)
+        self._rec_file.flush()
+
+    def write(self, data, metadata):
+        """Append one record.  data is bytes-like, metadata a JSON-serializable dict."""
+        if self._rec_file is None or self._rec_file.tell() >= self.max_shard_bytes:
+            self._open_next_shard()
+
+        meta = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+        offset = self._rec_file.tell()
+        self._rec_file.write(kRecordHeader.pack(len(meta), len(data)))
+        self._rec_file.write(meta)
+        self._rec_file.write(data)
+        # The record goes to the OS first, so the index never gets ahead of the .rec.
+        self._rec_file.flush()
+        self._idx_file.write(kOffset.pack(offset))
+        self.num_records += 1
+
+    def close(self):
+        if self._rec_file is not None:
+            self._rec_file.close()
+            self._idx_file.close()
+            self._rec_file = None
+            self._idx_file = None
+
+
+class ShardReader:
+    """Random access to the records of one shard."""
+
+    def __init__(self, rec_path, idx_path=None):
+        if idx_path is None:
+            idx_path = os.path.splitext(rec_path)[0] + '.idx'
+        with open(idx_path, 'rb') as idx_file:
+            index = idx_file.read()
+        # A killed capture can leave half an offset at the end of the index.
+        offsets = np.frombuffer(index[:len(index) - len(index) % kOffset.size], dtype='<u8')
+
+        self._file = open(rec_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(kMagic)] != kMagic:
+            raise ValueError(rec_path + ' is not a record shard')
+        self._view = memoryview(self._map)
+
+        # Records are appended in order, so only the last few can be cut short.
+        num_records = len(offsets)
+        while num_records > 0 and not self._complete(int(offsets[num_records - 1])):
+            num_records -= 1
+        self.offsets = offsets[:num_records]
+
+    def _complete(self, offset):
+        """Whether the record at offset lies entirely within the .rec."""
+        if offset + kRecordHeader.size > len(self._map):
+            return False
+        meta_len, data_len = kRecordHeader.unpack_from(self._map, offset)
+        return offset + kRecordHeader.size + meta_len + data_len <= len(self._map)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        """(metadata dict, data memoryview) of record index.  The view is only valid while the
+        reader is open."""
+        offset = int(self.offsets[index])
+        meta_len, data_len = kRecordHeader.unpack_from(self._map, offset)
+        start = offset + kRecordHeader.size
+        metadata = json.loads(bytes(self._view[start:start + meta_len]).decode('utf-8'))
+        return metadata, self._view[start + meta_len:start + meta_len + data_len]
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Record views handed out earlier are still alive; the map goes when they do.
+            pass
+        self._file.close()
+
+
+class DatasetReader:
+    """Every shard in a folder, read as one indexable dataset.
+
+    sources (a prefix or list of prefixes) restricts it to those cameras.
+    """
+
+    def __init__(self, folder, sources=None):
+        if isinstance(sources, str):
+            sources = [sources]
+        self.shards = [ShardReader(path) for path in find_shards(folder, sources)]
+        self._starts = []
+        total = 0
+        for shard in self.shards:
+            self._starts.append(total)
+            total += len(shard)
+        self._len = total
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        shard = bisect.bisect_right(self._starts, index) - 1
+        return self.shards[shard][index - self._starts[shard]]
+
+    def iter_batches(self, batch_size, shuffle=False, decode=True, seed=None):
+        """Yield (images, metadata) lists of up to batch_size records.
+
+        Images are decoded to numpy arrays unless decode is False, in which case the raw
+        encoded bytes are yielded.  Wrap with tf.data.Dataset.from_generator to feed training.
+        """
+        order = np.arange(self._len)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+
+        for start in range(0, self._len, batch_size):
+            images = []
+            metadata = []
+            for index in order[start:start + batch_size]:
+                meta, data = self[int(index)]
+                if decode:
+                    images.append(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), -1))
+                else:
+                    images.append(bytes(data))
+                metadata.append(meta)
+            yield images, metadata
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
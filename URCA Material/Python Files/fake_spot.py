@@ -0,0 +1,351 @@
+"""A fake Spot for running the scripts in this folder without the robot.
+
+FakeRobot answers the parts of bosdyn.client.robot.Robot the scripts use (authenticate,
+time_sync, ensure_client, power) and hands out:
+
+    robot-state, robot-command    sim_robot.SimulatedRobot, with trajectory feedback
+    lease                         FakeLeaseClient
+    estop                         FakeEstopClient, enough for an EstopEndpoint
+    image                         FakeImageClient, blank or recorded images
+    network-compute-bridge        a real NetworkComputeBridgeClient talking to a localhost gRPC
+                                  server, either SceneNetworkComputeBridgeServicer (objects at
+                                  fixed or moving positions) or ReplayNetworkComputeBridgeServicer
+                                  (recorded responses)
+
+Every fake RPC goes through one sim_robot.Link, so latency, jitter and packet loss can be
+injected across all services at once.
+
+    robot = FakeRobot(link=Link(latency=0.02, loss=0.01))
+    fetch.main(['--headless', '--cycles', '3', '-s', 'fake', '-m', 'dogtoy-model',
+                '-p', 'person-model', 'fake-spot'], robot=robot)
+"""
+
+import collections
+import glob
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+from bosdyn.api import estop_pb2, image_pb2, lease_pb2
+from bosdyn.client.estop import EstopClient
+from bosdyn.client.image import ImageClient
+from bosdyn.client.lease import Lease, LeaseClient, LeaseWallet, NoSuchLease
+from bosdyn.client.network_compute_bridge_client import NetworkComputeBridgeClient
+from bosdyn.client.robot_command import RobotCommandClient
+from bosdyn.client.robot_state import RobotStateClient
+
+import ncb_stub
+import response_log
+from sim_robot import Link, SimulatedRobot
+
+kFakeImageRows = 480
+kFakeImageCols = 640
+
+
+def load_messages(folder, message_class):
+    """Every serialized message_class in folder/*.pb, in file name order.
+
+    folder may also be a response log from fetch.py --record.
+    """
+    if os.path.isfile(folder):
+        if message_class is image_pb2.ImageResponse:
+            return list(response_log.read_images(folder))
+        return [record.message for record in response_log.read_log(folder)
+                if isinstance(record.message, message_class)]
+    messages = []
+    for path in sorted(glob.glob(os.path.join(folder, '*.pb'))):
+        message = message_class()
+        with open(path, 'rb') as message_file:
+            message.ParseFromString(message_file.read())
+        messages.append(message)
+    return messages
+
+
+class SceneNetworkComputeBridgeServicer(ncb_stub.StubNetworkComputeBridgeServicer):
+    """Detects objects at known positions in vision.
+
+    objects maps label -> (x, y, z) or a function returning it.  models maps each model name to
+    the labels it finds; a request naming several comma-separated models gets all of their
+    labels.  Only requests for visible_sources see anything.  With probability loss a request
+    is dropped and fails with DEADLINE_EXCEEDED after timeout seconds.
+    """
+
+    def __init__(self, objects, models, visible_sources=('frontleft_fisheye_image',
+                                                         'frontright_fisheye_image'),
+                 latency=0.05, jitter=0.0, loss=0.0, timeout=1.0, confidence=0.9):
+        super(SceneNetworkComputeBridgeServicer, self).__init__(latency=latency, jitter=jitter,
+                                                                confidence=confidence)
+        self.objects = objects
+        self.models = models
+        self.visible_sources = set(visible_sources)
+        self.loss = loss
+        self.timeout = timeout
+
+    def NetworkCompute(self, request, context):
+        if self.loss > 0 and random.random() < self.loss:
+            time.sleep(self.timeout)
+            context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, 'Simulated packet loss')
+
+        # A blank image with no detections, after the configured latency.
+        response = super(SceneNetworkComputeBridgeServicer,
+                         self).NetworkCompute(request, context)
+
+        input_data = request.input_data
+        if input_data.image_source_and_service.image_source not in self.visible_sources:
+            return response
+        if self.confidence < input_data.min_confidence:
+            return response
+        for model in input_data.model_name.split(','):
+            for label in self.models.get(model, ()):
+                xyz = self.objects[label]
+                ncb_stub.add_stub_object(response, label, self.confidence,
+                                         xyz() if callable(xyz) else xyz)
+        return response
+
+    def ListAvailableModels(self, request, context):
+        response = super(SceneNetworkComputeBridgeServicer,
+                         self).ListAvailableModels(request, context)
+        response.available_models.extend(sorted(self.models))
+        return response
+
+
+class ReplayNetworkComputeBridgeServicer(ncb_stub.StubNetworkComputeBridgeServicer):
+    """Answers each camera with its recorded NetworkComputeResponses, in order, looping.
+
+    Cameras with nothing recorded get a blank image and no detections.
+    """
+
+    def __init__(self, responses, latency=0.05, jitter=0.0):
+        super(ReplayNetworkComputeBridgeServicer, self).__init__(latency=latency, jitter=jitter)
+        by_source = collections.defaultdict(list)
+        for response in responses:
+            by_source[response.image_response.source.name].append(response)
+        self._responses = {source: itertools.cycle(recorded)
+                           for source, recorded in by_source.items()}
+        self._lock = threading.Lock()
+
+    def NetworkCompute(self, request, context):
+        source = request.input_data.image_source_and_service.image_source
+        with self._lock:
+            recorded = self._responses.get(source)
+            response = next(recorded) if recorded is not None else None
+        if response is None:
+            return super(ReplayNetworkComputeBridgeServicer,
+                         self).NetworkCompute(request, context)
+
+        self.num_requests += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        return response
+
+
+class FakeImageClient:
+    """ImageClient.get_image_from_sources with blank or recorded images.
+
+    images is a list of ImageResponses; each camera replays its own in order, looping.  Every
+    response is stamped now and carries the simulated body pose in its transforms snapshot.
+    """
+
+    def __init__(self, body, link, images=()):
+        self.body = body
+        self.link = link
+        self.num_requests = 0
+
+        by_source = collections.defaultdict(list)
+        for image_response in images:
+            by_source[image_response.source.name].append(image_response)
+        self._images = {source: itertools.cycle(recorded)
+                        for source, recorded in by_source.items()}
+        self._blank = bytes(kFakeImageRows * kFakeImageCols)
+        self._lock = threading.Lock()
+
+    def _image(self, source, snapshot):
+        with self._lock:
+            recorded = self._images.get(source)
+            template = next(recorded) if recorded is not None else None
+
+        image_response = image_pb2.ImageResponse()
+        if template is not None:
+            image_response.CopyFrom(template)
+        else:
+            image_response.source.name = source
+            image = image_response.shot.image
+            image.format = image_pb2.Image.FORMAT_RAW
+            image.pixel_format = image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8
+            image.rows = kFakeImageRows
+            image.cols = kFakeImageCols
+            image.data = self._blank
+        image_response.shot.acquisition_time.FromNanoseconds(int(time.time() * 1e9))
+        image_response.shot.transforms_snapshot.CopyFrom(snapshot)
+        return image_response
+
+    def _images_from_sources(self, sources):
+        self.num_requests += 1
+        snapshot = self.body.get_robot_state().kinematic_state.transforms_snapshot
+        return [self._image(source, snapshot) for source in sources]
+
+    def get_image_from_sources(self, image_sources, **kwargs):
+        return self.link.call(self._images_from_sources, image_sources)
+
+
+class FakeLeaseClient:
+    """Hands out one body lease and keeps it in a real LeaseWallet, for LeaseKeepAlive."""
+
+    def __init__(self, link, client_name='fake_spot'):
+        self.link = link
+        self.client_name = client_name
+        self.lease_wallet = LeaseWallet()
+        self._sequence = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    def _grant(self, resource='body'):
+        # Taking or acquiring a lease we already hold hands back the same one.
+        try:
+            return self.lease_wallet.get_lease(resource)
+        except NoSuchLease:
+            pass
+        self._sequence += 1
+        lease = Lease(
+            lease_pb2.Lease(resource=resource, epoch='fake_spot', sequence=[self._sequence],
+                            client_names=[self.client_name]))
+        self.lease_wallet.add(lease)
+        return lease
+
+    def take(self, resource='body', **kwargs):
+        return self.link.call(self._grant, resource)
+
+    def acquire(self, resource='body', **kwargs):
+        return self.link.call(self._grant, resource)
+
+    def _retain(self, lease):
+        response = lease_pb2.RetainLeaseResponse()
+        response.lease_use_result.status = lease_pb2.LeaseUseResult.STATUS_OK
+        return response
+
+    def retain_lease(self, lease, **kwargs):
+        return self.link.call(self._retain, lease)
+
+    def retain_lease_async(self, lease, **kwargs):
+        return self._executor.submit(self.link.call, self._retain, lease)
+
+    def _return(self, lease):
+        self.lease_wallet.remove(lease)
+        response = lease_pb2.ReturnLeaseResponse()
+        response.status = lease_pb2.ReturnLeaseResponse.STATUS_OK
+        return response
+
+    def return_lease(self, lease, **kwargs):
+        return self.link.call(self._return, lease)
+
+
+class FakeEstopClient:
+    """Accepts one E-Stop configuration and remembers the last stop level checked in."""
+
+    def __init__(self, link):
+        self.link = link
+        self.config = estop_pb2.EstopConfig(unique_id='fake-config-0')
+        self.stop_level = estop_pb2.ESTOP_LEVEL_CUT
+        self.num_check_ins = 0
+        self._num_configs = 0
+        self._challenge = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    def _set_config(self, config):
+        self.config = estop_pb2.EstopConfig()
+        self.config.CopyFrom(config)
+        self._num_configs += 1
+        self.config.unique_id = 'fake-config-{}'.format(self._num_configs)
+        for index, endpoint in enumerate(self.config.endpoints):
+            endpoint.unique_id = 'fake-endpoint-{}'.format(index)
+        return self.config
+
+    def get_config(self, **kwargs):
+        return self.link.call(lambda: self.config)
+
+    def set_config(self, config, target_config_id, **kwargs):
+        return self.link.call(self._set_config, config)
+
+    def register(self, target_config_id, endpoint, **kwargs):
+        return self.link.call(endpoint.to_proto)
+
+    def deregister(self, target_config_id, endpoint, **kwargs):
+        self.link.call(lambda: None)
+
+    def _check_in(self, stop_level):
+        self.num_check_ins += 1
+        self.stop_level = stop_level
+        self._challenge += 1
+        return self._challenge
+
+    def check_in(self, stop_level, endpoint, challenge, response, suppress_incorrect=False,
+                 **kwargs):
+        return self.link.call(self._check_in, stop_level)
+
+    def check_in_async(self, stop_level, endpoint, challenge, response, suppress_incorrect=False,
+                       **kwargs):
+        return self._executor.submit(self.link.call, self._check_in, stop_level)
+
+
+class FakeTimeSync:
+
+    def wait_for_sync(self, timeout_sec=3.0):
+        pass
+
+
+class FakeRobot:
+    """Stands in for the Robot returned by sdk.create_robot().
+
+    ncb_servicer defaults to a scene with a dogtoy 3 m ahead and a person 4 m to the left, found
+    by the models 'dogtoy-model' and 'person-model'.
+    """
+
+    def __init__(self, link=None, body=None, ncb_servicer=None, images=()):
+        self.link = link if link is not None else Link()
+        self.body = body if body is not None else SimulatedRobot(link=self.link)
+        if ncb_servicer is None:
+            ncb_servicer = SceneNetworkComputeBridgeServicer(
+                objects={'dogtoy': (3.0, 0.0, 0.0), 'person': (0.0, 4.0, 0.0)},
+                models={'dogtoy-model': ['dogtoy'], 'person-model': ['person']})
+        self.ncb_servicer = ncb_servicer
+        self.ncb_server, self.ncb_port = ncb_stub.serve(ncb_servicer)
+        self.username = None
+        self.powered_on = True
+        self.time_sync = FakeTimeSync()
+
+        self.clients = {
+            RobotStateClient.default_service_name: self.body,
+            RobotCommandClient.default_service_name: self.body,
+            LeaseClient.default_service_name: FakeLeaseClient(self.link),
+            EstopClient.default_service_name: FakeEstopClient(self.link),
+            ImageClient.default_service_name: FakeImageClient(self.body, self.link, images),
+            NetworkComputeBridgeClient.default_service_name: ncb_stub.create_client(
+                self.ncb_port),
+        }
+
+    def authenticate(self, username, password, timeout=None):
+        self.username = username
+
+    def sync_with_directory(self):
+        return list(self.clients)
+
+    def ensure_client(self, service_name):
+        if service_name not in self.clients:
+            raise KeyError('FakeRobot has no {} service'.format(service_name))
+        return self.clients[service_name]
+
+    def is_powered_on(self):
+        return self.powered_on
+
+    def power_on(self, timeout_sec=20):
+        self.powered_on = True
+
+    def wait_until_powered_on(self, timeout_sec=20):
+        self.powered_on = True
+
+    def shutdown(self):
+        self.ncb_server.stop(0)
+        self.body.shutdown()
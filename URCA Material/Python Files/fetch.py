@@ -18,9 +18,9 @@ import sys
 
 import time
 
+from concurrent import futures
 
 
-import cv2
 
 import numpy as np
 
@@ -32,12 +32,12 @@ import bosdyn.client
 
 import bosdyn.client.util
 
-from bosdyn.api import (basic_command_pb2, geometry_pb2, image_pb2, manipulation_api_pb2,
-
-                        network_compute_bridge_pb2)
+from bosdyn.api import basic_command_pb2, manipulation_api_pb2, network_compute_bridge_pb2
 
 from bosdyn.client import frame_helpers, math_helpers
 
+from bosdyn.client.exceptions import RpcError
+
 from bosdyn.client.lease import LeaseClient, LeaseKeepAlive
 
 from bosdyn.client.manipulation_api_client import ManipulationApiClient
@@ -46,9 +46,7 @@ from bosdyn.client.network_compute_bridge_client import (ExternalServerError,
 
                                                          NetworkComputeBridgeClient)
 
-from bosdyn.client.robot_command import (RobotCommandBuilder, RobotCommandClient,
-
-                                         block_for_trajectory_cmd, block_until_arm_arrives)
+from bosdyn.client.robot_command import RobotCommandClient, block_until_arm_arrives
 
 from bosdyn.client.robot_state import RobotStateClient
 
@@ -56,6 +54,26 @@ from bosdyn.client.directory import DirectoryClient
 
 
 
+import geometry
+
+from command_executor import TrajectoryExecutor
+
+import image_utils
+
+import response_log
+
+import roi
+
+import tracing
+
+from preview import PreviewWindow
+
+from robot_state_cache import RobotStateStreamer
+
+from tracker import ObjectTracker
+
+
+
 kImageSources = [
 
     'frontleft_fisheye_image', 'frontright_fisheye_image', 'left_fisheye_image',
@@ -68,133 +86,311 @@ kImageSources = [
 
 
 
-def get_obj_and_img(network_compute_client, server, model, confidence, image_sources, label):
+def build_network_compute_request(server, model, confidence, source, roi_window=None,
 
+                                  roi_scale=1.0):
 
+    # Build a network compute request for this image source.  With roi_window, the server only
 
-    for source in image_sources:
+    # searches that part of the image.
+
+    image_source_and_service = network_compute_bridge_pb2.ImageSourceAndService(
+
+        image_source=source)
+
+
+
+    # Input data:
+
+    #   model name
+
+    #   minimum confidence (between 0 and 1)
+
+    #   if we should automatically rotate the image
+
+    input_data = network_compute_bridge_pb2.NetworkComputeInputData(
+
+        image_source_and_service=image_source_and_service, model_name=model,
+
+        min_confidence=confidence, rotate_image=network_compute_bridge_pb2.
+
+        NetworkComputeInputData.ROTATE_IMAGE_ALIGN_HORIZONTAL)
+
+    if roi_window is not None:
 
-        # Build a network compute request for this image source.
+        # The window is in the camera's pixels, so the server has to see the image unrotated.
 
-        image_source_and_service = network_compute_bridge_pb2.ImageSourceAndService(
+        input_data.rotate_image = (
 
-            image_source=source)
+            network_compute_bridge_pb2.NetworkComputeInputData.ROTATE_IMAGE_NO_ROTATION)
 
+        roi.pack_roi(input_data, roi_window, roi_scale)
 
 
-        # Input data:
 
-        #   model name
+    # Server data: the service name
 
-        #   minimum confidence (between 0 and 1)
+    server_data = network_compute_bridge_pb2.NetworkComputeServerConfiguration(
 
-        #   if we should automatically rotate the image
+        service_name=server)
 
-        input_data = network_compute_bridge_pb2.NetworkComputeInputData(
 
-            image_source_and_service=image_source_and_service, model_name=model,
 
-            min_confidence=confidence, rotate_image=network_compute_bridge_pb2.
+    # Pack the request.
 
-            NetworkComputeInputData.ROTATE_IMAGE_ALIGN_HORIZONTAL)
+    return network_compute_bridge_pb2.NetworkComputeRequest(input_data=input_data,
 
+                                                            server_config=server_data)
 
 
-        # Server data: the service name
 
-        server_data = network_compute_bridge_pb2.NetworkComputeServerConfiguration(
 
-            service_name=server)
 
+def wait_for_models(network_compute_client, server, models, timeout, period=1.0):
 
+    """Block until server lists every model in models, or timeout seconds pass.
 
-        # Pack and send the request.
 
-        process_img_req = network_compute_bridge_pb2.NetworkComputeRequest(
 
-            input_data=input_data, server_config=server_data)
+    The fetch_detector server only registers with the directory once its models are loaded
 
+    and warmed up, so until then the NCB can't reach it.  Returns True if it became ready.
 
+    """
+
+    request = network_compute_bridge_pb2.ListAvailableModelsRequest(
+
+        server_config=network_compute_bridge_pb2.NetworkComputeServerConfiguration(
+
+            service_name=server))
+
+    deadline = time.time() + timeout
+
+    while True:
 
         try:
 
-            resp = network_compute_client.network_compute_bridge_command(process_img_req)
+            response = network_compute_client.list_available_models_command(request)
 
-        except ExternalServerError:
+            missing = set(models) - set(response.available_models)
 
-            # This sometimes happens if the NCB is unreachable due to intermittent wifi failures.
+            if not missing:
 
-            print('Error connecting to network compute bridge. This may be temporary.')
+                return True
 
-            return None, None, None
+            reason = 'missing ' + ', '.join(sorted(missing))
 
+        except (ExternalServerError, RpcError) as err:
 
+            reason = type(err).__name__
 
-        best_obj = None
+        if time.time() + period > deadline:
 
-        highest_conf = 0.0
+            print('Gave up waiting for {} ({})'.format(server, reason))
 
-        best_vision_tform_obj = None
+            return False
 
+        print('Waiting for {} to be ready ({})...'.format(server, reason))
 
+        time.sleep(period)
 
-        img = get_bounding_box_image(resp)
 
-        image_full = resp.image_response
 
 
 
-        # Show the image
+class RecentDetections:
+
+    """The latest detection of each label seen during any search, and when it was seen.
+
+
+
+    Combined requests return every model's detections for a frame; keeping the ones we
+
+    weren't searching for lets a later search (e.g. for the person) be skipped entirely.
+
+    """
+
+
+
+    def __init__(self):
+
+        self._seen = {}
+
+
+
+    def add(self, label, obj, vision_tform_obj):
+
+        self._seen[label] = (time.time(), obj, vision_tform_obj)
+
+
+
+    def get(self, label, max_age):
+
+        if label not in self._seen:
+
+            return None, None
+
+        seen_time, obj, vision_tform_obj = self._seen[label]
+
+        if time.time() - seen_time > max_age:
+
+            return None, None
+
+        return obj, vision_tform_obj
+
+
+
+    def record(self, resp, record_labels):
+
+        # record_labels maps label -> minimum confidence.
+
+        for label, min_confidence in record_labels.items():
+
+            obj, _, vision_tform_obj = find_best_obj(resp, label, min_confidence)
+
+            if obj is not None:
+
+                self.add(label, obj, vision_tform_obj)
+
+
+
+
+
+def find_best_obj(resp, label, min_confidence=0.0):
+
+    best_obj = None
+
+    highest_conf = 0.0
+
+    best_vision_tform_obj = None
+
+
+
+    for obj in resp.object_in_image:
+
+        # Get the label
+
+        obj_label = obj.name.split('_label_')[-1]
+
+        if obj_label != label:
+
+            continue
+
+        conf_msg = wrappers_pb2.FloatValue()
+
+        obj.additional_properties.Unpack(conf_msg)
+
+        conf = conf_msg.value
+
+        if conf < min_confidence:
+
+            continue
+
+
+
+        try:
+
+            vision_tform_obj = frame_helpers.get_a_tform_b(
+
+                obj.transforms_snapshot, frame_helpers.VISION_FRAME_NAME,
+
+                obj.image_properties.frame_name_image_coordinates)
+
+        except bosdyn.client.frame_helpers.ValidateFrameTreeError:
+
+            # No depth data available.
+
+            vision_tform_obj = None
+
+
+
+        if conf > highest_conf and vision_tform_obj is not None:
+
+            highest_conf = conf
+
+            best_obj = obj
+
+            best_vision_tform_obj = vision_tform_obj
+
+
+
+    return best_obj, highest_conf, best_vision_tform_obj
+
 
-        cv2.imshow("Fetch", img)
 
-        cv2.waitKey(15)
 
 
+def get_obj_and_img(network_compute_client, server, model, confidence, image_sources, label,
 
-        if len(resp.object_in_image) > 0:
+                    executor=None, early_stop=True, recent=None, record_labels=None,
 
-            for obj in resp.object_in_image:
+                    preview=None, roi_windows=None, roi_scale=1.0):
 
-                # Get the label
+    # model may name several models separated by commas, in which case the server runs all of
 
-                obj_label = obj.name.split('_label_')[-1]
+    # them on each image.  Detections of the labels in record_labels (label -> confidence) are
 
-                if obj_label != label:
+    # stored in recent as a side effect.  Responses are handed to preview, if there is one.
 
-                    continue
+    # roi_windows maps image sources to the window of the image to search (see roi.py).
 
-                conf_msg = wrappers_pb2.FloatValue()
+    if executor is not None:
 
-                obj.additional_properties.Unpack(conf_msg)
+        return get_obj_and_img_concurrent(network_compute_client, server, model, confidence,
 
-                conf = conf_msg.value
+                                          image_sources, label, executor, early_stop, recent,
 
+                                          record_labels, preview, roi_windows, roi_scale)
 
 
-                try:
 
-                    vision_tform_obj = frame_helpers.get_a_tform_b(
+    request_confidence = min([confidence] + list((record_labels or {}).values()))
 
-                        obj.transforms_snapshot, frame_helpers.VISION_FRAME_NAME,
+    for source in image_sources:
+
+        process_img_req = build_network_compute_request(server, model, request_confidence,
+
+                                                        source, (roi_windows or {}).get(source),
+
+                                                        roi_scale)
+
+
+
+        try:
+
+            with tracing.span('ncb_request', source=source):
+
+                resp = network_compute_client.network_compute_bridge_command(process_img_req)
+
+        except (ExternalServerError, RpcError):
+
+            # This sometimes happens if the NCB is unreachable due to intermittent wifi failures.
+
+            print('Error connecting to network compute bridge. This may be temporary.')
+
+            return None, None, None
+
+
+
+        image_full = resp.image_response
 
-                        obj.image_properties.frame_name_image_coordinates)
 
-                except bosdyn.client.frame_helpers.ValidateFrameTreeError:
 
-                    # No depth data available.
+        # Show the image
+
+        if preview is not None:
 
-                    vision_tform_obj = None
+            preview.show(resp)
 
 
 
-                if conf > highest_conf and vision_tform_obj is not None:
+        if recent is not None and record_labels:
 
-                    highest_conf = conf
+            recent.record(resp, record_labels)
 
-                    best_obj = obj
 
-                    best_vision_tform_obj = vision_tform_obj
+
+        best_obj, _, best_vision_tform_obj = find_best_obj(resp, label, confidence)
 
 
 
@@ -210,75 +406,139 @@ def get_obj_and_img(network_compute_client, server, model, confidence, image_sou
 
 
 
-def get_bounding_box_image(response):
+def get_obj_and_img_concurrent(network_compute_client, server, model, confidence, image_sources,
 
-    dtype = np.uint8
+                               label, executor, early_stop=True, recent=None, record_labels=None,
 
-    img = np.fromstring(response.image_response.shot.image.data, dtype=dtype)
+                               preview=None, roi_windows=None, roi_scale=1.0):
 
-    if response.image_response.shot.image.format == image_pb2.Image.FORMAT_RAW:
+    # Send the request for every camera at once and handle the responses in the order they
 
-        img = img.reshape(response.image_response.shot.image.rows,
+    # come back.  With early_stop, the first camera that sees the object wins; otherwise we
 
-                          response.image_response.shot.image.cols)
+    # wait for all of them and keep the most confident detection.
 
-    else:
+    request_confidence = min([confidence] + list((record_labels or {}).values()))
 
-        img = cv2.imdecode(img, -1)
+    pending = [
 
+        executor.submit(
 
+            tracing.wrap('ncb_request', network_compute_client.network_compute_bridge_command,
 
-    # Convert to BGR so we can draw colors
+                         source=source),
 
-    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+            build_network_compute_request(server, model, request_confidence, source,
 
+                                          (roi_windows or {}).get(source), roi_scale))
 
+        for source in image_sources
 
-    # Draw bounding boxes in the image for all the detections.
+    ]
 
-    for obj in response.object_in_image:
 
-        conf_msg = wrappers_pb2.FloatValue()
 
-        obj.additional_properties.Unpack(conf_msg)
+    best_obj = None
+
+    highest_conf = 0.0
+
+    best_image = None
+
+    best_vision_tform_obj = None
+
+
+
+    try:
+
+        for future in futures.as_completed(pending):
+
+            try:
+
+                resp = future.result()
+
+            except (ExternalServerError, RpcError):
+
+                # This sometimes happens if the NCB is unreachable due to intermittent wifi
+
+                # failures.
+
+                print('Error connecting to network compute bridge. This may be temporary.')
+
+                return None, None, None
+
+
+
+            # Show the image
+
+            if preview is not None:
+
+                preview.show(resp)
+
+
+
+            if recent is not None and record_labels:
+
+                recent.record(resp, record_labels)
+
+
+
+            obj, conf, vision_tform_obj = find_best_obj(resp, label, confidence)
+
+            if obj is None or conf <= highest_conf:
 
-        confidence = conf_msg.value
+                continue
 
 
 
-        polygon = []
+            best_obj = obj
 
-        min_x = float('inf')
+            highest_conf = conf
 
-        min_y = float('inf')
+            best_image = resp.image_response
 
-        for v in obj.image_properties.coordinates.vertexes:
+            best_vision_tform_obj = vision_tform_obj
 
-            polygon.append([v.x, v.y])
 
-            min_x = min(min_x, v.x)
 
-            min_y = min(min_y, v.y)
+            if early_stop and conf >= confidence:
 
+                break
 
+    finally:
 
-        polygon = np.array(polygon, np.int32)
+        # Don't bother waiting on cameras we no longer need.
 
-        polygon = polygon.reshape((-1, 1, 2))
+        for future in pending:
 
-        cv2.polylines(img, [polygon], True, (0, 255, 0), 2)
+            future.cancel()
 
 
 
-        caption = "{} {:.3f}".format(obj.name, confidence)
+    return best_obj, best_image, best_vision_tform_obj
 
-        cv2.putText(img, caption, (int(min_x), int(min_y)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
 
-                    (0, 255, 0), 2)
 
 
 
-    return img
+def get_bounding_box_image(response, pool=None):
+
+    with tracing.span('decode_image'):
+
+        img = image_utils.decode_image(response.image_response.shot.image)
+
+
+
+        # Convert to BGR so we can draw colors
+
+        img = image_utils.to_bgr(img, pool)
+
+
+
+    # Draw bounding boxes in the image for all the detections.
+
+    with tracing.span('draw_detections'):
+
+        return image_utils.draw_detections(img, response.object_in_image)
 
 
 
@@ -322,7 +582,9 @@ def find_center_px(polygon):
 
 
 
-def main(argv):
+def main(argv, robot=None):
+
+    # robot may be passed in already connected, e.g. a fake_spot.FakeRobot.
 
     parser = argparse.ArgumentParser()
 
@@ -352,248 +614,622 @@ def main(argv):
 
                         type=float)
 
+    parser.add_argument('--concurrent-search', action='store_true',
+
+                        help='Query all cameras at once instead of one after the other.')
+
+    parser.add_argument('--no-early-stop', action='store_true',
+
+                        help='With --concurrent-search, wait for every camera and keep the most '
+
+                        'confident detection instead of the first one found.')
+
+    parser.add_argument(
+
+        '--combined-models', action='store_true',
+
+        help='Run the dogtoy and person models in one request per image and remember people '
+
+        'seen while searching for the toy.')
+
+    parser.add_argument('--person-max-age', default=10.0, type=float,
+
+                        help='With --combined-models, how long (s) a person sighting can be '
+
+                        'reused instead of searching again.')
+
+    parser.add_argument('--headless', action='store_true',
+
+                        help='Run without the preview window, e.g. on the Core I/O.')
+
+    parser.add_argument('--state-period', default=0.2, type=float,
+
+                        help='How often (s) robot state is refreshed in the background.')
+
+    parser.add_argument('--state-max-age', default=0.5, type=float,
+
+                        help='Oldest robot state (s) the navigation helpers will use before '
+
+                        'fetching a fresh one.')
+
+    parser.add_argument('--track', action='store_true',
+
+                        help='Track the dogtoy and person between detections and only run the '
+
+                        'detector again when the track gets too uncertain.')
+
+    parser.add_argument('--track-max-std', default=0.25, type=float,
+
+                        help='With --track, position uncertainty (m) that triggers a new '
+
+                        'detection.')
+
+    parser.add_argument('--detect-while-walking', action='store_true',
+
+                        help='Keep detecting the dogtoy while walking to it and re-send the '
+
+                        'goal when the toy turns out to be somewhere else.')
+
+    parser.add_argument('--refine-threshold', default=0.3, type=float,
+
+                        help='With --detect-while-walking, how far (m) the toy has to move from '
+
+                        'where the current goal was planned before the goal is re-sent.')
+
+    parser.add_argument('--settle', action='store_true',
+
+                        help='Wait for the body to settle at each goal, not just reach it.')
+
+    parser.add_argument('--drop-pause', default=0.0, type=float,
+
+                        help='Seconds to stand still at the drop point before backing up.')
+
+    parser.add_argument('--trace', metavar='FILE',
+
+                        help='Time every stage of the fetch cycle and write a Chrome trace '
+
+                        '(chrome://tracing, ui.perfetto.dev) to FILE after each cycle.')
+
+    parser.add_argument('--metrics', metavar='FILE',
+
+                        help='Write per-stage latency histograms in the Prometheus text format '
+
+                        'to FILE after each cycle.')
+
+    parser.add_argument('--record', metavar='FILE',
+
+                        help='Append every NetworkComputeBridge response to the log FILE.')
+
+    parser.add_argument('--replay', metavar='FILE',
+
+                        help='Answer detection requests from the log FILE instead of the '
+
+                        'NetworkComputeBridge.')
+
+    parser.add_argument('--replay-fast', action='store_true',
+
+                        help='With --replay, answer at once instead of at the recorded latency.')
+
+    parser.add_argument('--wait-ready', default=0.0, type=float, metavar='SECONDS',
+
+                        help='Wait up to SECONDS for the ML server to list its models before '
+
+                        'starting, instead of failing the first searches while it warms up.')
+
+    parser.add_argument('--roi', action='store_true',
+
+                        help='Once the dogtoy is found, only search the camera that saw it, '
+
+                        'around where it was, until it is lost.')
+
+    parser.add_argument('--roi-pad', default=0.5, type=float,
+
+                        help='With --roi, how much to grow the last bounding box on every side, '
+
+                        'as a fraction of its size.')
+
+    parser.add_argument('--roi-min-size', default=160, type=int,
+
+                        help='With --roi, the smallest window (pixels) to search.')
+
+    parser.add_argument('--roi-scale', default=1.0, type=float,
+
+                        help='With --roi, have the server shrink the window by this factor '
+
+                        'before running the model.')
+
+    parser.add_argument('--cycles', default=0, type=int,
+
+                        help='Stop after this many fetch cycles (0 runs forever).')
+
     options = parser.parse_args(argv)
 
 
 
-    cv2.namedWindow("Fetch")
+    if (options.trace or options.metrics) and not tracing.enabled():
+
+        tracing.enable()
+
+
+
+    # Decoding and drawing happen on the preview's own thread, never in the control loop.
+
+    preview = None
+
+    if not options.headless:
+
+        pool = image_utils.BufferPool()
+
+        preview = PreviewWindow("Fetch", render=lambda resp: get_bounding_box_image(resp, pool))
+
+        preview.start()
+
+
+
+    # Everything started from here on is stopped on the way out, whatever the exit.
+
+    state_streamer = None
+
+    recorder = None
+
+    executor = None
+
+    try:
+
+        if robot is None:
+
+            sdk = bosdyn.client.create_standard_sdk('SpotFetchClient')
+
+            sdk.register_service_client(NetworkComputeBridgeClient)
+
+            robot = sdk.create_robot(options.hostname)
+
+            bosdyn.client.util.authenticate(robot)
+
+
+
+        # Time sync is necessary so that time-based filter requests can be converted
+
+        robot.time_sync.wait_for_sync()
+
+
+
+        if options.replay:
+
+            network_compute_client = response_log.ReplayClient(options.replay,
+
+                                                                real_time=not options.replay_fast)
+
+        else:
+
+            network_compute_client = robot.ensure_client(
+
+                NetworkComputeBridgeClient.default_service_name)
+
+        if options.wait_ready > 0 and not options.replay:
+
+            models = [options.model]
+
+            if options.person_model:
+
+                models.append(options.person_model)
+
+            if not wait_for_models(network_compute_client, options.ml_service, models,
+
+                                   options.wait_ready):
+
+                return False
+
+
+
+        if options.record:
+
+            recorder = response_log.ResponseRecorder(options.record)
+
+            network_compute_client = response_log.RecordingClient(network_compute_client, recorder)
+
+        robot_state_client = robot.ensure_client(RobotStateClient.default_service_name)
+
+        state_streamer = RobotStateStreamer(robot_state_client, period=options.state_period,
+
+                                            max_age=options.state_max_age).start()
+
+        command_client = robot.ensure_client(RobotCommandClient.default_service_name)
+
+        trajectory_executor = TrajectoryExecutor(command_client, state_streamer,
+
+                                                 require_settled=options.settle)
+
+        lease_client = robot.ensure_client(LeaseClient.default_service_name)
+
+
+        # One worker per camera so a whole search cycle goes out at once.
+
+        if options.concurrent_search:
+
+            executor = futures.ThreadPoolExecutor(max_workers=len(kImageSources))
+
+
+
+        # This script assumes the robot is already standing via the tablet.  We'll take over from
+
+        # the tablet.
+
+        lease_client.take()
+
+        with bosdyn.client.lease.LeaseKeepAlive(lease_client, must_acquire=True,
+
+                                                return_at_exit=True):
+
+            # Store the position of the hand at the last toy drop point.
+
+            vision_tform_hand_at_drop = None
+
+
+
+            # With combined requests, the dogtoy search also reports people it sees.
+
+            recent = RecentDetections()
+
+            search_model = options.model
+
+            record_labels = None
+
+            if options.combined_models and options.person_model:
+
+                search_model = options.model + ',' + options.person_model
+
+                record_labels = {'person': options.confidence_person}
+
+
+
+            # Filtered dogtoy and person positions, kept across loop iterations.
+
+            tracker = None
+
+            if options.track:
+
+                tracker = ObjectTracker(max_std=options.track_max_std)
+
+
+
+            # Where the dogtoy was last seen, to search only there next time.
+
+            dogtoy_roi = None
+
+            if options.roi:
+
+                dogtoy_roi = roi.RegionOfInterest(pad=options.roi_pad,
+
+                                                  min_size=options.roi_min_size)
+
+
 
-    cv2.waitKey(500)
+            def search_dogtoy():
 
+                sources, windows = kImageSources, None
 
+                if dogtoy_roi is not None:
 
-    sdk = bosdyn.client.create_standard_sdk('SpotFetchClient')
+                    sources, windows = dogtoy_roi.plan(kImageSources)
 
-    sdk.register_service_client(NetworkComputeBridgeClient)
+                with tracing.span('search', label='dogtoy', roi=windows is not None):
 
-    robot = sdk.create_robot(options.hostname)
+                    dogtoy, image, vision_tform_dogtoy = get_obj_and_img(
 
-    bosdyn.client.util.authenticate(robot)
+                        network_compute_client, options.ml_service, search_model,
 
+                        options.confidence_dogtoy, sources, 'dogtoy', executor=executor,
 
+                        early_stop=not options.no_early_stop, recent=recent,
 
-    # Time sync is necessary so that time-based filter requests can be converted
+                        record_labels=record_labels, preview=preview, roi_windows=windows,
 
-    robot.time_sync.wait_for_sync()
+                        roi_scale=options.roi_scale)
 
+                if dogtoy_roi is not None:
 
+                    dogtoy_roi.update(dogtoy, image, options.roi_scale)
 
-    network_compute_client = robot.ensure_client(NetworkComputeBridgeClient.default_service_name)
+                return dogtoy, image, vision_tform_dogtoy
 
-    robot_state_client = robot.ensure_client(RobotStateClient.default_service_name)
 
-    command_client = robot.ensure_client(RobotCommandClient.default_service_name)
 
-    lease_client = robot.ensure_client(LeaseClient.default_service_name)
+            def detect_dogtoy():
 
+                # One more look for the toy while walking.  Returns its (tracked) pose or None.
 
-    # This script assumes the robot is already standing via the tablet.  We'll take over from the
+                dogtoy, _, vision_tform_dogtoy = search_dogtoy()
 
-    # tablet.
+                if dogtoy is None or tracker is None:
 
-    lease_client.take()
+                    return vision_tform_dogtoy
 
-    with bosdyn.client.lease.LeaseKeepAlive(lease_client, must_acquire=True, return_at_exit=True):
+                update_track(tracker, 'dogtoy', vision_tform_dogtoy, time.time())
 
-        # Store the position of the hand at the last toy drop point.
+                return tracked_pose(tracker, 'dogtoy', time.time())
 
-        vision_tform_hand_at_drop = None
 
 
+            num_cycles = 0
 
-        while True:
+            while options.cycles == 0 or num_cycles < options.cycles:
 
-            holding_toy = False
+                cycle_start = time.perf_counter()
 
-            while not holding_toy:
+                holding_toy = False
 
-                # Capture an image and run ML on it.
+                while not holding_toy:
 
-                dogtoy, image, vision_tform_dogtoy = get_obj_and_img(
+                    if tracker is not None and not tracker.needs_detection('dogtoy', time.time()):
 
-                    network_compute_client, options.ml_service, options.model,
+                        # The track is still good enough, steer towards where it says the toy is.
 
-                    options.confidence_dogtoy, kImageSources, 'dogtoy')
+                        vision_tform_dogtoy = tracked_pose(tracker, 'dogtoy', time.time())
 
+                    else:
 
+                        # Capture an image and run ML on it.
 
-                if dogtoy is None:
+                        dogtoy, image, vision_tform_dogtoy = search_dogtoy()
 
-                    # Didn't find anything, keep searching.
 
-                    continue
 
+                        if dogtoy is None:
 
+                            # Didn't find anything, keep searching.
 
-                # If we have already dropped the toy off, make sure it has moved a sufficient amount before
+                            continue
 
-                # picking it up again
 
-                if vision_tform_hand_at_drop is not None and pose_dist(
 
-                        vision_tform_hand_at_drop, vision_tform_dogtoy) < 0.5:
+                        if tracker is not None:
 
-                    print('Found dogtoy, but it hasn\'t moved.  Waiting...')
+                            update_track(tracker, 'dogtoy', vision_tform_dogtoy, time.time())
 
-                    time.sleep(1)
 
-                    continue
 
+                    # If we have already dropped the toy off, make sure it has moved a sufficient amount before
 
+                    # picking it up again
 
-                print('Found dogtoy...')
+                    if vision_tform_hand_at_drop is not None and pose_dist(
 
+                            vision_tform_hand_at_drop, vision_tform_dogtoy) < 0.5:
 
+                        print('Found dogtoy, but it hasn\'t moved.  Waiting...')
 
-                # Got a dogtoy.  Request pick up.
+                        with tracing.span('sleep_unmoved'):
 
+                            time.sleep(1)
 
+                        continue
 
-                # Walk to the object.
 
-                walk_rt_vision, heading_rt_vision = compute_stand_location_and_yaw(
 
-                    vision_tform_dogtoy, robot_state_client, distance_margin=1.0)
+                    print('Found dogtoy...')
 
 
 
-                se2_pose = geometry_pb2.SE2Pose(
+                    # Got a dogtoy.  Request pick up.
 
-                    position=geometry_pb2.Vec2(x=walk_rt_vision[0], y=walk_rt_vision[1]),
 
-                    angle=heading_rt_vision)
 
-                move_cmd = RobotCommandBuilder.synchro_se2_trajectory_command(
+                    # Walk to the object.
 
-                    se2_pose, frame_name=frame_helpers.VISION_FRAME_NAME,
+                    with tracing.span('walk', goal='dogtoy'):
 
-                    params=get_walking_params(0.5, 0.5))
+                        if options.detect_while_walking:
 
-                end_time = 5.0
+                            # Keep looking while walking and steer towards the latest sighting.
 
-                cmd_id = command_client.robot_command(command=move_cmd,
+                            walk, vision_tform_dogtoy = approach_while_detecting(
 
-                                                      end_time_secs=time.time() + end_time)
+                                trajectory_executor, state_streamer, detect_dogtoy,
 
+                                vision_tform_dogtoy, distance_margin=1.0,
 
+                                refine_threshold=options.refine_threshold)
 
-                # Wait until the robot reports that it is at the goal.
+                        else:
 
-                block_for_trajectory_cmd(command_client, cmd_id, timeout_sec=5)
+                            walk_rt_vision, heading_rt_vision = compute_stand_location_and_yaw(
 
+                                vision_tform_dogtoy, state_streamer, distance_margin=1.0)
 
+                            walk = trajectory_executor.walk_to(walk_rt_vision[0], walk_rt_vision[1],
 
-                # The ML result is a bounding box.  Find the center.
+                                                               heading_rt_vision)
 
-                (center_px_x, center_px_y) = find_center_px(dogtoy.image_properties.coordinates)
 
 
+                            # Wait until the robot reports that it is at the goal.
 
-            # Wait for the carry command to finish
+                            walk.wait()
 
-            time.sleep(0.75)
 
 
+                    # Nothing here grasps the toy, so reaching it counts as holding it.  If the walk
 
-            person = None
+                    # fell short, look for the toy again.
 
-            while person is None:
+                    holding_toy = walk.arrived
 
-                # Find a person to deliver the toy to
+                    if not walk.arrived:
 
-                person, image, vision_tform_person = get_obj_and_img(
+                        print('Didn\'t reach the dogtoy ({}), searching again.'.format(walk.status))
 
-                    network_compute_client, options.ml_service, options.person_model,
 
-                    options.confidence_person, kImageSources, 'person')
 
+                person = None
 
+                vision_tform_person = None
 
-            # We now have found a person to drop the toy off near.
+                if record_labels:
 
-            drop_position_rt_vision, heading_rt_vision = compute_stand_location_and_yaw(
+                    # Skip the search if someone was seen recently enough.
 
-                vision_tform_person, robot_state_client, distance_margin=2.0)
+                    person, vision_tform_person = recent.get('person', options.person_max_age)
 
+                    if person is not None:
 
+                        print('Using a person seen during the dogtoy search.')
 
-            wait_position_rt_vision, wait_heading_rt_vision = compute_stand_location_and_yaw(
 
-                vision_tform_person, robot_state_client, distance_margin=3.0)
 
+                if (vision_tform_person is None and tracker is not None and
 
+                        not tracker.needs_detection('person', time.time())):
 
-            # Tell the robot to go there
+                    vision_tform_person = tracked_pose(tracker, 'person', time.time())
 
 
 
-            # Limit the speed so we don't charge at the person.
+                while vision_tform_person is None:
 
-            se2_pose = geometry_pb2.SE2Pose(
+                    # Find a person to deliver the toy to
 
-                position=geometry_pb2.Vec2(x=drop_position_rt_vision[0],
+                    with tracing.span('search', label='person'):
 
-                                           y=drop_position_rt_vision[1]), angle=heading_rt_vision)
+                        person, image, vision_tform_person = get_obj_and_img(
 
-            move_cmd = RobotCommandBuilder.synchro_se2_trajectory_command(
+                            network_compute_client, options.ml_service, options.person_model,
 
-                se2_pose, frame_name=frame_helpers.VISION_FRAME_NAME,
+                            options.confidence_person, kImageSources, 'person', executor=executor,
 
-                params=get_walking_params(0.5, 0.5))
+                            early_stop=not options.no_early_stop, preview=preview)
 
-            end_time = 5.0
 
-            cmd_id = command_client.robot_command(command=move_cmd,
 
-                                                  end_time_secs=time.time() + end_time)
+                    if tracker is not None and vision_tform_person is not None:
 
+                        update_track(tracker, 'person', vision_tform_person, time.time())
 
 
-            # Wait until the robot reports that it is at the goal.
 
-            block_for_trajectory_cmd(command_client, cmd_id, timeout_sec=5)
+                # We now have found a person to drop the toy off near.  Solve for the drop and
 
+                # wait positions together.
 
+                positions, headings = compute_stand_locations_and_yaws(
 
-            print('Arrived at goal, dropping object...')
+                    vision_tform_person, state_streamer, distance_margins=[2.0, 3.0])
 
+                drop_position_rt_vision, wait_position_rt_vision = positions
 
+                heading_rt_vision, wait_heading_rt_vision = headings
 
-            time.sleep(1)
 
 
+                # Tell the robot to go there
 
-            print('Backing up and waiting...')
 
 
+                # Limit the speed so we don't charge at the person.
 
-            # Back up one meter and wait for the person to throw the object again.
+                with tracing.span('walk', goal='drop'):
 
-            se2_pose = geometry_pb2.SE2Pose(
+                    walk = trajectory_executor.walk_to(drop_position_rt_vision[0],
 
-                position=geometry_pb2.Vec2(x=wait_position_rt_vision[0],
+                                                       drop_position_rt_vision[1],
 
-                                           y=wait_position_rt_vision[1]),
+                                                       heading_rt_vision, max_linear_vel=0.5,
 
-                angle=wait_heading_rt_vision)
+                                                       max_rotation_vel=0.5)
 
-            move_cmd = RobotCommandBuilder.synchro_se2_trajectory_command(
 
-                se2_pose, frame_name=frame_helpers.VISION_FRAME_NAME,
 
-                params=get_walking_params(0.5, 0.5))
+                    # Wait until the robot reports that it is at the goal.
 
-            end_time = 5.0
+                    walk.wait()
 
-            cmd_id = command_client.robot_command(command=move_cmd,
 
-                                                  end_time_secs=time.time() + end_time)
 
+                print('Arrived at goal, dropping object...')
 
 
-            # Wait until the robot reports that it is at the goal.
 
-            block_for_trajectory_cmd(command_client, cmd_id, timeout_sec=5)
+                if options.drop_pause > 0:
+
+                    with tracing.span('drop_pause'):
+
+                        time.sleep(options.drop_pause)
+
+
+
+                print('Backing up and waiting...')
+
+
+
+                # Back up one meter and wait for the person to throw the object again.
+
+                with tracing.span('walk', goal='wait'):
+
+                    walk = trajectory_executor.walk_to(wait_position_rt_vision[0],
+
+                                                       wait_position_rt_vision[1],
+
+                                                       wait_heading_rt_vision)
+
+
+
+                    # Wait until the robot reports that it is at the goal.
+
+                    walk.wait()
+
+
+
+                num_rpcs, num_blocking_rpcs = state_streamer.reset_counters()
+
+                print('Robot state RPCs this cycle: {} ({} blocking)'.format(
+
+                    num_rpcs, num_blocking_rpcs))
+
+                if dogtoy_roi is not None:
+
+                    print(dogtoy_roi.summary())
+
+
+
+                if tracing.enabled():
+
+                    tracing.record('cycle', cycle_start, time.perf_counter() - cycle_start)
+
+                    print(tracing.summary())
+
+                    if options.trace:
+
+                        tracing.write_chrome_trace(options.trace)
+
+                    if options.metrics:
+
+                        tracing.write_prometheus(options.metrics)
+
+                if recorder is not None:
+
+                    recorder.flush()
+
+                num_cycles += 1
+
+    finally:
+
+        if state_streamer is not None:
+
+            state_streamer.stop()
+
+        if recorder is not None:
+
+            recorder.close()
+
+        if executor is not None:
+
+            executor.shutdown()
+
+        if preview is not None:
+
+            preview.close()
+
+    return True
 
 
 
@@ -601,17 +1237,25 @@ def main(argv):
 
 def compute_stand_location_and_yaw(vision_tform_target, robot_state_client, distance_margin):
 
+    # robot_state_client can be a RobotStateClient or a RobotStateStreamer; both answer
+
+    # get_robot_state().
+
     # Compute drop-off location:
 
     #   Draw a line from Spot to the person
 
     #   Back up 2.0 meters on that line
 
+    with tracing.span('get_robot_state'):
+
+        robot_state = robot_state_client.get_robot_state()
+
     vision_tform_robot = frame_helpers.get_a_tform_b(
 
-        robot_state_client.get_robot_state().kinematic_state.transforms_snapshot,
+        robot_state.kinematic_state.transforms_snapshot, frame_helpers.VISION_FRAME_NAME,
 
-        frame_helpers.VISION_FRAME_NAME, frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME)
+        frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME)
 
 
 
@@ -679,29 +1323,117 @@ def compute_stand_location_and_yaw(vision_tform_target, robot_state_client, dist
 
 
 
-def pose_dist(pose1, pose2):
+def compute_stand_locations_and_yaws(vision_tform_target, robot_state_client, distance_margins):
 
-    diff_vec = [pose1.x - pose2.x, pose1.y - pose2.y, pose1.z - pose2.z]
+    # compute_stand_location_and_yaw for several margins at once, from a single robot state.
 
-    return np.linalg.norm(diff_vec)
+    with tracing.span('get_robot_state'):
+
+        robot_state = robot_state_client.get_robot_state()
+
+    vision_tform_robot = frame_helpers.get_a_tform_b(
 
+        robot_state.kinematic_state.transforms_snapshot, frame_helpers.VISION_FRAME_NAME,
 
+        frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME)
 
 
 
-def get_walking_params(max_linear_vel, max_rotation_vel):
+    margins = np.asarray(distance_margins, dtype=float)
 
-    max_vel_linear = geometry_pb2.Vec2(x=max_linear_vel, y=max_linear_vel)
+    targets = np.repeat(geometry.positions_of([vision_tform_target]), len(margins), axis=0)
 
-    max_vel_se2 = geometry_pb2.SE2Velocity(linear=max_vel_linear, angular=max_rotation_vel)
+    robot_position = [vision_tform_robot.x, vision_tform_robot.y, vision_tform_robot.z]
 
-    vel_limit = geometry_pb2.SE2VelocityLimit(max_vel=max_vel_se2)
+    return geometry.stand_poses(targets, robot_position, margins,
 
-    params = RobotCommandBuilder.mobility_params()
+                                fallback_direction=vision_tform_robot.transform_point(1, 0, 0))
 
-    params.vel_limit.CopyFrom(vel_limit)
 
-    return params
+
+
+
+def approach_while_detecting(trajectory_executor, robot_state_client, detect,
+
+                             vision_tform_target, distance_margin, refine_threshold,
+
+                             max_linear_vel=0.5, max_rotation_vel=0.5):
+
+    # Walk to distance_margin from the target while detect() keeps looking for it.  detect()
+
+    # returns the target's latest pose or None.  Once the estimate is more than
+
+    # refine_threshold from where the current goal was planned, the goal is re-sent.  Returns
+
+    # the finished walk and the last target pose.
+
+    walk_rt_vision, heading_rt_vision = compute_stand_location_and_yaw(
+
+        vision_tform_target, robot_state_client, distance_margin)
+
+    walk = trajectory_executor.walk_to(walk_rt_vision[0], walk_rt_vision[1], heading_rt_vision,
+
+                                       max_linear_vel, max_rotation_vel)
+
+    planned_for = vision_tform_target
+
+
+
+    while not walk.poll():
+
+        vision_tform_seen = detect()
+
+        if vision_tform_seen is None or walk.poll():
+
+            continue
+
+        vision_tform_target = vision_tform_seen
+
+
+
+        if pose_dist(vision_tform_target, planned_for) > refine_threshold:
+
+            walk_rt_vision, heading_rt_vision = compute_stand_location_and_yaw(
+
+                vision_tform_target, robot_state_client, distance_margin)
+
+            walk.update_goal(walk_rt_vision[0], walk_rt_vision[1], heading_rt_vision)
+
+            planned_for = vision_tform_target
+
+
+
+    return walk, vision_tform_target
+
+
+
+
+
+def update_track(tracker, label, vision_tform_obj, stamp):
+
+    tracker.update(label, geometry.positions_of([vision_tform_obj])[0], stamp)
+
+
+
+
+
+def tracked_pose(tracker, label, stamp):
+
+    # The tracker only estimates position, so the pose has no rotation.
+
+    position, _ = tracker.predict(label, stamp)
+
+    return math_helpers.SE3Pose(position[0], position[1], position[2], math_helpers.Quat())
+
+
+
+
+
+def pose_dist(pose1, pose2):
+
+    diff_vec = [pose1.x - pose2.x, pose1.y - pose2.y, pose1.z - pose2.z]
+
+    return np.linalg.norm(diff_vec)
 
 
 
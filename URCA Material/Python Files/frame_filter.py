@@ -0,0 +1,63 @@
+"""Near-duplicate frame filter for capture_images.py.
+
+Each frame is reduced to a 64-bit difference hash (dHash): the image is shrunk to 9x8 grey
+pixels and each bit records whether a pixel is brighter than its right-hand neighbour.  Frames
+whose hash is within a few bits of a recent frame from the same camera are skipped.
+
+Shrinking with INTER_AREA costs well under a millisecond for a fisheye frame, far below the
+decode that capture already pays for.
+"""
+
+import collections
+import threading
+
+import cv2
+import numpy as np
+
+kHashSize = 8
+
+
+def dhash(img):
+    """64-bit difference hash of a grey or BGR image, as a Python int."""
+    small = cv2.resize(img, (kHashSize + 1, kHashSize), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class DuplicateFilter:
+    """Remembers the hashes of the last history kept frames of each camera.
+
+    accept() returns False for a frame within threshold bits of any of them.  Safe to call from
+    several capture workers at once.
+    """
+
+    def __init__(self, threshold=6, history=8):
+        self.threshold = threshold
+        self.history = history
+        self.num_checked = collections.Counter()
+        self.num_skipped = collections.Counter()
+        self._recent = collections.defaultdict(lambda: collections.deque(maxlen=self.history))
+        self._lock = threading.Lock()
+
+    def accept(self, source, img):
+        frame_hash = dhash(img)
+        with self._lock:
+            self.num_checked[source] += 1
+            recent = self._recent[source]
+            if any(hamming(frame_hash, seen) <= self.threshold for seen in recent):
+                self.num_skipped[source] += 1
+                return False
+            recent.append(frame_hash)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return ', '.join('{} skipped {}/{}'.format(source, self.num_skipped[source],
+                                                       self.num_checked[source])
+                             for source in sorted(self.num_checked))
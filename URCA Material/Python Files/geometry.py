@@ -0,0 +1,69 @@
+"""Vectorized versions of the fetch geometry helpers.
+
+Everything here works on arrays of targets so the planner can score every candidate from a
+multi-camera sweep in one call:
+
+    positions = geometry.positions_of(candidate_poses)            # (N, 3)
+    stand, yaw = geometry.stand_poses(positions, robot_xyz, 1.0)  # (N, 3), (N,)
+    dist = geometry.pairwise_distances(positions, [drop_xyz])     # (N, 1)
+
+Headings are atan2 of the horizontal direction from the robot to the target, which is what
+compute_stand_location_and_yaw's rotation-matrix construction gives for targets level with the
+body.
+"""
+
+import numpy as np
+
+# Below this distance (m) the robot is considered to be on top of the target.
+kMinDirectionNorm = 0.01
+
+
+def positions_of(poses):
+    """(N, 3) array of the x, y, z of a list of SE3Pose-like objects."""
+    return np.array([[pose.x, pose.y, pose.z] for pose in poses], dtype=float).reshape(-1, 3)
+
+
+def stand_poses(targets, robot_position, distance_margins, fallback_direction=(1.0, 0.0, 0.0)):
+    """Where to stand, and which way to face, to be distance_margins from each target.
+
+    targets is (N, 3); distance_margins a scalar or (N,) array; robot_position a single (3,)
+    point.  Each stand position lies on the line from the target back towards the robot.  When
+    the robot is on top of a target, fallback_direction is used instead of that line.
+
+    Returns (N, 3) positions and (N,) yaws facing the targets.
+    """
+    targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+    robot_rt_target = np.asarray(robot_position, dtype=float).reshape(1, 3) - targets
+
+    norms = np.linalg.norm(robot_rt_target, axis=1)
+    close = norms < kMinDirectionNorm
+    hats = robot_rt_target / np.where(close, 1.0, norms)[:, np.newaxis]
+    hats[close] = np.asarray(fallback_direction, dtype=float)
+
+    margins = np.asarray(distance_margins, dtype=float).reshape(-1, 1)
+    positions = targets + hats * margins
+
+    # Face the target: x along -hat, z up.
+    yaws = np.arctan2(-hats[:, 1], -hats[:, 0])
+    return positions, yaws
+
+
+def pairwise_distances(a, b):
+    """(N, M) Euclidean distances between the points of a (N, 3) and b (M, 3)."""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    a = a.reshape(-1, a.shape[-1])
+    b = b.reshape(-1, b.shape[-1])
+    return np.linalg.norm(a[:, np.newaxis, :] - b[np.newaxis, :, :], axis=-1)
+
+
+def polygon_vertices(polygons):
+    """(N, K, 2) array from a list of Polygon protos that all have K vertices."""
+    return np.array([[[v.x, v.y] for v in polygon.vertexes] for polygon in polygons],
+                    dtype=float).reshape(len(polygons), -1, 2)
+
+
+def polygon_centers(vertices):
+    """Centers of the bounding boxes of (N, K, 2) polygon vertices, as an (N, 2) array."""
+    vertices = np.asarray(vertices, dtype=float)
+    return (vertices.min(axis=1) + vertices.max(axis=1)) / 2.0
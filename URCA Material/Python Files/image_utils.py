@@ -0,0 +1,131 @@
+"""Decoding helpers for Spot image protos, shared by fetch.py and capture_images.py.
+
+Image bytes are wrapped with np.frombuffer instead of being copied, and the arrays produced by
+colour conversion and rotation come from a small pool of reusable buffers.  A pooled array is
+only valid until the pool hands the same buffer out again, so copy it if you need to keep it.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+from google.protobuf import wrappers_pb2
+
+from bosdyn.api import image_pb2
+
+# Channel count and dtype of each raw pixel format.
+kRawPixelFormats = {
+    image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8: (1, np.uint8),
+    image_pb2.Image.PIXEL_FORMAT_RGB_U8: (3, np.uint8),
+    image_pb2.Image.PIXEL_FORMAT_RGBA_U8: (4, np.uint8),
+    image_pb2.Image.PIXEL_FORMAT_DEPTH_U16: (1, np.uint16),
+    image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U16: (1, np.uint16),
+}
+
+
+class BufferPool:
+    """Hands out arrays of a given shape and dtype round-robin from a fixed set per shape.
+
+    With depth buffers per shape, the last depth - 1 arrays handed out stay untouched.
+    """
+
+    def __init__(self, depth=2):
+        self.depth = depth
+        self._buffers = {}
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def take(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers is None:
+                buffers = [np.empty(shape, dtype) for _ in range(self.depth)]
+                self._buffers[key] = buffers
+                self._next[key] = 0
+            index = self._next[key]
+            self._next[key] = (index + 1) % self.depth
+        return buffers[index]
+
+
+def image_data_view(image):
+    """A read-only uint8 view of an image_pb2.Image's data.  No copy is made."""
+    return np.frombuffer(memoryview(image.data), dtype=np.uint8)
+
+
+def decode_image(image):
+    """Decode an image_pb2.Image to a numpy array.
+
+    RAW images come back as a read-only view of the proto's bytes.  Compressed images go
+    through cv2.imdecode, which allocates the output itself.
+    """
+    data = image_data_view(image)
+    if image.format == image_pb2.Image.FORMAT_RAW:
+        channels, dtype = kRawPixelFormats.get(image.pixel_format, (1, np.uint8))
+        pixels = data.view(dtype)
+        if channels == 1:
+            return pixels.reshape(image.rows, image.cols)
+        return pixels.reshape(image.rows, image.cols, channels)
+    return cv2.imdecode(data, -1)
+
+
+def to_bgr(img, pool=None):
+    """Convert a grey image to BGR, writing into a pooled buffer.
+
+    Colour images are returned as they are, copied first if they are a read-only view so they
+    can be drawn on.
+    """
+    if img.ndim == 3:
+        if img.flags.writeable:
+            return img
+        if pool is None:
+            return img.copy()
+        out = pool.take(img.shape, img.dtype)
+        np.copyto(out, img)
+        return out
+    if pool is None:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR, dst=pool.take(img.shape + (3,), img.dtype))
+
+
+# Rotation that approximately levels each camera's image.
+def rotation_for_source(source_name):
+    if source_name[0:5] == "front":
+        return cv2.ROTATE_90_CLOCKWISE
+    elif source_name[0:5] == "right":
+        return cv2.ROTATE_180
+    return None
+
+
+def rotate(img, rotate_code, pool=None):
+    """cv2.rotate into a pooled buffer.  A rotate_code of None returns img unchanged."""
+    if rotate_code is None:
+        return img
+    if pool is None:
+        return cv2.rotate(img, rotate_code)
+    if rotate_code == cv2.ROTATE_180:
+        shape = img.shape
+    else:
+        shape = (img.shape[1], img.shape[0]) + img.shape[2:]
+    return cv2.rotate(img, rotate_code, dst=pool.take(shape, img.dtype))
+
+
+def draw_detections(img, objects):
+    """Draw the bounding box and caption of every object_in_image onto a BGR image."""
+    for obj in objects:
+        vertexes = obj.image_properties.coordinates.vertexes
+        if len(vertexes) == 0:
+            continue
+
+        conf_msg = wrappers_pb2.FloatValue()
+        obj.additional_properties.Unpack(conf_msg)
+        confidence = conf_msg.value
+
+        polygon = np.array([[v.x, v.y] for v in vertexes], np.int32).reshape((-1, 1, 2))
+        cv2.polylines(img, [polygon], True, (0, 255, 0), 2)
+
+        min_x, min_y = polygon.reshape(-1, 2).min(axis=0)
+        caption = "{} {:.3f}".format(obj.name, confidence)
+        cv2.putText(img, caption, (int(min_x), int(min_y)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (0, 255, 0), 2)
+    return img
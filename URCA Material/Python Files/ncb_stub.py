@@ -0,0 +1,118 @@
+"""Local stand-in for the robot's NetworkComputeBridge service.
+
+Serves canned detections over an insecure gRPC port so the fetch client code can be exercised
+and timed without Spot or the Core I/O.
+"""
+
+import random
+import time
+from concurrent import futures
+
+import grpc
+import numpy as np
+from google.protobuf import wrappers_pb2
+
+from bosdyn.api import (header_pb2, image_pb2, network_compute_bridge_pb2,
+                        network_compute_bridge_service_pb2_grpc)
+from bosdyn.client import frame_helpers
+from bosdyn.client.network_compute_bridge_client import NetworkComputeBridgeClient
+
+kStubImageRows = 480
+kStubImageCols = 640
+
+
+class StubNetworkComputeBridgeServicer(
+        network_compute_bridge_service_pb2_grpc.NetworkComputeBridgeServicer):
+    """Answers every request after a fixed latency (plus jitter).
+
+    Requests for a source listed in hit_sources get one detection with the given label, all
+    other sources come back empty.  target_xyz is the detection's position in vision, or a
+    function returning it, for a target that moves.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, hit_sources=(), label='dogtoy',
+                 confidence=0.9, target_xyz=(2.0, 0.0, 0.0)):
+        super(StubNetworkComputeBridgeServicer, self).__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.hit_sources = set(hit_sources)
+        self.label = label
+        self.confidence = confidence
+        self.target_xyz = target_xyz
+        self.num_requests = 0
+
+        # Every response carries the same blank camera image.
+        self._image_data = np.zeros((kStubImageRows, kStubImageCols), np.uint8).tobytes()
+
+    def NetworkCompute(self, request, context):
+        self.num_requests += 1
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        response = network_compute_bridge_pb2.NetworkComputeResponse()
+        response.header.error.code = header_pb2.CommonError.CODE_OK
+        response.status = network_compute_bridge_pb2.NETWORK_COMPUTE_STATUS_SUCCESS
+
+        source = request.input_data.image_source_and_service.image_source
+        image = response.image_response.shot.image
+        response.image_response.source.name = source
+        image.format = image_pb2.Image.FORMAT_RAW
+        image.pixel_format = image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8
+        image.rows = kStubImageRows
+        image.cols = kStubImageCols
+        image.data = self._image_data
+
+        if source in self.hit_sources and self.confidence >= request.input_data.min_confidence:
+            target_xyz = self.target_xyz() if callable(self.target_xyz) else self.target_xyz
+            add_stub_object(response, self.label, self.confidence, target_xyz)
+
+        return response
+
+    def ListAvailableModels(self, request, context):
+        response = network_compute_bridge_pb2.ListAvailableModelsResponse()
+        response.header.error.code = header_pb2.CommonError.CODE_OK
+        response.status = network_compute_bridge_pb2.NETWORK_COMPUTE_STATUS_SUCCESS
+        return response
+
+
+def add_stub_object(response, label, confidence, target_xyz, box=(270, 190, 370, 290)):
+    """Append a detection to response the same way the NCB does: a bounding box, the
+    confidence packed into additional_properties and a frame tree placing it in vision."""
+    obj = response.object_in_image.add()
+    obj.name = 'obj{}_label_{}'.format(len(response.object_in_image) - 1, label)
+    obj.additional_properties.Pack(wrappers_pb2.FloatValue(value=confidence))
+
+    min_x, min_y, max_x, max_y = box
+    for x, y in ((min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)):
+        vertex = obj.image_properties.coordinates.vertexes.add()
+        vertex.x = x
+        vertex.y = y
+
+    object_frame = obj.name
+    obj.image_properties.frame_name_image_coordinates = object_frame
+    edges = obj.transforms_snapshot.child_to_parent_edge_map
+    edges[frame_helpers.VISION_FRAME_NAME].parent_frame_name = ''
+    edge = edges[object_frame]
+    edge.parent_frame_name = frame_helpers.VISION_FRAME_NAME
+    edge.parent_tform_child.position.x = target_xyz[0]
+    edge.parent_tform_child.position.y = target_xyz[1]
+    edge.parent_tform_child.position.z = target_xyz[2]
+    edge.parent_tform_child.rotation.w = 1.0
+    return obj
+
+
+def serve(servicer, port=0, max_workers=16):
+    """Start servicer on localhost.  Returns the running server and the port it bound."""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
+    network_compute_bridge_service_pb2_grpc.add_NetworkComputeBridgeServicer_to_server(
+        servicer, server)
+    port = server.add_insecure_port('localhost:{}'.format(port))
+    server.start()
+    return server, port
+
+
+def create_client(port):
+    """A NetworkComputeBridgeClient talking to a stub on localhost instead of the robot."""
+    client = NetworkComputeBridgeClient()
+    # Setting the channel creates the gRPC stub, as Robot.ensure_client would.
+    client.channel = grpc.insecure_channel('localhost:{}'.format(port))
+    return client
@@ -0,0 +1,71 @@
+"""Preview window that renders on its own thread.
+
+The control loop hands frames to show() and carries on.  Frames wait in a small bounded queue
+that drops the oldest frame when full, so a slow display never backs up into detection or
+navigation.
+"""
+
+import collections
+import threading
+
+import cv2
+
+
+class PreviewWindow:
+
+    def __init__(self, window_name, render=None, max_queued=2, refresh_ms=15):
+        """render turns whatever is passed to show() into an image, on the display thread.
+        By default frames are shown as they are."""
+        self.window_name = window_name
+        self.render = render
+        self.refresh_ms = refresh_ms
+        self.num_shown = 0
+        self.num_dropped = 0
+
+        self._frames = collections.deque(maxlen=max_queued)
+        self._lock = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.window_name + ' preview')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def show(self, frame):
+        """Queue a frame for display.  Never blocks."""
+        with self._lock:
+            if len(self._frames) == self._frames.maxlen:
+                self.num_dropped += 1
+            self._frames.append(frame)
+            self._lock.notify()
+
+    def close(self):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        cv2.namedWindow(self.window_name)
+        while True:
+            with self._lock:
+                if not self._frames and self._running:
+                    self._lock.wait(self.refresh_ms / 1000.0)
+                if not self._running:
+                    break
+                frame = self._frames.popleft() if self._frames else None
+
+            if frame is not None:
+                img = self.render(frame) if self.render is not None else frame
+                cv2.imshow(self.window_name, img)
+                self.num_shown += 1
+
+            # Keeps the window responsive even when no new frames arrive.
+            cv2.waitKey(1)
+
+        cv2.destroyWindow(self.window_name)
@@ -0,0 +1,166 @@
+"""Record the NetworkComputeBridge responses fetch.py gets, and play them back later.
+
+A log is one append-only file:
+
+    b'SPOTLOG1', then records of
+    [float64 request time][float64 response time][uint16 type length][uint32 data length]
+    [protobuf type name][serialized message]
+
+Times are time.time() seconds, taken when the request went out and when its answer came back.
+Each NetworkComputeResponse carries the ImageResponse it was run on, so the images are in the
+log too; read_images() pulls them out for decode benchmarks.  A record cut short by a crash
+ends the log.
+
+    recorder = ResponseRecorder('run.log')
+    client = RecordingClient(network_compute_client, recorder)
+    ...
+    client = ReplayClient('run.log', real_time=False)
+"""
+
+import collections
+import os
+import struct
+import threading
+import time
+
+from bosdyn.api import header_pb2, image_pb2, network_compute_bridge_pb2
+
+kMagic = b'SPOTLOG1'
+kRecordHeader = struct.Struct('<ddHI')
+
+kMessageTypes = {
+    message_class.DESCRIPTOR.full_name: message_class
+    for message_class in (network_compute_bridge_pb2.NetworkComputeResponse,
+                          image_pb2.ImageResponse)
+}
+
+LogRecord = collections.namedtuple('LogRecord', ['request_time', 'response_time', 'message'])
+
+
+class ResponseRecorder:
+    """Appends messages to a log.  Safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.num_records = 0
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(kMagic)
+        self._lock = threading.Lock()
+
+    def write(self, message, request_time, response_time):
+        type_name = message.DESCRIPTOR.full_name.encode('utf-8')
+        data = message.SerializeToString()
+        header = kRecordHeader.pack(request_time, response_time, len(type_name), len(data))
+        with self._lock:
+            # One write per record, so a crash loses at most the record being written.
+            self._file.write(header + type_name + data)
+            self.num_records += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_log(path):
+    """Yield the LogRecords in the log at path, in the order they were written."""
+    with open(path, 'rb') as log_file:
+        if log_file.read(len(kMagic)) != kMagic:
+            raise ValueError('{} is not a response log'.format(path))
+        while True:
+            header = log_file.read(kRecordHeader.size)
+            if len(header) < kRecordHeader.size:
+                return
+            request_time, response_time, type_length, data_length = kRecordHeader.unpack(header)
+            type_name = log_file.read(type_length).decode('utf-8')
+            data = log_file.read(data_length)
+            if len(data) < data_length:
+                return
+            if type_name not in kMessageTypes:
+                raise ValueError('Unknown message type {} in {}'.format(type_name, path))
+            message = kMessageTypes[type_name]()
+            message.ParseFromString(data)
+            yield LogRecord(request_time, response_time, message)
+
+
+def read_images(path):
+    """Yield every ImageResponse in the log, including those inside NCB responses."""
+    for record in read_log(path):
+        if isinstance(record.message, image_pb2.ImageResponse):
+            yield record.message
+        elif record.message.HasField('image_response'):
+            yield record.message.image_response
+
+
+class RecordingClient:
+    """Wraps a NetworkComputeBridgeClient and logs every response it returns."""
+
+    def __init__(self, network_compute_client, recorder):
+        self.network_compute_client = network_compute_client
+        self.recorder = recorder
+
+    def network_compute_bridge_command(self, request, **kwargs):
+        request_time = time.time()
+        response = self.network_compute_client.network_compute_bridge_command(request, **kwargs)
+        self.recorder.write(response, request_time, time.time())
+        return response
+
+
+class ReplayClient:
+    """Answers network_compute_bridge_command from a log instead of the NCB.
+
+    Each camera gets its own recorded responses back in order, so the replay does not depend
+    on the order concurrent requests are made in.  With real_time, every answer takes as long as
+    it did when recorded; otherwise answers come back immediately.  With loop, a camera that
+    runs out starts over; without, it raises EOFError.  Cameras missing from the log get an
+    empty response.
+    """
+
+    def __init__(self, path, real_time=True, loop=True):
+        self.path = path
+        self.real_time = real_time
+        self.loop = loop
+        self.num_requests = 0
+
+        self._responses = collections.defaultdict(list)
+        for record in read_log(path):
+            if isinstance(record.message, network_compute_bridge_pb2.NetworkComputeResponse):
+                source = record.message.image_response.source.name
+                self._responses[source].append(
+                    (record.response_time - record.request_time, record.message))
+        self._next = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(responses) for responses in self._responses.values())
+
+    def _take(self, source):
+        responses = self._responses.get(source)
+        if not responses:
+            return 0.0, None
+        with self._lock:
+            index = self._next[source]
+            if index >= len(responses):
+                if not self.loop:
+                    raise EOFError('{} has no more responses for {}'.format(
+                        os.path.basename(self.path), source))
+                index = 0
+            self._next[source] = index + 1
+            self.num_requests += 1
+        return responses[index]
+
+    def network_compute_bridge_command(self, request, **kwargs):
+        source = request.input_data.image_source_and_service.image_source
+        latency, response = self._take(source)
+        if response is None:
+            response = network_compute_bridge_pb2.NetworkComputeResponse()
+            response.header.error.code = header_pb2.CommonError.CODE_OK
+            response.status = network_compute_bridge_pb2.NETWORK_COMPUTE_STATUS_SUCCESS
+            response.image_response.source.name = source
+        if self.real_time and latency > 0:
+            time.sleep(latency)
+        return response
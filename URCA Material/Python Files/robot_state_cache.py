@@ -0,0 +1,94 @@
+"""Background robot-state streamer for the fetch navigation helpers.
+
+A thread polls the robot state service and keeps the latest answer with the time it arrived.
+Readers get that cached state as long as it is fresher than their staleness limit, and only
+pay for a blocking RPC when it isn't.
+"""
+
+import threading
+import time
+
+
+class RobotStateStreamer:
+    """Drop-in for RobotStateClient.get_robot_state() backed by a periodically refreshed cache.
+
+    num_rpcs counts every robot state RPC made, num_blocking_rpcs the ones a caller had to wait
+    for because the cache was too old.
+    """
+
+    def __init__(self, robot_state_client, period=0.2, max_age=0.5):
+        self.robot_state_client = robot_state_client
+        self.period = period
+        self.max_age = max_age
+        self.num_rpcs = 0
+        self.num_blocking_rpcs = 0
+
+        self._state = None
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='robot state streamer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._refresh()
+            except Exception as err:
+                # Keep streaming through transient comms errors; readers fall back to a
+                # blocking call once the cache goes stale.
+                print('Robot state update failed: ' + str(err))
+            self._stop.wait(self.period)
+
+    def _refresh(self):
+        state = self.robot_state_client.get_robot_state()
+        with self._lock:
+            self._state = state
+            self._stamp = time.time()
+            self.num_rpcs += 1
+        return state
+
+    def age(self):
+        """Seconds since the cached state arrived, or None if there is none yet."""
+        with self._lock:
+            if self._stamp is None:
+                return None
+            return time.time() - self._stamp
+
+    def get_robot_state(self, max_age=None):
+        """The latest robot state, no older than max_age seconds (default: self.max_age)."""
+        if max_age is None:
+            max_age = self.max_age
+        with self._lock:
+            state = self._state
+            stamp = self._stamp
+        if state is not None and time.time() - stamp <= max_age:
+            return state
+
+        state = self._refresh()
+        with self._lock:
+            self.num_blocking_rpcs += 1
+        return state
+
+    def get_transforms_snapshot(self, max_age=None):
+        return self.get_robot_state(max_age).kinematic_state.transforms_snapshot
+
+    def reset_counters(self):
+        """Return (num_rpcs, num_blocking_rpcs) since the last reset and zero them."""
+        with self._lock:
+            counts = (self.num_rpcs, self.num_blocking_rpcs)
+            self.num_rpcs = 0
+            self.num_blocking_rpcs = 0
+        return counts
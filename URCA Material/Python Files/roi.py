@@ -0,0 +1,104 @@
+"""Search only around where the target was last seen.
+
+Once a search finds the target, RegionOfInterest remembers the camera and a padded window around
+its bounding box.  The next search asks only that camera, and packs the window into the
+request's other_data for the fetch_detector server, which crops (and optionally shrinks) the
+image before running the model and maps the boxes back to full image pixels.  When a windowed
+search misses, the target counts as lost and the next search is a full one over every camera.
+
+    roi = RegionOfInterest(pad=0.5)
+    sources, windows = roi.plan(kImageSources)
+    obj, image, pose = get_obj_and_img(..., sources, ..., roi_windows=windows, roi_scale=0.5)
+    roi.update(obj, image)
+"""
+
+from google.protobuf import struct_pb2
+
+
+def pack_roi(input_data, window, scale=1.0):
+    """Ask the server to run on window (x_min, y_min, x_max, y_max) of the image only."""
+    params = struct_pb2.Struct()
+    params.update({'roi': list(window), 'roi_scale': scale})
+    input_data.other_data.Pack(params)
+
+
+class RegionOfInterest:
+    """The camera and window to search next for one target.
+
+    The window is the last bounding box grown by pad times its size on every side, and at least
+    min_size pixels across.
+    """
+
+    def __init__(self, pad=0.5, min_size=160):
+        self.pad = pad
+        self.min_size = min_size
+        self.source = None
+        self.window = None
+        self.num_full_searches = 0
+        self.num_roi_searches = 0
+        self.num_lost = 0
+        # Pixels searched, and what searching every camera in full would have cost.
+        self.roi_pixels = 0
+        self.full_pixels = 0
+        self._frame_pixels = 0
+        self._num_sources = 0
+        self._num_planned = 0
+
+    def active(self):
+        return self.source is not None
+
+    def plan(self, image_sources):
+        """The cameras to ask and, per camera, the window to send (None for full frames)."""
+        self._num_sources = len(image_sources)
+        if not self.active():
+            self.num_full_searches += 1
+            self._num_planned = len(image_sources)
+            return image_sources, None
+        self.num_roi_searches += 1
+        self._num_planned = 1
+        return [self.source], {self.source: self.window}
+
+    def update(self, obj, image_response, scale=1.0):
+        """Record the result of a search planned by plan()."""
+        image = image_response.shot.image if image_response is not None else None
+        if image is not None and image.rows and image.cols:
+            self._frame_pixels = image.rows * image.cols
+        was_active = self.active()
+        self.full_pixels += self._frame_pixels * self._num_sources
+        if was_active:
+            x_min, y_min, x_max, y_max = self.window
+            self.roi_pixels += (x_max - x_min) * (y_max - y_min) * scale * scale
+        else:
+            self.roi_pixels += self._frame_pixels * self._num_planned
+
+        if obj is None:
+            if was_active:
+                self.num_lost += 1
+            self.source = None
+            self.window = None
+            return
+
+        xs = [vertex.x for vertex in obj.image_properties.coordinates.vertexes]
+        ys = [vertex.y for vertex in obj.image_properties.coordinates.vertexes]
+        width = max(max(xs) - min(xs), 1.0)
+        height = max(max(ys) - min(ys), 1.0)
+        half_width = max(width * (0.5 + self.pad), self.min_size / 2.0)
+        half_height = max(height * (0.5 + self.pad), self.min_size / 2.0)
+        center_x = (max(xs) + min(xs)) / 2.0
+        center_y = (max(ys) + min(ys)) / 2.0
+
+        x_min, y_min = center_x - half_width, center_y - half_height
+        x_max, y_max = center_x + half_width, center_y + half_height
+        if image is not None and image.rows and image.cols:
+            x_min, y_min = max(0.0, x_min), max(0.0, y_min)
+            x_max, y_max = min(float(image.cols), x_max), min(float(image.rows), y_max)
+        self.source = image_response.source.name
+        self.window = (x_min, y_min, x_max, y_max)
+
+    def summary(self):
+        searches = self.num_full_searches + self.num_roi_searches
+        if not searches or not self.full_pixels:
+            return 'ROI: no searches'
+        return ('ROI: {} of {} searches windowed, target lost {} times, {:.0%} of full-frame '
+                'pixels searched'.format(self.num_roi_searches, searches, self.num_lost,
+                                         self.roi_pixels / self.full_pixels))
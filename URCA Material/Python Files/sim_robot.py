@@ -0,0 +1,222 @@
+"""A kinematic stand-in for Spot's robot state and robot command clients.
+
+SimulatedRobot walks its body straight towards the goal of the last SE2 trajectory command,
+turning at the same time, at the command's velocity limits.  It answers the calls the fetch
+helpers make:
+
+    get_robot_state()
+    robot_command(command, end_time_secs=None) / robot_command_async(...)
+    robot_command_feedback(cmd_id) / robot_command_feedback_async(...)
+
+so TrajectoryExecutor, RobotStateStreamer and the stand-pose helpers can run on a laptop.  The
+pose is integrated lazily on every call; there is no simulation thread.
+
+Every call goes through a Link, which can add latency, jitter and packet loss.
+"""
+
+import math
+import random
+import threading
+import time
+from concurrent import futures
+
+from bosdyn.api import basic_command_pb2, robot_command_pb2, robot_state_pb2
+from bosdyn.api.spot import robot_command_pb2 as spot_command_pb2
+from bosdyn.client import frame_helpers, math_helpers
+from bosdyn.client.exceptions import TimedOutError
+
+kTrajectoryFeedback = basic_command_pb2.SE2TrajectoryCommand.Feedback
+kFeedbackStatus = basic_command_pb2.RobotCommandFeedbackStatus
+
+# Within these of the goal counts as there.
+kGoalTolerance = 0.05
+kGoalAngleTolerance = 0.05
+
+# Limits used when a command doesn't set any (m/s, rad/s).
+kDefaultLinearVel = 1.0
+kDefaultRotationVel = 1.0
+
+
+def angle_diff(a, b):
+    return math.atan2(math.sin(a - b), math.cos(a - b))
+
+
+class Link:
+    """What the network does to a fake RPC.
+
+    Each call is delayed by latency plus up to jitter seconds.  With probability loss the call is
+    lost instead: it raises TimedOutError after timeout seconds, as a real client would.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, timeout=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.timeout = timeout
+        self.num_calls = 0
+        self.num_lost = 0
+
+    def call(self, fn, *args):
+        self.num_calls += 1
+        if self.loss > 0 and random.random() < self.loss:
+            self.num_lost += 1
+            time.sleep(self.timeout)
+            raise TimedOutError(None, 'Simulated packet loss')
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return fn(*args)
+
+
+class SimulatedRobot:
+    """Body pose in the vision frame, moved by SE2 trajectory commands.
+
+    latency adds that many seconds to every RPC; pass a Link instead for jitter and loss.
+    """
+
+    def __init__(self, x=0.0, y=0.0, yaw=0.0, height=0.5, latency=0.0, link=None):
+        self.x = x
+        self.y = y
+        self.yaw = yaw
+        self.height = height
+        self.link = link if link is not None else Link(latency)
+        self.num_commands = 0
+        self.num_feedback_requests = 0
+        self.num_state_requests = 0
+
+        self._goal = None
+        self._linear_vel = kDefaultLinearVel
+        self._rotation_vel = kDefaultRotationVel
+        self._end_time = None
+        self._cmd_id = 0
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+        self._executor = futures.ThreadPoolExecutor(max_workers=4)
+
+    def _rpc(self, fn, *args):
+        return self.link.call(fn, *args)
+
+    def _async(self, fn, *args):
+        return self._executor.submit(self._rpc, fn, *args)
+
+    def _advance(self, now):
+        dt = max(0.0, now - self._stamp)
+        self._stamp = now
+        if self._goal is None:
+            return
+        if self._end_time is not None and now > self._end_time:
+            # The command expired: the robot stops where it is.
+            dt = max(0.0, dt - (now - self._end_time))
+            if dt == 0.0:
+                return
+
+        goal_x, goal_y, goal_yaw = self._goal
+        dx = goal_x - self.x
+        dy = goal_y - self.y
+        distance = math.hypot(dx, dy)
+        step = min(distance, self._linear_vel * dt)
+        if distance > 0:
+            self.x += dx / distance * step
+            self.y += dy / distance * step
+
+        turn = angle_diff(goal_yaw, self.yaw)
+        self.yaw += math.copysign(min(abs(turn), self._rotation_vel * dt), turn)
+
+    def _at_goal(self):
+        if self._goal is None:
+            return False
+        goal_x, goal_y, goal_yaw = self._goal
+        return (math.hypot(goal_x - self.x, goal_y - self.y) <= kGoalTolerance and
+                abs(angle_diff(goal_yaw, self.yaw)) <= kGoalAngleTolerance)
+
+    def vision_tform_body(self):
+        with self._lock:
+            self._advance(time.time())
+            return math_helpers.SE3Pose(self.x, self.y, self.height,
+                                        math_helpers.Quat.from_yaw(self.yaw))
+
+    # RobotStateClient
+
+    def _robot_state(self):
+        self.num_state_requests += 1
+        state = robot_state_pb2.RobotState()
+        body_pose = self.vision_tform_body().to_proto()
+        edges = state.kinematic_state.transforms_snapshot.child_to_parent_edge_map
+        edges[frame_helpers.VISION_FRAME_NAME].parent_frame_name = ''
+        for frame in (frame_helpers.BODY_FRAME_NAME, frame_helpers.GRAV_ALIGNED_BODY_FRAME_NAME):
+            edge = edges[frame]
+            edge.parent_frame_name = frame_helpers.VISION_FRAME_NAME
+            edge.parent_tform_child.CopyFrom(body_pose)
+        edge = edges[frame_helpers.ODOM_FRAME_NAME]
+        edge.parent_frame_name = frame_helpers.VISION_FRAME_NAME
+        edge.parent_tform_child.rotation.w = 1.0
+        state.kinematic_state.acquisition_timestamp.FromNanoseconds(int(time.time() * 1e9))
+        return state
+
+    def get_robot_state(self, **kwargs):
+        return self._rpc(self._robot_state)
+
+    def get_robot_state_async(self, **kwargs):
+        return self._async(self._robot_state)
+
+    # RobotCommandClient
+
+    def _command(self, command, end_time_secs):
+        mobility = command.synchronized_command.mobility_command
+        with self._lock:
+            self._advance(time.time())
+            self.num_commands += 1
+            self._cmd_id += 1
+            if mobility.HasField('se2_trajectory_request'):
+                point = mobility.se2_trajectory_request.trajectory.points[-1].pose
+                self._goal = (point.position.x, point.position.y, point.angle)
+                params = spot_command_pb2.MobilityParams()
+                if mobility.params.Unpack(params) and params.HasField('vel_limit'):
+                    self._linear_vel = params.vel_limit.max_vel.linear.x or kDefaultLinearVel
+                    self._rotation_vel = params.vel_limit.max_vel.angular or kDefaultRotationVel
+                else:
+                    self._linear_vel = kDefaultLinearVel
+                    self._rotation_vel = kDefaultRotationVel
+                self._end_time = end_time_secs
+            else:
+                # Stand, sit and velocity commands all just hold the robot where it is.
+                self._goal = None
+                self._end_time = None
+            return self._cmd_id
+
+    def robot_command(self, command, end_time_secs=None, **kwargs):
+        return self._rpc(self._command, command, end_time_secs)
+
+    def robot_command_async(self, command, end_time_secs=None, **kwargs):
+        return self._async(self._command, command, end_time_secs)
+
+    def _feedback(self, cmd_id):
+        response = robot_command_pb2.RobotCommandFeedbackResponse()
+        mobility_feedback = response.feedback.synchronized_feedback.mobility_command_feedback
+        trajectory_feedback = mobility_feedback.se2_trajectory_feedback
+        with self._lock:
+            self.num_feedback_requests += 1
+            now = time.time()
+            self._advance(now)
+            if cmd_id != self._cmd_id:
+                mobility_feedback.status = kFeedbackStatus.STATUS_COMMAND_OVERRIDDEN
+            elif self._at_goal():
+                mobility_feedback.status = kFeedbackStatus.STATUS_PROCESSING
+                trajectory_feedback.status = kTrajectoryFeedback.STATUS_AT_GOAL
+                trajectory_feedback.body_movement_status = kTrajectoryFeedback.BODY_STATUS_SETTLED
+            elif self._end_time is not None and now > self._end_time:
+                mobility_feedback.status = kFeedbackStatus.STATUS_COMMAND_TIMED_OUT
+            else:
+                mobility_feedback.status = kFeedbackStatus.STATUS_PROCESSING
+                trajectory_feedback.status = kTrajectoryFeedback.STATUS_GOING_TO_GOAL
+                trajectory_feedback.body_movement_status = kTrajectoryFeedback.BODY_STATUS_MOVING
+        return response
+
+    def robot_command_feedback(self, cmd_id, **kwargs):
+        return self._rpc(self._feedback, cmd_id)
+
+    def robot_command_feedback_async(self, cmd_id, **kwargs):
+        return self._async(self._feedback, cmd_id)
+
+    def shutdown(self):
+        self._executor.shutdown()
@@ -0,0 +1,264 @@
+"""Controller-to-robot command streaming for xbox_spot_control.py.
+
+JoystickReader handles pygame events on its own thread as they arrive and publishes the latest
+deadbanded, smoothed stick state plus a queue of button presses.  The command loop reads that
+state at its own rate and hands it to VelocityStreamer, which only sends a velocity command
+when the sticks have changed, or when a keep-alive is due to keep a held velocity from expiring,
+and never more than max_rate times a second.  Commands go out with robot_command_async so a
+slow RPC never holds up the controller.
+
+MockCommandClient stands in for the robot's RobotCommandClient to try the controller without a
+robot.
+"""
+
+import collections
+import math
+import queue
+import threading
+import time
+from concurrent import futures
+
+import pygame
+
+from bosdyn.client.robot_command import RobotCommandBuilder
+
+
+def apply_deadband(value, deadband):
+    """0 inside the deadband, rescaled so output still spans [-1, 1] outside it."""
+    if abs(value) <= deadband:
+        return 0.0
+    scaled = (abs(value) - deadband) / (1.0 - deadband)
+    return scaled if value > 0 else -scaled
+
+
+class JoystickReader:
+    """Reads one joystick on a background thread.
+
+    Axis values are deadbanded, then smoothed with a time constant of smoothing seconds (0 to
+    disable).  latest() returns the smoothed axes and the time of the last axis event; presses()
+    returns the buttons pressed since the last call, one entry per press.
+    """
+
+    def __init__(self, joystick, axes=(0, 1, 2), deadband=0.1, smoothing=0.05,
+                 idle_timeout_ms=10):
+        self.joystick = joystick
+        self.axes = axes
+        self.deadband = deadband
+        self.smoothing = smoothing
+        self.idle_timeout_ms = idle_timeout_ms
+        self.num_events = 0
+
+        self._targets = [0.0] * len(axes)
+        self._smoothed = [0.0] * len(axes)
+        self._stamp = time.time()
+        self._smoothed_at = self._stamp
+        self._presses = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='joystick reader')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        instance_id = self.joystick.get_instance_id()
+        while not self._stop.is_set():
+            # Wake on the next event, or after a short idle so smoothing keeps converging.
+            event = pygame.event.wait(self.idle_timeout_ms)
+            events = [event] + pygame.event.get() if event.type != pygame.NOEVENT else []
+            now = time.time()
+            with self._lock:
+                for event in events:
+                    if getattr(event, 'instance_id', instance_id) != instance_id:
+                        continue
+                    if event.type == pygame.JOYAXISMOTION and event.axis in self.axes:
+                        index = self.axes.index(event.axis)
+                        self._targets[index] = apply_deadband(event.value, self.deadband)
+                        self._stamp = now
+                        self.num_events += 1
+                    elif event.type == pygame.JOYBUTTONDOWN:
+                        self._presses.put(event.button)
+                        self.num_events += 1
+                self._smooth(now)
+
+    def _smooth(self, now):
+        if self.smoothing <= 0:
+            self._smoothed = list(self._targets)
+        else:
+            alpha = 1.0 - math.exp(-(now - self._smoothed_at) / self.smoothing)
+            self._smoothed = [
+                smoothed + alpha * (target - smoothed)
+                for smoothed, target in zip(self._smoothed, self._targets)
+            ]
+            # Snap once close, so centered sticks really send zero.
+            self._smoothed = [
+                target if abs(target - smoothed) < 1e-3 else smoothed
+                for smoothed, target in zip(self._smoothed, self._targets)
+            ]
+        self._smoothed_at = now
+
+    def latest(self):
+        """(axis values, stamp of the last axis event)."""
+        with self._lock:
+            return tuple(self._smoothed), self._stamp
+
+    def presses(self):
+        pressed = []
+        while True:
+            try:
+                pressed.append(self._presses.get_nowait())
+            except queue.Empty:
+                return pressed
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class VelocityStreamer:
+    """Sends synchro velocity commands on change or keep-alive, rate limited.
+
+    Each velocity command lasts command_duration seconds on the robot, so the robot stops by
+    itself if this process or the link dies.  keepalive must be shorter than that.
+
+    Metrics: num_sends (velocity and discrete commands), num_busy (updates that found the
+    previous command still in flight), and the latency from the input change to its send.
+    """
+
+    def __init__(self, command_client, max_rate=10.0, keepalive=0.5, command_duration=0.8,
+                 change_threshold=0.02):
+        self.command_client = command_client
+        self.min_interval = 1.0 / max_rate
+        self.keepalive = keepalive
+        self.command_duration = command_duration
+        self.change_threshold = change_threshold
+        self.num_sends = 0
+        self.num_busy = 0
+        self.num_errors = 0
+        self.latencies = collections.deque(maxlen=1000)
+        self.start_time = time.time()
+
+        self._sent = (0.0, 0.0, 0.0)
+        self._sent_time = 0.0
+        self._changed_at = None
+        self._future = None
+        self._lock = threading.Lock()
+
+    def _changed(self, velocity):
+        return any(abs(a - b) > self.change_threshold for a, b in zip(velocity, self._sent))
+
+    def update(self, v_x, v_y, v_rot, stamp=None):
+        """Offer the latest velocity, sampled at stamp.  Returns True if a command was sent."""
+        if stamp is None:
+            stamp = time.time()
+        velocity = (v_x, v_y, v_rot)
+        now = time.time()
+
+        changed = self._changed(velocity)
+        if changed and self._changed_at is None:
+            self._changed_at = stamp
+        elif not changed:
+            self._changed_at = None
+
+        moving = any(velocity)
+        keepalive_due = moving and now - self._sent_time >= self.keepalive
+        if not changed and not keepalive_due:
+            return False
+        if now - self._sent_time < self.min_interval:
+            return False
+        if self._future is not None and not self._future.done():
+            self.num_busy += 1
+            return False
+
+        cmd = RobotCommandBuilder.synchro_velocity_command(v_x=v_x, v_y=v_y, v_rot=v_rot)
+        self._send(cmd, now + self.command_duration)
+        self._sent = velocity
+        self._sent_time = now
+        if self._changed_at is not None:
+            self.latencies.append(now - self._changed_at)
+            self._changed_at = None
+        return True
+
+    def send_command(self, cmd):
+        """Send a discrete command (sit, stand) right away and hold still afterwards.
+
+        Centered sticks won't send anything until they move again, so the command isn't
+        immediately overridden by a zero velocity.
+        """
+        self._send(cmd, None)
+        self._sent = (0.0, 0.0, 0.0)
+        self._sent_time = time.time()
+        self._changed_at = None
+
+    def _send(self, cmd, end_time_secs):
+        self._future = self.command_client.robot_command_async(cmd, end_time_secs=end_time_secs)
+        self._future.add_done_callback(self._on_done)
+        with self._lock:
+            self.num_sends += 1
+
+    def _on_done(self, future):
+        try:
+            future.result()
+        except Exception as err:
+            with self._lock:
+                self.num_errors += 1
+            print('Command failed: ' + str(err))
+
+    def stats(self):
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        latencies = list(self.latencies)
+        with self._lock:
+            return ('commands/s {:.1f}, sent {}, busy {}, errors {}, input-to-send p50 {:.1f} ms '
+                    'p95 {:.1f} ms'.format(self.num_sends / elapsed, self.num_sends,
+                                           self.num_busy, self.num_errors,
+                                           percentile(latencies, 0.5) * 1000.0,
+                                           percentile(latencies, 0.95) * 1000.0))
+
+
+class MockCommandClient:
+    """Accepts robot commands like RobotCommandClient, but only logs them after latency seconds.
+
+    Lets xbox_spot_control.py run without a robot.
+    """
+
+    def __init__(self, latency=0.02, verbose=True):
+        self.latency = latency
+        self.verbose = verbose
+        self.num_commands = 0
+        self._executor = futures.ThreadPoolExecutor(max_workers=1)
+
+    def robot_command_async(self, command, end_time_secs=None, **kwargs):
+        return self._executor.submit(self._handle, command, end_time_secs)
+
+    def robot_command(self, command, end_time_secs=None, **kwargs):
+        return self.robot_command_async(command, end_time_secs, **kwargs).result()
+
+    def _handle(self, command, end_time_secs):
+        time.sleep(self.latency)
+        self.num_commands += 1
+        if self.verbose:
+            mobility = command.synchronized_command.mobility_command
+            request = mobility.WhichOneof('command')
+            if request == 'se2_velocity_request':
+                velocity = mobility.se2_velocity_request.velocity
+                print('mock: velocity x {:+.2f} y {:+.2f} rot {:+.2f}'.format(
+                    velocity.linear.x, velocity.linear.y, velocity.angular))
+            else:
+                print('mock: ' + str(request))
+        return self.num_commands
+
+    def shutdown(self):
+        self._executor.shutdown()
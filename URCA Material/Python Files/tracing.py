@@ -0,0 +1,203 @@
+"""Spans and timing histograms for the fetch loop.
+
+Wrap a stage in a span:
+
+    with tracing.span('ncb_request', source=source):
+        resp = network_compute_client.network_compute_bridge_command(request)
+
+Until enable() is called, span() hands back one shared do-nothing context manager, so leaving
+the spans in costs a function call each.  Once enabled, every span is kept as a Chrome trace
+event (open the file in chrome://tracing or https://ui.perfetto.dev) and added to a
+per-name histogram, written in the Prometheus text format.
+"""
+
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds.
+kBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_tracer = None
+
+
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(kBuckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(kBuckets) and value > kBuckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Tracer:
+    """Collects spans from any thread.
+
+    At most max_events trace events are kept; later ones are still counted in the histograms.
+    """
+
+    def __init__(self, max_events=200000):
+        self.max_events = max_events
+        self.events = []
+        self.num_dropped = 0
+        self.histograms = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, start, duration, args=None):
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': (start - self._origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.num_dropped += 1
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(duration)
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+        names = [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': {
+                'name': thread.name
+            }
+        } for thread in threading.enumerate()]
+        return {'traceEvents': names + events, 'displayTimeUnit': 'ms'}
+
+    def prometheus_text(self, metric='fetch_span_seconds'):
+        lines = [
+            '# HELP {} Time spent in each fetch stage.'.format(metric),
+            '# TYPE {} histogram'.format(metric),
+        ]
+        with self._lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                cumulative = 0
+                for bound, count in zip(kBuckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{{span="{}",le="{}"}} {}'.format(
+                        metric, name, le, cumulative))
+                lines.append('{}_sum{{span="{}"}} {}'.format(metric, name, histogram.sum))
+                lines.append('{}_count{{span="{}"}} {}'.format(metric, name, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """One line per span name: count, mean and total time, longest total first."""
+        with self._lock:
+            rows = sorted(self.histograms.items(), key=lambda item: -item[1].sum)
+            return '\n'.join('{:<24} n={:<6d} mean {:8.1f} ms  total {:8.2f} s'.format(
+                name, histogram.count, histogram.sum / histogram.count * 1000.0, histogram.sum)
+                             for name, histogram in rows)
+
+
+def enable(max_events=200000):
+    global _tracer
+    _tracer = Tracer(max_events)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    if _tracer is None:
+        return _null_span
+    return _Span(_tracer, name, args)
+
+
+def record(name, start, duration, **args):
+    """Add a span measured by hand; start is a time.perf_counter() value."""
+    if _tracer is not None:
+        _tracer.record(name, start, duration, args)
+
+
+def wrap(name, fn, **args):
+    """fn, timed as a span each call.  Returns fn itself while tracing is off."""
+    if _tracer is None:
+        return fn
+
+    def traced(*fn_args, **fn_kwargs):
+        with span(name, **args):
+            return fn(*fn_args, **fn_kwargs)
+
+    return traced
+
+
+def _write_atomically(path, text):
+    # Scrapers and viewers never see a half-written file.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as out:
+        out.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_chrome_trace(path):
+    if _tracer is not None:
+        _write_atomically(path, json.dumps(_tracer.chrome_trace()))
+
+
+def write_prometheus(path):
+    if _tracer is not None:
+        _write_atomically(path, _tracer.prometheus_text())
+
+
+def summary():
+    return _tracer.summary() if _tracer is not None else ''
@@ -0,0 +1,178 @@
+"""Kalman-filtered tracks of detected objects in the vision frame.
+
+Each label (dogtoy, person) gets a constant-velocity filter over its 3D position.  Between
+detections the filter predicts where the object is and how uncertain that guess has become; the
+fetch loop only asks the detector again once the uncertainty passes a limit.
+
+Recorded detection sequences can be replayed offline:
+
+    python tracker.py detections.csv --max-std 0.25
+
+with one "stamp,label,x,y,z" row per detector call (leave x,y,z empty for a miss).
+"""
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+
+class KalmanTrack:
+    """Constant-velocity Kalman filter over [x, y, z, vx, vy, vz]."""
+
+    def __init__(self, position, stamp, measurement_std=0.1, process_noise=0.5,
+                 initial_velocity_std=1.0):
+        self.measurement_std = measurement_std
+        self.process_noise = process_noise
+        self.state = np.zeros(6)
+        self.state[:3] = position
+        self.covariance = np.diag([measurement_std**2] * 3 + [initial_velocity_std**2] * 3)
+        self.stamp = stamp
+        self.last_update = stamp
+
+    def _propagate(self, stamp):
+        dt = max(0.0, stamp - self.stamp)
+        transition = np.eye(6)
+        transition[:3, 3:] = np.eye(3) * dt
+
+        # White-noise acceleration model.
+        q = self.process_noise**2
+        noise = np.zeros((6, 6))
+        noise[:3, :3] = np.eye(3) * q * dt**3 / 3.0
+        noise[:3, 3:] = np.eye(3) * q * dt**2 / 2.0
+        noise[3:, :3] = noise[:3, 3:]
+        noise[3:, 3:] = np.eye(3) * q * dt
+
+        state = transition.dot(self.state)
+        covariance = transition.dot(self.covariance).dot(transition.T) + noise
+        return state, covariance
+
+    def predict(self, stamp):
+        """Advance the filter to stamp."""
+        self.state, self.covariance = self._propagate(stamp)
+        self.stamp = max(self.stamp, stamp)
+
+    def update(self, position, stamp):
+        """Fold in a measured position taken at stamp."""
+        self.predict(stamp)
+        innovation = np.asarray(position, dtype=float) - self.state[:3]
+        innovation_cov = self.covariance[:3, :3] + np.eye(3) * self.measurement_std**2
+        gain = self.covariance[:, :3].dot(np.linalg.inv(innovation_cov))
+        self.state = self.state + gain.dot(innovation)
+        self.covariance = (np.eye(6) - gain.dot(np.eye(3, 6))).dot(self.covariance)
+        self.last_update = stamp
+
+    def position_at(self, stamp):
+        """Predicted position and its standard deviation (m) at stamp, without changing the
+        filter."""
+        state, covariance = self._propagate(stamp)
+        return state[:3], float(np.sqrt(np.max(np.linalg.eigvalsh(covariance[:3, :3]))))
+
+
+class ObjectTracker:
+    """One KalmanTrack per label.
+
+    needs_detection() says when the detector has to run again: when there is no track, when
+    the predicted position is more uncertain than max_std, or when the last real detection is
+    older than max_gap seconds.
+    """
+
+    def __init__(self, measurement_std=0.1, process_noise=0.5, max_std=0.25, max_gap=5.0):
+        self.measurement_std = measurement_std
+        self.process_noise = process_noise
+        self.max_std = max_std
+        self.max_gap = max_gap
+        self.tracks = {}
+
+    def update(self, label, position, stamp):
+        track = self.tracks.get(label)
+        if track is None or stamp - track.last_update > self.max_gap:
+            self.tracks[label] = KalmanTrack(position, stamp, self.measurement_std,
+                                             self.process_noise)
+        else:
+            track.update(position, stamp)
+
+    def predict(self, label, stamp):
+        """(position, std) of label at stamp, or (None, None) if it isn't being tracked."""
+        track = self.tracks.get(label)
+        if track is None or stamp - track.last_update > self.max_gap:
+            return None, None
+        return track.position_at(stamp)
+
+    def needs_detection(self, label, stamp):
+        _, std = self.predict(label, stamp)
+        return std is None or std > self.max_std
+
+    def drop(self, label):
+        self.tracks.pop(label, None)
+
+
+def load_detections(path):
+    """Rows of (stamp, label, position or None) from a "stamp,label,x,y,z" CSV."""
+    rows = []
+    with open(path) as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or row[0].startswith('#'):
+                continue
+            position = None
+            if len(row) >= 5 and row[2].strip():
+                position = np.array([float(value) for value in row[2:5]])
+            rows.append((float(row[0]), row[1].strip(), position))
+    return rows
+
+
+def replay(detections, tracker):
+    """Run a recorded sequence through tracker as the fetch loop would.
+
+    A recorded detection is only "used" when the tracker asks for one; the rest stand for
+    detector calls that would have been skipped.  Skipped rows that have a position are used to
+    measure how far off the prediction was.  Returns a dictionary of counts and errors.
+    """
+    used = 0
+    skipped = 0
+    errors = []
+    for stamp, label, position in detections:
+        if tracker.needs_detection(label, stamp):
+            used += 1
+            if position is not None:
+                tracker.update(label, position, stamp)
+            continue
+
+        skipped += 1
+        if position is not None:
+            predicted, _ = tracker.predict(label, stamp)
+            errors.append(np.linalg.norm(predicted - position))
+
+    return {
+        'rows': len(detections),
+        'detector_calls': used,
+        'skipped_calls': skipped,
+        'mean_error': float(np.mean(errors)) if errors else 0.0,
+        'max_error': float(np.max(errors)) if errors else 0.0,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('detections', help='CSV of stamp,label,x,y,z rows')
+    parser.add_argument('--max-std', default=0.25, type=float)
+    parser.add_argument('--max-gap', default=5.0, type=float)
+    parser.add_argument('--measurement-std', default=0.1, type=float)
+    parser.add_argument('--process-noise', default=0.5, type=float)
+    options = parser.parse_args(argv)
+
+    tracker = ObjectTracker(options.measurement_std, options.process_noise, options.max_std,
+                            options.max_gap)
+    stats = replay(load_detections(options.detections), tracker)
+    print('rows:              {}'.format(stats['rows']))
+    print('detector calls:    {}'.format(stats['detector_calls']))
+    print('skipped calls:     {}'.format(stats['skipped_calls']))
+    print('mean error (m):    {:.3f}'.format(stats['mean_error']))
+    print('max error (m):     {:.3f}'.format(stats['max_error']))
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -1,103 +1,207 @@
-import pygame
+import argparse
+import sys
 import time
+
+import pygame
+
 import bosdyn.client.lease
 from bosdyn.client import create_standard_sdk
-from bosdyn.client.robot_command import RobotCommandClient, RobotCommandBuilder
-from bosdyn.client.lease import LeaseClient
 from bosdyn.client.estop import EstopClient, EstopEndpoint
-from bosdyn.client.power import PowerClient
+from bosdyn.client.lease import LeaseClient
+from bosdyn.client.robot_command import RobotCommandBuilder, RobotCommandClient
+
+from teleop import JoystickReader, MockCommandClient, VelocityStreamer
 
 # Spot Configuration - Change IP and Credentials
 SPOT_IP = "192.168.80.3"  # Replace with Spot’s IP
 USERNAME = "#####"  # Replace with Spot’s username
 PASSWORD = "#####"  # Replace with Spot’s password
 
-# Initialize SDK and connect to Spot
-sdk = create_standard_sdk('XboxControllerSpot')
-robot = sdk.create_robot(SPOT_IP)
-robot.authenticate(USERNAME, PASSWORD)
-robot.time_sync.wait_for_sync()
-
-# Create clients
-command_client = robot.ensure_client(RobotCommandClient.default_service_name)
-lease_client = robot.ensure_client(LeaseClient.default_service_name)
-estop_client = robot.ensure_client(EstopClient.default_service_name)
-power_client = robot.ensure_client(PowerClient.default_service_name)
-
-# Obtain a lease to control Spot
-try:
-    lease = lease_client.take()  # Take control of Spot
-    lease_keepalive = bosdyn.client.lease.LeaseKeepAlive(lease_client)  # Maintain lease
-    print("Lease acquired successfully.")
-except bosdyn.client.lease.ResourceAlreadyClaimedError as e:
-    print(f"Failed to take lease: {e}")
-    exit(1)  # Exit if lease cannot be taken
-
-# Establish E-Stop endpoint to ensure Spot is safe
-estop_endpoint = EstopEndpoint(estop_client, 'Xbox_Controller', estop_timeout=5.0)
-estop_endpoint.force_simple_setup()
-estop_endpoint.allow()
-
-# Power on Spot if not already on
-if not robot.is_powered_on():
-    print("Powering on Spot...")
-    robot.power_on()  # Corrected method
-    robot.wait_until_powered_on(timeout_sec=20)
-    print("Spot is now powered on.")
-
-# Initialize Pygame for Xbox Controller
-pygame.init()
-pygame.joystick.init()
-
-# Check if Xbox controller is connected
-if pygame.joystick.get_count() == 0:
-    print("No controller detected. Connect an Xbox One controller and try again.")
-    exit()
-
-joystick = pygame.joystick.Joystick(0)
-joystick.init()
-print(f"Connected to: {joystick.get_name()}")
-
-# Main loop for controller input
-try:
-    while True:
-        pygame.event.pump()
-
-        # Read joystick values
-        left_x = joystick.get_axis(0)  # Strafe left/right
-        left_y = -joystick.get_axis(1)  # Forward/backward (inverted)
-        right_x = joystick.get_axis(2)  # Turn left/right
+# Controller handling
+COMMAND_LOOP_RATE = 50.0  # Times per second the latest stick state is handed to the streamer
+MAX_COMMAND_RATE = 10.0  # Velocity commands per second at most
+KEEPALIVE = 0.5  # Resend a held velocity this often (s)
+COMMAND_DURATION = 0.8  # Spot stops by itself this long after the last velocity command (s)
+DEADBAND = 0.1  # Stick travel ignored around center
+SMOOTHING = 0.05  # Stick smoothing time constant (s), 0 to disable
+SPEED = 0.5  # Scale movement speed (adjust as needed)
+
+# Controller buttons
+BUTTON_SIT = 0  # 'A' button makes Spot sit
+BUTTON_STAND = 1  # 'B' button makes Spot stand
+BUTTON_QUIT = 7  # 'Start' button to quit
+
+
+class RobotConnection:
+    """SDK clients, lease, E-Stop and power, set up only once a controller is connected.
+
+    robot, if given, is used as it is instead of connecting to hostname, e.g. a
+    fake_spot.FakeRobot.  If setting up fails part way, whatever was already set up is
+    released before the error is raised.
+    """
+
+    def __init__(self, hostname, username, password, robot=None):
+        # Initialize SDK and connect to Spot
+        if robot is None:
+            sdk = create_standard_sdk('XboxControllerSpot')
+            robot = sdk.create_robot(hostname)
+            robot.authenticate(username, password)
+        self.robot = robot
+        self.robot.time_sync.wait_for_sync()
+
+        # Create clients
+        self.command_client = self.robot.ensure_client(RobotCommandClient.default_service_name)
+        lease_client = self.robot.ensure_client(LeaseClient.default_service_name)
+        estop_client = self.robot.ensure_client(EstopClient.default_service_name)
+
+        self.lease_keepalive = None
+        self.estop_endpoint = None
+        try:
+            # Obtain a lease to control Spot (raises ResourceAlreadyClaimedError if it can't)
+            lease_client.take()  # Take control of Spot
+            # Maintain lease
+            self.lease_keepalive = bosdyn.client.lease.LeaseKeepAlive(lease_client)
+            print("Lease acquired successfully.")
+
+            # Establish E-Stop endpoint to ensure Spot is safe
+            estop_endpoint = EstopEndpoint(estop_client, 'Xbox_Controller', estop_timeout=5.0)
+            estop_endpoint.force_simple_setup()
+            self.estop_endpoint = estop_endpoint
+            self.estop_endpoint.allow()
+
+            # Power on Spot if not already on
+            if not self.robot.is_powered_on():
+                print("Powering on Spot...")
+                self.robot.power_on()
+                self.robot.wait_until_powered_on(timeout_sec=20)
+                print("Spot is now powered on.")
+        except BaseException:
+            # Nobody gets to close() a connection that was never returned, so let go here.
+            self.close()
+            if self.estop_endpoint is not None:
+                self.estop_endpoint.deregister()
+            raise
+
+    def close(self):
+        print("Releasing Spot lease and stopping control...")
+        if self.lease_keepalive is not None:
+            self.lease_keepalive.shutdown()
+        if self.estop_endpoint is not None:
+            self.estop_endpoint.stop()
+
+
+def connect_controller():
+    # Initialize Pygame for Xbox Controller
+    pygame.init()
+    pygame.joystick.init()
+
+    # Check if Xbox controller is connected
+    if pygame.joystick.get_count() == 0:
+        print("No controller detected. Connect an Xbox One controller and try again.")
+        return None
+
+    joystick = pygame.joystick.Joystick(0)
+    joystick.init()
+    print(f"Connected to: {joystick.get_name()}")
+    return joystick
+
+
+def control_loop(reader, streamer, rate, speed):
+    period = 1.0 / rate
+    last_report = time.time()
 
-        # Scale movement speed (adjust as needed)
-        speed = 0.5
-        cmd = RobotCommandBuilder.synchro_velocity_command(
-            v_x=speed * left_y, v_y=speed * left_x, v_rot=speed * right_x
-        )
+    while True:
+        start = time.time()
 
-        # Send movement command to Spot
-        command_client.robot_command(cmd)
+        # Check for controller button presses, once per press
+        presses = reader.presses()
+        if BUTTON_QUIT in presses:
+            print("Exiting control loop...")
+            return
 
-        # Check for controller button presses
-        if joystick.get_button(0):  # 'A' button makes Spot sit
+        if BUTTON_SIT in presses:
             print("Sit Command Sent")
-            sit_cmd = RobotCommandBuilder.synchro_sit_command()
-            command_client.robot_command(sit_cmd)
+            streamer.send_command(RobotCommandBuilder.synchro_sit_command())
 
-        if joystick.get_button(1):  # 'B' button makes Spot stand
+        elif BUTTON_STAND in presses:
             print("Stand Command Sent")
-            stand_cmd = RobotCommandBuilder.synchro_stand_command()
-            command_client.robot_command(stand_cmd)
-
-        if joystick.get_button(7):  # 'Start' button to quit
-            print("Exiting control loop...")
-            break
-
-        time.sleep(0.1)  # Short delay to prevent excessive commands
-
-except KeyboardInterrupt:
-    print("\nStopping control...")
-
-finally:
-    print("Releasing Spot lease and stopping control...")
-    lease_keepalive.shutdown()
-    estop_endpoint.stop()
+            streamer.send_command(RobotCommandBuilder.synchro_stand_command())
+
+        else:
+            # Latest smoothed sticks: strafe left/right, forward/backward, turn left/right
+            (left_x, left_y, right_x), stamp = reader.latest()
+            # Send movement command to Spot if anything changed (forward/backward is inverted)
+            streamer.update(-speed * left_y, speed * left_x, speed * right_x, stamp)
+
+        if time.time() - last_report > 5.0:
+            print(streamer.stats())
+            last_report = time.time()
+
+        time.sleep(max(0.0, period - (time.time() - start)))
+
+
+def main(argv, robot=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hostname', help="Spot's IP", default=SPOT_IP)
+    parser.add_argument('--username', default=USERNAME)
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--mock', action='store_true',
+                        help='Log commands instead of sending them to a robot')
+    parser.add_argument('--mock-latency', help='Simulated RPC time with --mock (s)',
+                        default=0.02, type=float)
+    parser.add_argument('--rate', help='Command loop rate (Hz)', default=COMMAND_LOOP_RATE,
+                        type=float)
+    parser.add_argument('--max-command-rate', help='Velocity commands per second at most',
+                        default=MAX_COMMAND_RATE, type=float)
+    parser.add_argument('--keepalive', default=KEEPALIVE, type=float)
+    parser.add_argument('--command-duration', default=COMMAND_DURATION, type=float)
+    parser.add_argument('--deadband', default=DEADBAND, type=float)
+    parser.add_argument('--smoothing', default=SMOOTHING, type=float)
+    parser.add_argument('--speed', default=SPEED, type=float)
+    options = parser.parse_args(argv)
+
+    # Controller first: it is quick to find, and there is no point connecting without one.
+    joystick = connect_controller()
+    if joystick is None:
+        return False
+    reader = JoystickReader(joystick, deadband=options.deadband,
+                            smoothing=options.smoothing).start()
+
+    connection = None
+    command_client = None
+    streamer = None
+    try:
+        if options.mock:
+            command_client = MockCommandClient(latency=options.mock_latency)
+        else:
+            connection = RobotConnection(options.hostname, options.username, options.password,
+                                         robot=robot)
+            command_client = connection.command_client
+
+        # Velocity commands are only sent when the sticks change or a keep-alive is due
+        streamer = VelocityStreamer(command_client, max_rate=options.max_command_rate,
+                                    keepalive=options.keepalive,
+                                    command_duration=options.command_duration)
+
+        # Main loop for controller input
+        control_loop(reader, streamer, options.rate, options.speed)
+    except bosdyn.client.lease.ResourceAlreadyClaimedError as e:
+        print(f"Failed to take lease: {e}")
+        return False
+    except KeyboardInterrupt:
+        print("\nStopping control...")
+    finally:
+        reader.stop()
+        if streamer is not None:
+            print(streamer.stats())
+        if connection is not None:
+            connection.close()
+        elif command_client is not None:
+            command_client.shutdown()
+
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
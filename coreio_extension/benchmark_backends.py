@@ -0,0 +1,185 @@
+"""Latency and accuracy parity of one model across inference backends.
+
+Runs the model with each backend on the same images and compares every backend's detections
+with plain TensorFlow's: mAP at IoU 0.5, taking TensorFlow's detections above
+--reference-confidence as ground truth.  The fastest backend within --max-map-loss of it is the
+one to put in docker-compose.yml.  Runs on a CPU; backends that can't load here (TF-TRT off
+the Jetson, artifacts not built yet) are skipped.
+
+    CUDA_VISIBLE_DEVICES=-1 python3 benchmark_backends.py \\
+        -m data/dogtoy-model/saved_model data/dogtoy-model/label_map.pbtxt \\
+        --images ~/fetch/dogtoy/images/test --backends tf tflite onnx
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from inference_backends import artifact_path, kBackendClasses, kBackends, model_name
+
+
+def load_images(folder, rows, cols, limit):
+    if not folder:
+        # Without real images the parity numbers mean little, but the latency still holds.
+        print('Warning: no --images, using noise.')
+        return [np.random.randint(0, 255, (rows, cols, 3), np.uint8) for _ in range(limit)]
+    paths = sorted(glob.glob(os.path.join(folder, '*.jpg')) +
+                   glob.glob(os.path.join(folder, '*.png')))[:limit]
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is not None:
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return images
+
+
+def iou(box, boxes):
+    """Intersection over union of box with each of boxes, all [ymin, xmin, ymax, xmax]."""
+    y_min = np.maximum(box[0], boxes[:, 0])
+    x_min = np.maximum(box[1], boxes[:, 1])
+    y_max = np.minimum(box[2], boxes[:, 2])
+    x_max = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(y_max - y_min, 0, None) * np.clip(x_max - x_min, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def average_precision(predictions, truths, num_truths, iou_threshold):
+    """VOC-style AP for one class.
+
+    predictions is a list of (image index, score, box), truths maps image index to an array of
+    boxes.
+    """
+    if num_truths == 0:
+        return None
+    matched = {index: np.zeros(len(boxes), bool) for index, boxes in truths.items()}
+    hits = []
+    for index, _, box in sorted(predictions, key=lambda prediction: -prediction[1]):
+        boxes = truths.get(index)
+        hit = False
+        if boxes is not None and len(boxes):
+            overlaps = iou(box, boxes)
+            best = int(np.argmax(overlaps))
+            if overlaps[best] >= iou_threshold and not matched[index][best]:
+                matched[index][best] = True
+                hit = True
+        hits.append(hit)
+
+    hits = np.array(hits, float)
+    true_positives = np.cumsum(hits)
+    precision = true_positives / np.arange(1, len(hits) + 1)
+    recall = true_positives / num_truths
+    # Area under the precision envelope.
+    precision = np.concatenate([[0.0], precision, [0.0]])
+    recall = np.concatenate([[0.0], recall, [recall[-1] if len(recall) else 0.0]])
+    for i in range(len(precision) - 2, -1, -1):
+        precision[i] = max(precision[i], precision[i + 1])
+    steps = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+
+def mean_average_precision(detections, reference, reference_confidence, iou_threshold=0.5):
+    truths = {}
+    predictions = {}
+    for index, (found, expected) in enumerate(zip(detections, reference)):
+        keep = expected['detection_scores'] >= reference_confidence
+        for cls, box in zip(expected['detection_classes'][keep], expected['detection_boxes'][keep]):
+            truths.setdefault(int(cls), {}).setdefault(index, []).append(box)
+        for cls, score, box in zip(found['detection_classes'], found['detection_scores'],
+                                   found['detection_boxes']):
+            predictions.setdefault(int(cls), []).append((index, float(score), box))
+
+    precisions = []
+    for cls, by_image in truths.items():
+        by_image = {index: np.array(boxes) for index, boxes in by_image.items()}
+        num_truths = sum(len(boxes) for boxes in by_image.values())
+        precisions.append(
+            average_precision(predictions.get(cls, []), by_image, num_truths, iou_threshold))
+    return float(np.mean(precisions)) if precisions else None
+
+
+def run_backend(backend, options, images):
+    model_path, label_path = options.model
+    path = artifact_path(model_path, backend)
+    if not os.path.exists(path):
+        print('{}: no artifact at {}, skipped'.format(backend, path))
+        return None
+    try:
+        start = time.perf_counter()
+        model = kBackendClasses[backend](path, label_path, model_name(model_path))
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        model.warm_up(*images[0].shape[:2])
+        warmup_time = time.perf_counter() - start
+    except Exception as err:
+        print('{}: could not load ({}), skipped'.format(backend, err))
+        return None
+
+    latencies = []
+    detections = []
+    for _ in range(options.repeat):
+        detections = []
+        for image in images:
+            start = time.perf_counter()
+            detections.append(model.predict_batch([image])[0])
+            latencies.append(time.perf_counter() - start)
+    return load_time, warmup_time, np.array(latencies) * 1000.0, detections
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', nargs=2, required=True,
+                        metavar=('SAVED_MODEL_DIR', 'LABELS_FILE'))
+    parser.add_argument('--backends', nargs='+', default=list(kBackends), choices=kBackends)
+    parser.add_argument('--images', help='Folder of JPEG/PNG test images')
+    parser.add_argument('--limit', help='Most images to use', default=50, type=int)
+    parser.add_argument('--repeat', help='Passes over the images', default=3, type=int)
+    parser.add_argument('--reference-confidence', default=0.5, type=float,
+                        help='TensorFlow detections at least this confident count as truth')
+    parser.add_argument('--max-map-loss', default=0.02, type=float,
+                        help='Largest acceptable mAP drop against TensorFlow')
+    options = parser.parse_args(argv)
+
+    images = load_images(options.images, 480, 640, options.limit)
+    if not images:
+        print('Error: no images found in ' + options.images)
+        return False
+
+    results = {}
+    for backend in ['tf'] + [backend for backend in options.backends if backend != 'tf']:
+        result = run_backend(backend, options, images)
+        if result is not None:
+            results[backend] = result
+    if 'tf' not in results:
+        print('Error: the TensorFlow reference did not run.')
+        return False
+
+    reference = results['tf'][3]
+    print('{} images x {} passes'.format(len(images), options.repeat))
+    print('{:<12} {:>9} {:>11} {:>9} {:>9} {:>9} {:>7}'.format('backend', 'load (s)',
+                                                             'warm-up (s)', 'mean (ms)',
+                                                             'p50 (ms)', 'p95 (ms)', 'mAP'))
+    passing = []
+    for backend, (load_time, warmup_time, latencies, detections) in results.items():
+        score = mean_average_precision(detections, reference, options.reference_confidence)
+        print('{:<12} {:>9.1f} {:>11.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7}'.format(
+            backend, load_time, warmup_time, np.mean(latencies), np.percentile(latencies, 50),
+            np.percentile(latencies, 95), '-' if score is None else '{:.3f}'.format(score)))
+        if score is None or score >= 1.0 - options.max_map_loss:
+            passing.append((np.mean(latencies), backend))
+
+    if passing:
+        print('Fastest within {:.3f} mAP of TensorFlow: {}'.format(options.max_map_loss,
+                                                                   min(passing)[1]))
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
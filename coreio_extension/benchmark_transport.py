@@ -0,0 +1,253 @@
+"""Throughput and latency of handing frames to the detector over gRPC versus shared memory.
+
+Starts a stand-in worker in a second process that speaks the NetworkComputeBridgeWorker API like
+network_compute_server.py, with the model replaced by one pass over the pixels, so the numbers
+are the cost of moving frames and nothing else.  Compares three ways of sending each frame:
+
+    grpc-raw   the uncompressed pixels inside the request
+    grpc-jpeg  a JPEG inside the request, decoded by the worker (what the robot sends today)
+    shm        written into a shm_ring.FrameRingWriter; the request only names the frame
+
+Needs grpc, the bosdyn protos, numpy and OpenCV, but no robot, GPU or TensorFlow:
+
+    python3 benchmark_transport.py --frames 300 --clients 1 4 \\
+        --shape 480 640 1 --shape 1080 1920 3
+"""
+
+import argparse
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent import futures
+
+import cv2
+import grpc
+import numpy as np
+from google.protobuf import struct_pb2
+
+from bosdyn.api import (image_pb2, network_compute_bridge_pb2,
+                        network_compute_bridge_service_pb2_grpc)
+from shm_ring import FrameRingWriter, SharedFrames, pack_frame_ref
+
+kTransports = ['grpc-raw', 'grpc-jpeg', 'shm']
+
+# Large frames don't fit in gRPC's default 4 MB message limit.
+kChannelOptions = [('grpc.max_send_message_length', 64 << 20),
+                   ('grpc.max_receive_message_length', 64 << 20)]
+
+
+def decode_request(request, frames):
+    """The request's image, the way network_compute_server.py gets it, plus its frame ref."""
+    input_data = request.input_data
+    if input_data.other_data.Is(struct_pb2.Struct.DESCRIPTOR):
+        params = struct_pb2.Struct()
+        input_data.other_data.Unpack(params)
+        ref = (params['shm_ring'], int(params['shm_seq']))
+        return frames.get(*ref), ref
+
+    if input_data.image.format == image_pb2.Image.FORMAT_JPEG:
+        return cv2.imdecode(np.frombuffer(input_data.image.data, np.uint8),
+                            cv2.IMREAD_UNCHANGED), None
+
+    shape = (input_data.image.rows, input_data.image.cols)
+    if input_data.image.pixel_format == image_pb2.Image.PIXEL_FORMAT_RGB_U8:
+        shape += (3,)
+    return np.frombuffer(input_data.image.data, np.uint8).reshape(shape), None
+
+
+class StandInWorkerServicer(
+        network_compute_bridge_service_pb2_grpc.NetworkComputeBridgeWorkerServicer):
+
+    def __init__(self, shm_dir, work_time):
+        super(StandInWorkerServicer, self).__init__()
+        self.frames = SharedFrames(shm_dir)
+        self.frames_lock = threading.Lock()
+        self.work_time = work_time
+
+    def NetworkCompute(self, request, context):
+        response = network_compute_bridge_pb2.NetworkComputeResponse()
+        with self.frames_lock:
+            image, ref = decode_request(request, self.frames)
+        if image is None:
+            response.header.error.message = 'frame not found'
+            return response
+
+        # The model's share: read every pixel once, then optionally pretend to think.
+        checksum = int(image.sum(dtype=np.uint64))
+        if self.work_time > 0:
+            time.sleep(self.work_time)
+        if ref is not None and not self.frames.valid(*ref):
+            response.header.error.message = 'frame overwritten'
+            return response
+
+        # Detections are a few dozen bytes whichever way the frame came.
+        out_obj = response.object_in_image.add()
+        out_obj.name = 'obj0_label_' + str(checksum)
+        for x, y in [(0, 0), (1, 0), (1, 1), (0, 1)]:
+            vertex = out_obj.image_properties.coordinates.vertexes.add()
+            vertex.x = x
+            vertex.y = y
+        return response
+
+
+def serve(port_queue, shm_dir, work_time):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=16), options=kChannelOptions)
+    network_compute_bridge_service_pb2_grpc.add_NetworkComputeBridgeWorkerServicer_to_server(
+        StandInWorkerServicer(shm_dir, work_time), server)
+    port_queue.put(server.add_insecure_port('localhost:0'))
+    server.start()
+    # The parent terminates this process when it is done.
+    while True:
+        time.sleep(3600)
+
+
+def make_frames(shape, count):
+    """A few distinct frames, smooth enough that JPEG sizes look like camera images."""
+    frames = []
+    for _ in range(count):
+        noise = np.random.randint(0, 255, (shape[0] // 8 + 1, shape[1] // 8 + 1) + shape[2:],
+                                  np.uint8)
+        frame = cv2.resize(noise, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+        frames.append(frame.reshape(shape))
+    return frames
+
+
+def base_request(frame):
+    request = network_compute_bridge_pb2.NetworkComputeRequest()
+    request.input_data.model_name = 'stand-in'
+    request.input_data.image.rows = frame.shape[0]
+    request.input_data.image.cols = frame.shape[1]
+    request.input_data.image.pixel_format = (image_pb2.Image.PIXEL_FORMAT_RGB_U8
+                                             if frame.ndim == 3 else
+                                             image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8)
+    return request
+
+
+class Sender:
+    """Turns a frame into a request for one transport.  One per client thread."""
+
+    def __init__(self, transport, shape, ring_name, num_slots, shm_dir):
+        self.transport = transport
+        self.ring = None
+        if transport == 'shm':
+            self.ring = FrameRingWriter(ring_name, num_slots, int(np.prod(shape)), shm_dir)
+
+    def request(self, frame):
+        request = base_request(frame)
+        if self.transport == 'grpc-raw':
+            request.input_data.image.format = image_pb2.Image.FORMAT_RAW
+            request.input_data.image.data = frame.tobytes()
+        elif self.transport == 'grpc-jpeg':
+            request.input_data.image.format = image_pb2.Image.FORMAT_JPEG
+            request.input_data.image.data = cv2.imencode('.jpg', frame)[1].tobytes()
+        else:
+            pack_frame_ref(request.input_data, self.ring.name, self.ring.write(frame))
+        return request
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+
+
+def client_loop(stub, sender, frames, count, latencies, errors):
+    for i in range(count):
+        start = time.perf_counter()
+        # Building the request is part of the cost: serializing, encoding or writing the ring.
+        request = sender.request(frames[i % len(frames)])
+        try:
+            response = stub.NetworkCompute(request, timeout=30)
+        except grpc.RpcError:
+            errors.append(i)
+            continue
+        if response.header.error.message:
+            errors.append(i)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run(stub, transport, shape, num_clients, options):
+    frames = make_frames(shape, 8)
+    senders = [
+        Sender(transport, shape, 'benchmark-transport-{}'.format(i), options.ring_slots,
+               options.shm_dir) for i in range(num_clients)
+    ]
+    try:
+        # Connection set-up and first-touch page faults stay out of the numbers.
+        client_loop(stub, senders[0], frames, 5, [], [])
+
+        latencies = []
+        errors = []
+        threads = [
+            threading.Thread(target=client_loop,
+                             args=(stub, sender, frames, options.frames, latencies, errors))
+            for sender in senders
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        for sender in senders:
+            sender.close()
+    return latencies, errors, elapsed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transports', nargs='+', default=kTransports, choices=kTransports)
+    parser.add_argument('--shape', nargs=3, type=int, action='append',
+                        metavar=('ROWS', 'COLS', 'CHANNELS'),
+                        help='Frame size, may be repeated.  Default: 480 640 1, a Spot '
+                        'fisheye image')
+    parser.add_argument('--clients', nargs='+', type=int, default=[1],
+                        help='Concurrent senders, each with its own ring')
+    parser.add_argument('--frames', default=200, type=int, help='Frames per client')
+    parser.add_argument('--work-ms', default=0.0, type=float,
+                        help='Pretend inference time the worker adds to every frame')
+    parser.add_argument('--ring-slots', default=8, type=int)
+    parser.add_argument('--shm-dir', default='/dev/shm')
+    options = parser.parse_args(argv)
+    shapes = [tuple(shape) for shape in options.shape or [[480, 640, 1]]]
+
+    port_queue = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=serve,
+                                     args=(port_queue, options.shm_dir, options.work_ms / 1000.0))
+    worker.daemon = True
+    worker.start()
+    try:
+        channel = grpc.insecure_channel('localhost:{}'.format(port_queue.get(timeout=30)),
+                                        options=kChannelOptions)
+        stub = network_compute_bridge_service_pb2_grpc.NetworkComputeBridgeWorkerStub(channel)
+
+        print('{:<10} {:>15} {:>7} {:>9} {:>9} {:>9} {:>9} {:>7}'.format(
+            'transport', 'frame', 'clients', 'frames/s', 'MB/s', 'p50 (ms)', 'p95 (ms)',
+            'errors'))
+        for shape in shapes:
+            size = '{}x{}x{}'.format(*shape)
+            # Single channel frames are 2D, the way the robot's greyscale images decode.
+            shape = shape if shape[2] > 1 else shape[:2]
+            for num_clients in options.clients:
+                for transport in options.transports:
+                    latencies, errors, elapsed = run(stub, transport, shape, num_clients,
+                                                     options)
+                    if not latencies:
+                        print('{:<10} {:>15} {:>7} no successful frames'.format(
+                            transport, size, num_clients))
+                        continue
+                    latencies_ms = np.array(latencies) * 1000.0
+                    rate = len(latencies) / elapsed
+                    print('{:<10} {:>15} {:>7} {:>9.1f} {:>9.1f} {:>9.2f} {:>9.2f} {:>7}'.format(
+                        transport, size, num_clients, rate, rate * np.prod(shape) / 1e6,
+                        np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 95),
+                        len(errors)))
+    finally:
+        worker.terminate()
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,191 @@
+"""Build the optimized versions of object detection models that inference_backends.py loads.
+
+Each MODEL_DIR is a model as exported by the TensorFlow object detection API (saved_model/,
+checkpoint/, pipeline.config).  The artifacts go next to its saved_model/:
+
+    python3 convert_models.py --backends tflite onnx data/dogtoy-model
+
+tftrt-fp16 and tftrt-int8 need TensorRT, so they only build on the Jetson (in the L4T image,
+run with --runtime nvidia), and their engines are built for --input-shape.  tftrt-int8 and a
+fully integer TFLite model calibrate on --calibration-images; without them TFLite falls back to
+dynamic-range quantization.  tflite needs the object detection API on the path, to re-export
+the model with its TFLite-friendly post-processing.
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from model_artifacts import artifact_path, kBackends
+
+kSavedModel = 'saved_model'
+
+
+def calibration_images(folder, rows, cols, limit):
+    """Up to limit RGB images from folder, resized to rows x cols."""
+    paths = sorted(glob.glob(os.path.join(folder, '*.jpg')) +
+                   glob.glob(os.path.join(folder, '*.png')))[:limit]
+    images = []
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        image = cv2.resize(image, (cols, rows), interpolation=cv2.INTER_AREA)
+        images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return images
+
+
+def convert_tftrt(model_dir, output_path, precision, options):
+    # Only importable where TensorFlow was built with TensorRT.
+    from tensorflow.python.compiler.tensorrt import trt_convert as trt
+
+    rows, cols = options.input_shape
+    params = trt.DEFAULT_TRT_CONVERSION_PARAMS._replace(
+        precision_mode=precision, max_workspace_size_bytes=options.trt_workspace_mb << 20,
+        use_calibration=precision == trt.TrtPrecisionMode.INT8)
+    converter = trt.TrtGraphConverterV2(input_saved_model_dir=os.path.join(model_dir, kSavedModel),
+                                        conversion_params=params)
+
+    if precision == trt.TrtPrecisionMode.INT8:
+        images = calibration_images(options.calibration_images or '', rows, cols,
+                                    options.calibration_count)
+        if not images:
+            raise ValueError('tftrt-int8 needs --calibration-images')
+
+        def calibration_input_fn():
+            for image in images:
+                yield (tf.constant(image[np.newaxis, ...]),)
+
+        converter.convert(calibration_input_fn=calibration_input_fn)
+    else:
+        converter.convert()
+
+    def build_input_fn():
+        yield (tf.zeros((1, rows, cols, 3), tf.uint8),)
+
+    # Build the engines now rather than on the first request.
+    converter.build(input_fn=build_input_fn)
+    converter.save(output_path)
+
+
+def convert_tflite(model_dir, output_path, options):
+    # export_tflite_graph_tf2 swaps the post-processing for the TFLite detection op, which the
+    # converter can't otherwise handle.
+    with tempfile.TemporaryDirectory() as export_dir:
+        subprocess.check_call([
+            sys.executable, '-m', 'object_detection.export_tflite_graph_tf2',
+            '--pipeline_config_path', os.path.join(model_dir, 'pipeline.config'),
+            '--trained_checkpoint_dir', os.path.join(model_dir, 'checkpoint'),
+            '--output_directory', export_dir
+        ])
+        converter = tf.lite.TFLiteConverter.from_saved_model(
+            os.path.join(export_dir, kSavedModel))
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        quantization = 'dynamic range'
+        if options.calibration_images:
+            images = calibration_images(options.calibration_images, options.tflite_size,
+                                        options.tflite_size, options.calibration_count)
+            if images:
+
+                def representative_dataset():
+                    for image in images:
+                        yield [image[np.newaxis, ...].astype(np.float32) / 127.5 - 1.0]
+
+                converter.representative_dataset = representative_dataset
+                quantization = 'int8, calibrated'
+        print('TFLite quantization: ' + quantization)
+
+        with open(output_path, 'wb') as out:
+            out.write(converter.convert())
+
+
+def convert_onnx(model_dir, output_path, options):
+    subprocess.check_call([
+        sys.executable, '-m', 'tf2onnx.convert', '--saved-model',
+        os.path.join(model_dir, kSavedModel), '--output', output_path, '--opset',
+        str(options.onnx_opset)
+    ])
+
+
+def artifact_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names)
+
+
+def convert(model_dir, backend, options):
+    """Build one backend's artifact for model_dir.  Returns its path."""
+    output_path = artifact_path(os.path.join(model_dir, kSavedModel), backend)
+    if os.path.exists(output_path):
+        if not options.force:
+            print('Keeping existing ' + output_path)
+            return output_path
+        if os.path.isdir(output_path):
+            shutil.rmtree(output_path)
+        else:
+            os.remove(output_path)
+
+    if backend == 'tftrt-fp16':
+        convert_tftrt(model_dir, output_path, 'FP16', options)
+    elif backend == 'tftrt-int8':
+        convert_tftrt(model_dir, output_path, 'INT8', options)
+    elif backend == 'tflite':
+        convert_tflite(model_dir, output_path, options)
+    elif backend == 'onnx':
+        convert_onnx(model_dir, output_path, options)
+    return output_path
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model_dirs', nargs='+', metavar='MODEL_DIR',
+                        help='Exported model folder, containing saved_model/')
+    parser.add_argument('--backends', nargs='+', default=['tflite', 'onnx'],
+                        choices=[backend for backend in kBackends if backend != 'tf'])
+    parser.add_argument('--force', action='store_true', help='Rebuild existing artifacts.')
+    parser.add_argument('--calibration-images', metavar='DIR',
+                        help='JPEG/PNG images for INT8 calibration')
+    parser.add_argument('--calibration-count', default=100, type=int)
+    parser.add_argument('--input-shape', nargs=2, type=int, default=[480, 640],
+                        metavar=('ROWS', 'COLS'), help='Image size TF-TRT engines are built for')
+    parser.add_argument('--trt-workspace-mb', default=512, type=int)
+    parser.add_argument('--tflite-size', default=640, type=int,
+                        help='Input size of the models, for TFLite calibration images')
+    parser.add_argument('--onnx-opset', default=13, type=int)
+    options = parser.parse_args(argv)
+
+    # A backend that can't be built here (e.g. TF-TRT off the Jetson) doesn't stop the others;
+    # the server falls back to TensorFlow for it.
+    failed = []
+    for model_dir in options.model_dirs:
+        for backend in options.backends:
+            start = time.time()
+            try:
+                output_path = convert(model_dir, backend, options)
+            except Exception as err:
+                print('Error: could not build {} for {}: {}'.format(backend, model_dir, err))
+                failed.append((model_dir, backend))
+                continue
+            print('{} {}: {:.1f} MB in {:.0f} s'.format(model_dir, backend,
+                                                       artifact_size(output_path) / 1e6,
+                                                       time.time() - start))
+
+    return not failed
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
@@ -0,0 +1,243 @@
+"""Object detection models behind one interface, run by different inference engines.
+
+Every backend loads an artifact that convert_models.py builds next to the model's SavedModel:
+
+    tf          <model>/saved_model                 TensorFlow, as exported
+    tftrt-fp16  <model>/saved_model_trt_fp16        TF-TRT, FP16 engines (Jetson GPU only)
+    tftrt-int8  <model>/saved_model_trt_int8        TF-TRT, INT8 calibrated (Jetson GPU only)
+    tflite      <model>/model.tflite                quantized TFLite, on CPU with XNNPACK
+    onnx        <model>/model.onnx                  ONNX Runtime, CPU
+
+and answers predict(image) with the same dictionary of detections the TensorFlow object
+detection API returns, so the server doesn't care which one it talks to.  A model keeps its
+name (the folder it is in) whatever the backend, so clients ask for it the same way.
+"""
+
+import os
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from object_detection.utils import label_map_util
+
+# Re-exported: the path helpers live apart so packaging doesn't need TensorFlow.
+from model_artifacts import artifact_path, kBackends, model_name
+
+
+def unbatch_detections(detections, batch_size):
+    # All outputs are batches of tensors.
+    # Convert to numpy arrays, and split along the batch dimension.
+    # We're only interested in the first num_detections of each image.
+    detections = {key: np.asarray(value) for key, value in detections.items()}
+    num_detections = detections.pop('num_detections')
+    out = []
+    for i in range(batch_size):
+        count = int(num_detections[i])
+        out.append({key: value[i, :count] for key, value in detections.items()})
+    return out
+
+
+class ObjectDetectionModel:
+    """The parts every backend shares: the label map, and running images one at a time."""
+
+    supports_batching = False
+
+    def __init__(self, label_path, name):
+        self.category_index = label_map_util.create_category_index_from_labelmap(
+            label_path, use_display_name=True)
+        self.name = name
+        self.backend = None
+
+    def predict(self, image):
+        """Detections for one HxWx3 uint8 RGB image, with a batch dimension of 1."""
+        raise NotImplementedError
+
+    def predict_batch(self, images):
+        """Run the model on a list of same-sized images.
+
+        Returns one dictionary of numpy detections per image, with the batch dimension removed
+        and trimmed to that image's num_detections.
+        """
+        return [unbatch_detections(self.predict(image), 1)[0] for image in images]
+
+    def warm_up(self, rows, cols):
+        """Run one inference on a blank image, so graph tracing and CUDA start-up happen now
+        instead of on the first real request."""
+        self.predict_batch([np.zeros((rows, cols, 3), np.uint8)])
+
+
+class TensorFlowObjectDetectionModel(ObjectDetectionModel):
+
+    def __init__(self, model_path, label_path, name=None):
+        super(TensorFlowObjectDetectionModel, self).__init__(label_path,
+                                                             name or model_name(model_path))
+        self.saved_model = tf.saved_model.load(model_path)
+        self.detect_fn = self._detect_fn()
+
+        # Models exported by the object detection API usually have their batch dimension fixed
+        # at 1.  Those still go through the batching queue, but run one image at a time.
+        self.supports_batching = self._input_batch_size() != 1
+
+    def _detect_fn(self):
+        return self.saved_model
+
+    def _input_batch_size(self):
+        try:
+            signature = self.saved_model.signatures['serving_default']
+            input_spec = list(signature.structured_input_signature[1].values())[0]
+            return input_spec.shape[0]
+        except (AttributeError, IndexError, KeyError):
+            return None
+
+    def predict(self, image):
+        input_tensor = tf.convert_to_tensor(image)
+        input_tensor = input_tensor[tf.newaxis, ...]
+        detections = self.detect_fn(input_tensor)
+        return detections
+
+    def predict_batch(self, images):
+        if len(images) > 1 and self.supports_batching:
+            try:
+                detections = self.detect_fn(tf.convert_to_tensor(np.stack(images)))
+                return unbatch_detections(detections, len(images))
+            except (ValueError, tf.errors.InvalidArgumentError) as err:
+                print('Model ' + self.name + ' does not accept batches, running one image at a '
+                      'time: ' + str(err))
+                self.supports_batching = False
+
+        return super(TensorFlowObjectDetectionModel, self).predict_batch(images)
+
+
+class TensorRTObjectDetectionModel(TensorFlowObjectDetectionModel):
+    """A SavedModel converted by TF-TRT.  Conversion only keeps the serving signature."""
+
+    def _detect_fn(self):
+        signature = self.saved_model.signatures['serving_default']
+        input_name = list(signature.structured_input_signature[1])[0]
+        return lambda input_tensor: signature(**{input_name: input_tensor})
+
+
+def detection_output_indices(output_details):
+    """Tensor index of each of the detection post-processing op's outputs.
+
+    Neither the outputs' order nor their names are the same from one converter version to the
+    next, so they are told apart by shape: boxes are [1, N, 4] and the count is [1].  Classes
+    and scores are both [1, N] floats; a name that says which is which wins, otherwise they are
+    taken in the op's output order, classes first.
+    """
+    indices = {}
+    per_detection = []
+    for detail in sorted(output_details, key=lambda detail: detail['index']):
+        shape = detail['shape']
+        if len(shape) == 3 and shape[-1] == 4:
+            indices['detection_boxes'] = detail['index']
+        elif len(shape) == 2:
+            per_detection.append(detail)
+        elif len(shape) == 1:
+            indices['num_detections'] = detail['index']
+    if len(indices) != 2 or len(per_detection) != 2:
+        raise ValueError('Not a detection post-processing output, shapes: ' +
+                         ', '.join(str(detail['shape']) for detail in output_details))
+
+    first, second = [detail['name'].lower() for detail in per_detection]
+    if 'score' in first or 'class' in second:
+        per_detection.reverse()
+    indices['detection_classes'] = per_detection[0]['index']
+    indices['detection_scores'] = per_detection[1]['index']
+    return indices
+
+
+class TFLiteObjectDetectionModel(ObjectDetectionModel):
+    """A model exported with export_tflite_graph_tf2.py and converted to TFLite.
+
+    Its input is a fixed-size float image scaled to [-1, 1] (or the quantized equivalent), so
+    images are resized to fit; the boxes it returns are normalized and need no change.  The
+    detection post-processing op numbers classes from 0, the label map from 1.
+    """
+
+    def __init__(self, model_path, label_path, name=None, num_threads=None):
+        super(TFLiteObjectDetectionModel, self).__init__(label_path,
+                                                         name or model_name(model_path))
+        # XNNPACK is the default CPU delegate for float and dynamic-range quantized models.
+        self.interpreter = tf.lite.Interpreter(model_path=model_path,
+                                               num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        _, self.input_rows, self.input_cols, _ = self.input['shape']
+
+        self.output_indices = detection_output_indices(self.interpreter.get_output_details())
+
+    def _input_tensor(self, image):
+        resized = cv2.resize(image, (self.input_cols, self.input_rows),
+                             interpolation=cv2.INTER_LINEAR)
+        scaled = resized.astype(np.float32) / 127.5 - 1.0
+        if self.input['dtype'] != np.float32:
+            scale, zero_point = self.input['quantization']
+            scaled = np.round(scaled / scale + zero_point).astype(self.input['dtype'])
+        return scaled[np.newaxis, ...]
+
+    def predict(self, image):
+        self.interpreter.set_tensor(self.input['index'], self._input_tensor(image))
+        self.interpreter.invoke()
+        detections = {
+            key: self.interpreter.get_tensor(index)
+            for key, index in self.output_indices.items()
+        }
+        detections['detection_classes'] = detections['detection_classes'].astype(np.int64) + 1
+        return detections
+
+
+class OnnxObjectDetectionModel(ObjectDetectionModel):
+    """A SavedModel converted with tf2onnx, run by ONNX Runtime on the CPU.
+
+    tf2onnx keeps the signature's input and output names, so the outputs come back under the
+    same keys as from TensorFlow.
+    """
+
+    def __init__(self, model_path, label_path, name=None, num_threads=None):
+        super(OnnxObjectDetectionModel, self).__init__(label_path,
+                                                       name or model_name(model_path))
+        # Only this backend needs onnxruntime.
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads or os.cpu_count()
+        session_options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL)
+        self.session = onnxruntime.InferenceSession(model_path, session_options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def predict(self, image):
+        outputs = self.session.run(self.output_names, {self.input_name: image[np.newaxis, ...]})
+        detections = dict(zip(self.output_names, outputs))
+        detections['detection_classes'] = detections['detection_classes'].astype(np.int64)
+        return detections
+
+
+kBackendClasses = {
+    'tf': TensorFlowObjectDetectionModel,
+    'tftrt-fp16': TensorRTObjectDetectionModel,
+    'tftrt-int8': TensorRTObjectDetectionModel,
+    'tflite': TFLiteObjectDetectionModel,
+    'onnx': OnnxObjectDetectionModel,
+}
+
+
+def load_model(model_path, label_path, backend='tf'):
+    """Load the SavedModel at model_path with the given backend.
+
+    Falls back to plain TensorFlow, with a warning, if convert_models.py hasn't built the
+    backend's artifact.
+    """
+    path = artifact_path(model_path, backend)
+    if not os.path.exists(path):
+        print('Warning: no ' + backend + ' version of ' + model_name(model_path) + ' at ' + path +
+              ', using TensorFlow.  Run convert_models.py to build it.')
+        backend = 'tf'
+        path = model_path
+
+    model = kBackendClasses[backend](path, label_path, model_name(model_path))
+    model.backend = backend
+    return model
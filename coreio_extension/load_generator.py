@@ -0,0 +1,136 @@
+"""Load generator for network_compute_server.py.
+
+Talks to the worker's gRPC port directly, so no robot is needed.  Start the server on CPU
+without registering, then point this at it:
+
+    CUDA_VISIBLE_DEVICES=-1 python3 network_compute_server.py -m <model dir> <labels> \\
+        --no-register --no-debug --batch-window 0.01 localhost
+    python3 load_generator.py -m dogtoy-model --clients 5 --duration 30
+
+Run it once with --batch-window 0 on the server and once with a window to compare.
+"""
+
+import argparse
+import collections
+import sys
+import threading
+import time
+
+import cv2
+import grpc
+import numpy as np
+
+from bosdyn.api import (image_pb2, network_compute_bridge_pb2,
+                        network_compute_bridge_service_pb2_grpc)
+
+# Wait this long after a failed call.  A server that is down fails calls at once, and the
+# clients would otherwise spin on it for the rest of the run.
+kErrorBackoff = 0.1
+
+
+def load_jpeg(path, rows, cols):
+    if path:
+        with open(path, 'rb') as image_file:
+            data = image_file.read()
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), -1)
+        return data, image.shape[0], image.shape[1]
+
+    # Noise compresses badly, which keeps the decode cost honest.
+    image = np.random.randint(0, 255, (rows, cols), np.uint8)
+    _, encoded = cv2.imencode('.jpg', image)
+    return encoded.tobytes(), rows, cols
+
+
+def build_request(model, confidence, data, rows, cols):
+    request = network_compute_bridge_pb2.NetworkComputeRequest()
+    request.input_data.model_name = model
+    request.input_data.min_confidence = confidence
+    request.input_data.image.format = image_pb2.Image.FORMAT_JPEG
+    request.input_data.image.pixel_format = image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8
+    request.input_data.image.rows = rows
+    request.input_data.image.cols = cols
+    request.input_data.image.data = data
+    return request
+
+
+def client_loop(stub, request, stop_time, latencies, detections, errors, lock):
+    while time.time() < stop_time:
+        start = time.perf_counter()
+        try:
+            response = stub.NetworkCompute(request, timeout=30)
+        except grpc.RpcError as err:
+            with lock:
+                errors[err.code().name] += 1
+            time.sleep(kErrorBackoff)
+            continue
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            detections.append(len(response.object_in_image))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', help='Worker address, default: %(default)s',
+                        default='localhost:50051')
+    parser.add_argument('-m', '--model', help='Model name to request', required=True)
+    parser.add_argument('--image', help='JPEG to send (default: generated noise)')
+    parser.add_argument('--rows', default=480, type=int)
+    parser.add_argument('--cols', default=640, type=int)
+    parser.add_argument('--confidence', default=0.5, type=float)
+    parser.add_argument('--clients', help='Concurrent callers, default: %(default)s', default=5,
+                        type=int)
+    parser.add_argument('--duration', help='Seconds to run, default: %(default)s', default=20,
+                        type=float)
+    parser.add_argument('--warmup', help='Requests to send before measuring', default=3,
+                        type=int)
+    options = parser.parse_args(argv)
+
+    data, rows, cols = load_jpeg(options.image, options.rows, options.cols)
+    request = build_request(options.model, options.confidence, data, rows, cols)
+
+    channel = grpc.insecure_channel(options.server)
+    stub = network_compute_bridge_service_pb2_grpc.NetworkComputeBridgeWorkerStub(channel)
+
+    # The first calls pay for graph tracing, keep them out of the numbers.
+    for _ in range(options.warmup):
+        stub.NetworkCompute(request, timeout=120)
+
+    latencies = []
+    detections = []
+    errors = collections.Counter()
+    lock = threading.Lock()
+    start = time.time()
+    stop_time = start + options.duration
+    threads = [
+        threading.Thread(target=client_loop,
+                         args=(stub, request, stop_time, latencies, detections, errors, lock))
+        for _ in range(options.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    error_codes = ', '.join('{} {}'.format(code, count) for code, count in errors.most_common())
+    if not latencies:
+        print('No successful requests (errors: ' + (error_codes or 'none') + ').')
+        return False
+
+    latencies_ms = np.array(latencies) * 1000.0
+    print('clients:          {}'.format(options.clients))
+    print('requests:         {} ({} errors)'.format(len(latencies), sum(errors.values())))
+    if errors:
+        print('errors:           ' + error_codes)
+    print('requests/s:       {:.1f}'.format(len(latencies) / elapsed))
+    print('detections/s:     {:.1f}'.format(sum(detections) / elapsed))
+    print('latency p50 (ms): {:.1f}'.format(np.percentile(latencies_ms, 50)))
+    print('latency p95 (ms): {:.1f}'.format(np.percentile(latencies_ms, 95)))
+    print('latency p99 (ms): {:.1f}'.format(np.percentile(latencies_ms, 99)))
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
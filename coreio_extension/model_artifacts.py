@@ -0,0 +1,27 @@
+"""Where each inference backend's version of a model lives, without importing TensorFlow.
+
+Shared by the server (inference_backends.py), convert_models.py and package_extension.py.
+"""
+
+import os
+
+kBackends = ('tf', 'tftrt-fp16', 'tftrt-int8', 'tflite', 'onnx')
+
+kArtifacts = {
+    'tf': 'saved_model',
+    'tftrt-fp16': 'saved_model_trt_fp16',
+    'tftrt-int8': 'saved_model_trt_int8',
+    'tflite': 'model.tflite',
+    'onnx': 'model.onnx',
+}
+
+
+def model_name(model_path):
+    return os.path.basename(os.path.dirname(os.path.normpath(model_path)))
+
+
+def artifact_path(model_path, backend):
+    """Where the backend's version of the SavedModel at model_path lives."""
+    if backend == 'tf':
+        return model_path
+    return os.path.join(os.path.dirname(os.path.normpath(model_path)), kArtifacts[backend])
@@ -0,0 +1,646 @@
+# Copyright (c) 2023 Boston Dynamics, Inc.  All rights reserved.
+#
+# Downloading, reproducing, distributing or otherwise using the SDK Software
+# is subject to the terms and conditions of the Boston Dynamics Software
+# Development Kit License (20191101-BDSDK-SL).
+
+import argparse
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import cv2
+import grpc
+import numpy as np
+from google.protobuf import struct_pb2, wrappers_pb2
+from PIL import Image
+
+import bosdyn.client
+import bosdyn.client.util
+from bosdyn.api import (header_pb2, image_pb2, network_compute_bridge_pb2,
+                        network_compute_bridge_service_pb2_grpc)
+from bosdyn.client.directory import DirectoryClient
+from bosdyn.client.directory_registration import DirectoryRegistrationClient
+
+from inference_backends import kBackends, load_model, model_name
+from shm_ring import SharedFrames
+
+kServiceAuthority = "fetch-tutorial-worker.spot.robot"
+
+
+class LazyModel:
+    """Stands in for a model that is only loaded on first use.
+
+    For models that are rarely asked for: startup skips them, and the request that first needs
+    one pays for loading it.
+    """
+
+    def __init__(self, model_path, label_path, backend, status):
+        self.model_path = model_path
+        self.label_path = label_path
+        self.backend = backend
+        self.status = status
+        self.name = model_name(model_path)
+        self._model = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes LazyModel doesn't have itself, i.e. the real model's.
+        if self._model is None:
+            start = time.time()
+            self._model = load_model(self.model_path, self.label_path, self.backend)
+            print('Loaded lazy model {} in {:.1f} s'.format(self.name, time.time() - start))
+            self.status.set_model_state(self.name, 'loaded')
+        return getattr(self._model, attr)
+
+
+class ServerStatus:
+    """Startup progress, shared between the ML thread, main and the readiness probe."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.time_to_ready = None
+        self.ready = threading.Event()
+        self.failed = threading.Event()
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def set_model_state(self, name, state):
+        with self._lock:
+            self._models[name] = state
+
+    def set_ready(self):
+        self.time_to_ready = time.time() - self.start_time
+        self.ready.set()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'ready': self.ready.is_set(),
+                'time_to_ready': self.time_to_ready,
+                'uptime': time.time() - self.start_time,
+                'models': dict(self._models),
+            }
+
+
+def serve_readiness(status, port):
+    """Answer GET /ready with 200 once the models are warm and 503 before, plus a JSON body.
+
+    For the container healthcheck; runs on its own daemon thread.
+    """
+
+    class ReadinessHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('/ready', ''):
+                self.send_error(404)
+                return
+            body = json.dumps(status.as_dict()).encode('utf-8')
+            self.send_response(200 if status.ready.is_set() else 503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Healthchecks would otherwise log a line every few seconds.
+            pass
+
+    server = HTTPServer(('', port), ReadinessHandler)
+    thread = threading.Thread(target=server.serve_forever, name='readiness')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+class PendingRequest:
+    """A request waiting in the processing queue, plus a slot for its response."""
+
+    def __init__(self, request):
+        self.request = request
+        self.response = None
+        self._done = threading.Event()
+
+    def set_response(self, response):
+        self.response = response
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        return self.response
+
+
+def collect_batch(request_queue, batch_window, max_batch_size):
+    """Block for one request, then keep collecting for up to batch_window seconds."""
+    batch = [request_queue.get()]
+    deadline = time.time() + batch_window
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(request_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def request_params(request):
+    """The Struct a client packed into input_data.other_data, or None.
+
+    Clients use it for options the NetworkComputeInputData has no field for: the region of
+    interest (crop_to_roi) and frames passed through shared memory (frame_ref).
+    """
+    other_data = request.input_data.other_data
+    if not other_data.Is(struct_pb2.Struct.DESCRIPTOR):
+        return None
+    params = struct_pb2.Struct()
+    other_data.Unpack(params)
+    return params
+
+
+def frame_ref(request):
+    """(ring name, sequence number) of a frame passed through shared memory, or None."""
+    params = request_params(request)
+    if params is None or 'shm_ring' not in params.fields:
+        return None
+    return params['shm_ring'], int(params['shm_seq'])
+
+
+def decode_image(request, frames=None):
+    """Unpack the incoming image as an RGB numpy array.  Returns None if it can't be read.
+
+    With frames (a shm_ring.SharedFrames), requests can name a frame in a shared-memory ring
+    instead of carrying the image; RGB frames are then used in place, without a copy.
+    """
+    ref = frame_ref(request)
+    if ref is not None:
+        if frames is None:
+            print('Error: got a shared-memory frame, but --shared-memory is off.')
+            return None
+        image = frames.get(*ref)
+        if image is None:
+            print('Error: frame {} of ring {} is gone.'.format(ref[1], ref[0]))
+            return None
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        return image
+
+    if request.input_data.image.format == image_pb2.Image.FORMAT_RAW:
+        pil_image = Image.open(io.BytesIO(request.input_data.image.data))
+        if request.input_data.image.pixel_format == image_pb2.Image.PIXEL_FORMAT_GREYSCALE_U8:
+            # If the input image is grayscale, convert it to RGB.
+            image = cv2.cvtColor(np.asarray(pil_image), cv2.COLOR_GRAY2RGB)
+
+        elif request.input_data.image.pixel_format == image_pb2.Image.PIXEL_FORMAT_RGB_U8:
+            # Already an RGB image.
+            image = np.asarray(pil_image)
+
+        else:
+            print('Error: image input in unsupported pixel format: ',
+                  request.input_data.image.pixel_format)
+            return None
+
+    elif request.input_data.image.format == image_pb2.Image.FORMAT_JPEG:
+        dtype = np.uint8
+        jpg = np.frombuffer(request.input_data.image.data, dtype=dtype)
+        image = cv2.imdecode(jpg, -1)
+
+        if len(image.shape) < 3:
+            # If the input image is grayscale, convert it to RGB.
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+    else:
+        print('Error: unsupported image format: ', request.input_data.image.format)
+        return None
+
+    return image
+
+
+def crop_to_roi(request, image):
+    """Cut image down to the region of interest the client asked for, if any.
+
+    The client packs a Struct into input_data.other_data with "roi": [x_min, y_min, x_max,
+    y_max] in full image pixels and optionally "roi_scale", a factor to shrink the crop by.
+    Returns the image to run the model on and the (x_min, y_min, scale) that maps its pixels
+    back to the full image.
+    """
+    params = request_params(request)
+    if params is None or 'roi' not in params.fields:
+        return image, None
+
+    rows, cols = image.shape[:2]
+    x_min, y_min, x_max, y_max = [int(round(value)) for value in params['roi']]
+    x_min, x_max = max(0, x_min), min(cols, x_max)
+    y_min, y_max = max(0, y_min), min(rows, y_max)
+    if x_max - x_min < 2 or y_max - y_min < 2:
+        # Nothing left of the window, run on the whole frame.
+        return image, None
+
+    crop = image[y_min:y_max, x_min:x_max]
+    scale = params['roi_scale'] if 'roi_scale' in params.fields else 1.0
+    if 0 < scale < 1:
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)),
+                                 max(1, int(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    else:
+        scale = 1.0
+    return np.ascontiguousarray(crop), (x_min, y_min, scale)
+
+
+def fill_response(out_proto, model, image, detections, min_confidence, debug, tag_model=False,
+                  roi=None):
+    """Append the detections above min_confidence to out_proto.
+
+    With tag_model, object names carry the model they came from
+    ("obj<N>_model_<model>_label_<label>") so results of a combined request can be told apart.
+    Clients splitting on "_label_" keep working either way.
+
+    image is what the model ran on; with roi (from crop_to_roi) the vertices are mapped back to
+    the full image, so the robot and client never see crop coordinates.
+    """
+    roi_x, roi_y, roi_scale = roi if roi is not None else (0, 0, 1.0)
+    if debug:
+        # Draw on a copy: the other models of a combined request run on the same array, and
+        # shared-memory frames are read-only.
+        image = image.copy()
+    image_width = image.shape[0]
+    image_height = image.shape[1]
+
+    num_objects = 0
+
+    boxes = detections['detection_boxes']
+    classes = detections['detection_classes']
+    scores = detections['detection_scores']
+
+    for i in range(len(boxes)):
+
+        label = model.category_index[classes[i]]['name']
+
+        box = tuple(boxes[i].tolist())
+
+        # Boxes come in with normalized coordinates.  Convert to pixel values.
+        box = [
+            box[0] * image_width, box[1] * image_height, box[2] * image_width,
+            box[3] * image_height
+        ]
+
+        score = scores[i]
+
+        if score < min_confidence:
+            continue
+
+        print('Found object with label: "' + label + '" and score: ' + str(score))
+
+        point1 = np.array([box[1], box[0]])
+        point2 = np.array([box[3], box[0]])
+        point3 = np.array([box[3], box[2]])
+        point4 = np.array([box[1], box[2]])
+
+        # Add data to the output proto.
+        out_obj = out_proto.object_in_image.add()
+        out_obj.name = "obj" + str(len(out_proto.object_in_image) - 1)
+        if tag_model:
+            out_obj.name += "_model_" + model.name
+        out_obj.name += "_label_" + label
+
+        vertex1 = out_obj.image_properties.coordinates.vertexes.add()
+        vertex1.x = roi_x + point1[0] / roi_scale
+        vertex1.y = roi_y + point1[1] / roi_scale
+
+        vertex2 = out_obj.image_properties.coordinates.vertexes.add()
+        vertex2.x = roi_x + point2[0] / roi_scale
+        vertex2.y = roi_y + point2[1] / roi_scale
+
+        vertex3 = out_obj.image_properties.coordinates.vertexes.add()
+        vertex3.x = roi_x + point3[0] / roi_scale
+        vertex3.y = roi_y + point3[1] / roi_scale
+
+        vertex4 = out_obj.image_properties.coordinates.vertexes.add()
+        vertex4.x = roi_x + point4[0] / roi_scale
+        vertex4.y = roi_y + point4[1] / roi_scale
+
+        # Pack the confidence value.
+        confidence = wrappers_pb2.FloatValue(value=score)
+        out_obj.additional_properties.Pack(confidence)
+
+        num_objects += 1
+
+        if debug:
+            polygon = np.array([point1, point2, point3, point4], np.int32)
+            polygon = polygon.reshape((-1, 1, 2))
+            cv2.polylines(image, [polygon], True, (0, 255, 0), 2)
+
+            caption = "{}: {:.3f}".format(label, score)
+            left_x = min(point1[0], min(point2[0], min(point3[0], point4[0])))
+            top_y = min(point1[1], min(point2[1], min(point3[1], point4[1])))
+            cv2.putText(image, caption, (int(left_x), int(top_y)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 255, 0), 2)
+
+    print('Found ' + str(num_objects) + ' object(s) with ' + model.name)
+
+    if debug:
+        debug_image_filename = 'network_compute_server_output.jpg'
+        cv2.imwrite(debug_image_filename, image)
+        print('Wrote debug image output to: "' + debug_image_filename + '"')
+
+
+def error_response(err_str):
+    print(err_str)
+    out_proto = network_compute_bridge_pb2.NetworkComputeResponse()
+    # Set the error in the header.
+    out_proto.header.error.code = header_pb2.CommonError.CODE_INVALID_REQUEST
+    out_proto.header.error.message = err_str
+    return out_proto
+
+
+def process_batch(models, batch, debug, frames=None):
+    # Work out which model(s) each request wants and decode its image once.  A request can name
+    # several models separated by commas; each of them runs on the same decoded image.  Images
+    # of the same size going to the same model are stacked into one tensor.  frames resolves
+    # images passed through shared memory, if that is enabled.
+    groups = {}
+    outputs = []
+    for pending in batch:
+        request = pending.request
+
+        if isinstance(request, network_compute_bridge_pb2.ListAvailableModelsRequest):
+            out_proto = network_compute_bridge_pb2.ListAvailableModelsResponse()
+            for model_name in models:
+                out_proto.available_models.append(model_name)
+            pending.set_response(out_proto)
+            continue
+
+        # Find the model(s)
+        model_names = request.input_data.model_name.split(',')
+        missing = [model_name for model_name in model_names if model_name not in models]
+        if missing:
+            pending.set_response(
+                error_response('Cannot find model "' + ','.join(missing) +
+                               '" in loaded models.'))
+            continue
+
+        image = decode_image(request, frames)
+        if image is None:
+            pending.set_response(network_compute_bridge_pb2.NetworkComputeResponse())
+            continue
+        image, roi = crop_to_roi(request, image)
+
+        out_proto = network_compute_bridge_pb2.NetworkComputeResponse()
+        outputs.append((pending, out_proto, frame_ref(request)))
+        tag_model = len(model_names) > 1
+        for model_name in model_names:
+            key = (model_name, image.shape)
+            groups.setdefault(key, []).append((pending, out_proto, image, tag_model, roi))
+
+    for (model_name, _), items in groups.items():
+        model = models[model_name]
+        all_detections = model.predict_batch([item[2] for item in items])
+        if len(items) > 1:
+            print('Ran ' + model_name + ' on a batch of ' + str(len(items)) + ' images')
+
+        for (pending, out_proto, image, tag_model, roi), detections in zip(items, all_detections):
+            fill_response(out_proto, model, image, detections,
+                          pending.request.input_data.min_confidence, debug, tag_model, roi)
+
+    # Only answer once every model a request asked for has run.
+    for pending, out_proto, ref in outputs:
+        if ref is not None and not frames.valid(*ref):
+            # The producer reused the slot while the model was reading it.
+            pending.set_response(
+                error_response('Frame {} of ring {} was overwritten during inference; use a '
+                               'longer ring.'.format(ref[1], ref[0])))
+            continue
+        pending.set_response(out_proto)
+
+
+def load_models(args, status):
+    """Load (and unless disabled, warm up) every -m model; --lazy-model ones wait for first use."""
+    models = {}
+    for model_path, label_path, backend in args.lazy_model:
+        lazy_model = LazyModel(model_path, label_path, backend, status)
+        models[lazy_model.name] = lazy_model
+        status.set_model_state(lazy_model.name, 'lazy')
+
+    for model_path, label_path, backend in args.model:
+        start = time.time()
+        this_model = load_model(model_path, label_path, backend)
+        models[this_model.name] = this_model
+        load_time = time.time() - start
+        status.set_model_state(this_model.name, 'loaded')
+
+        if args.no_warmup:
+            print('Loaded {} ({}) in {:.1f} s'.format(this_model.name, this_model.backend,
+                                                      load_time))
+            continue
+        start = time.time()
+        this_model.warm_up(*args.warmup_shape)
+        status.set_model_state(this_model.name, 'warm')
+        print('Loaded {} ({}) in {:.1f} s, warm-up inference took {:.1f} s'.format(
+            this_model.name, this_model.backend, load_time, time.time() - start))
+    return models
+
+
+def parse_model_args(parser, model_args):
+    """[MODEL_DIR, LABELS] or [MODEL_DIR, LABELS, BACKEND] -> (MODEL_DIR, LABELS, BACKEND)."""
+    parsed = []
+    for model_arg in model_args or []:
+        if len(model_arg) not in (2, 3):
+            parser.error('models take MODEL_DIR LABELS_FILE [BACKEND], got: ' +
+                         ' '.join(model_arg))
+        backend = model_arg[2] if len(model_arg) == 3 else 'tf'
+        if backend not in kBackends:
+            parser.error('unknown backend "' + backend + '", choose from: ' +
+                         ', '.join(kBackends))
+        parsed.append((model_arg[0], model_arg[1], backend))
+    return parsed
+
+
+def process_thread(args, request_queue, status):
+    try:
+        models = load_models(args, status)
+    except Exception:
+        logging.exception('Failed to load models')
+        status.failed.set()
+        return
+    status.set_ready()
+
+    print('')
+    print('Service ' + args.name + ' running on port: ' + str(args.port))
+    print('Ready {:.1f} s after start'.format(status.time_to_ready))
+
+    print('Loaded models:')
+    for model_name in models:
+        print('    ' + model_name)
+
+    frames = None
+    if args.shared_memory:
+        frames = SharedFrames(args.shm_dir)
+        print('Accepting shared-memory frames from rings in ' + args.shm_dir)
+
+    while True:
+        batch = collect_batch(request_queue, args.batch_window, args.max_batch_size)
+        try:
+            process_batch(models, batch, not args.no_debug, frames)
+        except Exception as err:
+            # Never leave a caller waiting forever on a response.
+            logging.exception('Failed to process batch')
+            for pending in batch:
+                if pending.response is None:
+                    pending.set_response(error_response('Server error: ' + str(err)))
+
+
+class NetworkComputeBridgeWorkerServicer(
+        network_compute_bridge_service_pb2_grpc.NetworkComputeBridgeWorkerServicer):
+
+    def __init__(self, thread_input_queue):
+        super(NetworkComputeBridgeWorkerServicer, self).__init__()
+
+        self.thread_input_queue = thread_input_queue
+
+    def NetworkCompute(self, request, context):
+        print('Got NetworkCompute request')
+        pending = PendingRequest(request)
+        self.thread_input_queue.put(pending)
+        return pending.wait()
+
+    def ListAvailableModels(self, request, context):
+        print('Got ListAvailableModels request')
+        pending = PendingRequest(request)
+        self.thread_input_queue.put(pending)
+        return pending.wait()
+
+
+def register_with_robot(options):
+    """ Registers this worker with the robot's Directory."""
+    ip = bosdyn.client.common.get_self_ip(options.hostname)
+    print('Detected IP address as: ' + ip)
+
+    sdk = bosdyn.client.create_standard_sdk("tensorflow_server")
+
+    robot = sdk.create_robot(options.hostname)
+
+    # Authenticate robot before being able to use it
+    robot.authenticate_from_payload_credentials(
+        *bosdyn.client.util.get_guid_and_secret(options))
+
+    directory_client = robot.ensure_client(DirectoryClient.default_service_name)
+    directory_registration_client = robot.ensure_client(
+        DirectoryRegistrationClient.default_service_name)
+
+    # Check to see if a service is already registered with our name
+    services = directory_client.list()
+    for s in services:
+        if s.name == options.name:
+            print("WARNING: existing service with name, \"" + options.name + "\", removing it.")
+            directory_registration_client.unregister(options.name)
+            break
+
+    # Register service
+    print('Attempting to register ' + ip + ':' + options.port + ' onto ' + options.hostname +
+          ' directory...')
+    directory_registration_client.register(options.name,
+                                           "bosdyn.api.NetworkComputeBridgeWorker",
+                                           kServiceAuthority, ip, int(options.port))
+
+
+def main(argv):
+    default_port = '50051'
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-m', '--model', help=
+        '[MODEL_DIR] [LABELS_FILE.pbtxt] [BACKEND]: Path to a model\'s directory, path to its '
+        'labels .pbtxt file and optionally how to run it (' + ', '.join(kBackends) + ')',
+        action='append', nargs='+', required=True)
+    parser.add_argument(
+        '--lazy-model', help='[MODEL_DIR] [LABELS_FILE.pbtxt] [BACKEND]: Like -m, but only '
+        'loaded when first requested.  For rarely used models.', action='append', nargs='+')
+    parser.add_argument('--no-warmup', action='store_true',
+                        help='Skip the warm-up inference on each model at startup.')
+    parser.add_argument(
+        '--warmup-shape', help='ROWS COLS of the blank warm-up image, default: %(default)s',
+        nargs=2, type=int, default=[480, 640])
+    parser.add_argument(
+        '--health-port', help='Serve a readiness probe at http://<host>:PORT/ready.  0 '
+        'disables it, default: %(default)s', default=0, type=int)
+    parser.add_argument('-p', '--port', help='Server\'s port number, default: ' + default_port,
+                        default=default_port)
+    parser.add_argument('-d', '--no-debug', help='Disable writing debug images.',
+                        action='store_true')
+    parser.add_argument('-n', '--name', help='Service name', default='fetch-server')
+    parser.add_argument(
+        '--batch-window', help='Seconds to wait for more requests before running a batch, '
+        'default: %(default)s', default=0.01, type=float)
+    parser.add_argument('--max-batch-size', help='Most requests run together, default: '
+                        '%(default)s', default=8, type=int)
+    parser.add_argument(
+        '--shared-memory', action='store_true',
+        help='Also accept requests that name a frame in a shared-memory ring instead of carrying '
+        'the image, from clients on the same machine.  See shm_ring.py.')
+    parser.add_argument('--shm-dir', help='Where the rings are, default: %(default)s',
+                        default='/dev/shm')
+    parser.add_argument(
+        '--no-register', action='store_true',
+        help='Serve without registering with the robot directory, e.g. for load testing.')
+    bosdyn.client.util.add_payload_credentials_arguments(parser)
+    bosdyn.client.util.add_base_arguments(parser)
+
+    options = parser.parse_args(argv)
+    # The optional BACKEND picks how the model runs: one of tf (default), tftrt-fp16,
+    # tftrt-int8, tflite or onnx.  See inference_backends.py and convert_models.py.
+    options.model = parse_model_args(parser, options.model)
+    options.lazy_model = parse_model_args(parser, options.lazy_model)
+
+    print(options.model)
+
+    for model in options.model + options.lazy_model:
+        if not os.path.isdir(model[0]):
+            print('Error: model directory (' + model[0] + ') not found or is not a directory.')
+            sys.exit(1)
+
+    status = ServerStatus()
+    if options.health_port:
+        serve_readiness(status, options.health_port)
+
+    # Thread-safe queue for communication between the GRPC endpoint and the ML thread.  Each
+    # entry carries its own response slot so concurrent callers get their own results back.
+    request_queue = queue.Queue()
+
+    # Start server thread.  It loads and warms up the models before taking requests.
+    thread = threading.Thread(target=process_thread, args=([options, request_queue, status]))
+    thread.start()
+
+    # Set up GRPC endpoint.  Requests arriving before the models are ready wait in the queue.
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    network_compute_bridge_service_pb2_grpc.add_NetworkComputeBridgeWorkerServicer_to_server(
+        NetworkComputeBridgeWorkerServicer(request_queue), server)
+    server.add_insecure_port('[::]:' + options.port)
+    server.start()
+
+    # Only show up in the robot's directory once the first request won't stall.
+    while not status.ready.wait(1.0):
+        if status.failed.is_set() or not thread.is_alive():
+            server.stop(0)
+            return False
+
+    # Perform registration.
+    if not options.no_register:
+        register_with_robot(options)
+
+    print('Running...')
+    thread.join()
+
+    return True
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    if not main(sys.argv[1:]):
+        sys.exit(1)
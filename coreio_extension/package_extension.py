@@ -0,0 +1,336 @@
+"""Build fetch_detector.spx, redoing only what changed since the last build.
+
+    python3 package_extension.py --fetch-dir ~/fetch
+
+Stages, each timed in the report at the end (and appended to package_report.jsonl):
+
+    sources   copy models-with-protos and each model into model-cache/, skipping any whose
+              content hash is unchanged
+    convert   build the backend artifacts docker-compose.yml asks for (convert_models.py in the
+              image's converter stage), skipped when they all exist
+    data      assemble data/ with only the files each model's backend loads and its label map
+    builder,  docker build each Dockerfile.l4t stage the extension needs; the runtime stage is
+    runtime   the shipped image, without pip, build tools or conversion dependencies
+    save      docker save | pigz the runtime image, skipped if its image ID hasn't changed
+    package   tar everything into the .spx
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tarfile
+import time
+
+from model_artifacts import artifact_path, kArtifacts, kBackends
+
+kImage = 'fetch_detector'
+kImageTar = 'fetch_detector_image.tar.gz'
+kSpx = 'fetch_detector.spx'
+kCacheDir = 'model-cache'
+kDataDir = 'data'
+kDataMount = '/data/'
+kModelFlags = ('-m', '--model', '--lazy-model')
+
+
+def model_sources(fetch_dir):
+    """Model name -> [(source path, destination inside the model's folder)]."""
+    dogtoy = os.path.join(fetch_dir, 'dogtoy')
+    coco = 'ssd_resnet50_v1_fpn_640x640_coco17_tpu-8'
+    return {
+        'dogtoy-model': [
+            (os.path.join(dogtoy, 'exported-models', 'dogtoy-model'), ''),
+            (os.path.join(dogtoy, 'annotations', 'label_map.pbtxt'), 'label_map.pbtxt'),
+        ],
+        # Includes its label map.
+        coco: [(os.path.join(dogtoy, 'pre-trained-models', coco), '')],
+    }
+
+
+def content_hash(paths):
+    """sha256 over the names and contents of every file under paths."""
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            files = [(os.path.basename(path), path)]
+        else:
+            files = sorted((os.path.relpath(os.path.join(root, name), path),
+                            os.path.join(root, name))
+                           for root, _, names in os.walk(path)
+                           for name in names)
+        for relative, full in files:
+            digest.update(relative.encode('utf-8') + b'\0')
+            with open(full, 'rb') as source_file:
+                for chunk in iter(lambda: source_file.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def sync_tree(sources, destination):
+    """Copy sources ([(source, relative destination)]) into destination unless they haven't
+    changed since the last copy.  Returns True if it copied."""
+    hash_path = destination.rstrip('/') + '.sha256'
+    source_hash = content_hash([source for source, _ in sources])
+    if os.path.isdir(destination) and os.path.exists(hash_path):
+        with open(hash_path) as hash_file:
+            if hash_file.read().strip() == source_hash:
+                return False
+
+    remove(destination)
+    for source, relative in sources:
+        target = os.path.join(destination, relative) if relative else destination
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+    with open(hash_path, 'w') as hash_file:
+        hash_file.write(source_hash + '\n')
+    return True
+
+
+def used_models(compose_path):
+    """[(model name, backend, label file inside the model's folder)] from the compose command."""
+    with open(compose_path) as compose_file:
+        tokens = ' '.join(line.split('#')[0] for line in compose_file).split()
+
+    models = []
+    for index, token in enumerate(tokens):
+        if token not in kModelFlags:
+            continue
+        model_path, label_path = tokens[index + 1:index + 3]
+        backend = tokens[index + 3] if index + 3 < len(tokens) else 'tf'
+        if backend not in kBackends:
+            backend = 'tf'
+        name = os.path.relpath(model_path, kDataMount).split(os.sep)[0]
+        models.append((name, backend, os.path.relpath(label_path, kDataMount + name)))
+    return models
+
+
+def link_tree(source, target):
+    """Hard link source (file or folder) to target, copying where links aren't possible."""
+    if os.path.isdir(source):
+        shutil.copytree(source, target, copy_function=link_or_copy)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        link_or_copy(source, target)
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names)
+
+
+class Report:
+    """Time, output size and outcome of each stage."""
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, fn, *args):
+        start = time.time()
+        size, note = fn(*args)
+        self.stages.append({
+            'stage': name,
+            'seconds': round(time.time() - start, 2),
+            'bytes': size,
+            'note': note
+        })
+
+    def show(self):
+        print('')
+        print('{:<10} {:>9} {:>10}  {}'.format('stage', 'time (s)', 'size (MB)', ''))
+        for stage in self.stages:
+            size = '' if stage['bytes'] is None else '{:.1f}'.format(stage['bytes'] / 1e6)
+            print('{:<10} {:>9.1f} {:>10}  {}'.format(stage['stage'], stage['seconds'], size,
+                                                     stage['note']))
+        print('{:<10} {:>9.1f}'.format('total', sum(stage['seconds'] for stage in self.stages)))
+
+    def append_to(self, path):
+        with open(path, 'a') as report_file:
+            report_file.write(json.dumps({'time': time.time(), 'stages': self.stages}) + '\n')
+
+
+class Packager:
+
+    def __init__(self, options):
+        self.options = options
+        self.docker = shlex.split(options.docker)
+        self.models = used_models('docker-compose.yml')
+        self.sources = model_sources(options.fetch_dir)
+
+    def _docker(self, *args, **kwargs):
+        return subprocess.check_output(self.docker + list(args), **kwargs).decode('utf-8').strip()
+
+    def image_size(self, tag):
+        return int(self._docker('image', 'inspect', '-f', '{{.Size}}', tag))
+
+    def sync_sources(self):
+        copied = []
+        if sync_tree([(os.path.join(self.options.fetch_dir, 'models-with-protos'), '')],
+                     'models-with-protos'):
+            copied.append('models-with-protos')
+        for name, _, _ in self.models:
+            if name not in self.sources:
+                raise ValueError('docker-compose.yml uses ' + name + ', which model_sources() '
+                                 'does not know where to find')
+            if sync_tree(self.sources[name], os.path.join(kCacheDir, name)):
+                copied.append(name)
+        return tree_size(kCacheDir), ('copied ' + ', '.join(copied)) if copied else 'unchanged'
+
+    def _missing_artifacts(self):
+        missing = {}
+        for name, backend, _ in self.models:
+            saved_model = os.path.join(kCacheDir, name, kArtifacts['tf'])
+            if backend != 'tf' and not os.path.exists(artifact_path(saved_model, backend)):
+                missing.setdefault(name, []).append(backend)
+        return missing
+
+    def convert(self):
+        missing = self._missing_artifacts()
+        if not missing:
+            return None, 'artifacts up to date'
+
+        self.build_stage('converter')
+        # Run as ourselves, so the artifacts in model-cache/ aren't owned by root.
+        docker_args = [
+            'run', '--rm', '--user', '{}:{}'.format(os.getuid(), os.getgid()), '-v',
+            os.path.abspath(kCacheDir) + ':/models'
+        ]
+        if any(backend.startswith('tftrt') for backends in missing.values()
+               for backend in backends):
+            docker_args += ['--runtime', 'nvidia']
+        convert_args = []
+        if self.options.calibration_images and os.path.isdir(self.options.calibration_images):
+            docker_args += ['-v', os.path.abspath(self.options.calibration_images) +
+                            ':/calibration:ro']
+            convert_args += ['--calibration-images', '/calibration']
+
+        failed = []
+        for name, backends in missing.items():
+            try:
+                subprocess.check_call(self.docker + docker_args + [kImage + ':converter'] +
+                                      ['--backends'] + backends + convert_args +
+                                      ['/models/' + name])
+            except subprocess.CalledProcessError:
+                failed.append(name)
+        note = 'built ' + ', '.join('{} {}'.format(name, ' '.join(backends))
+                                    for name, backends in missing.items())
+        if failed:
+            note += '; failed for ' + ', '.join(failed) + ', shipping their SavedModel'
+        return None, note
+
+    def assemble_data(self):
+        remove(kDataDir)
+        shipped = []
+        for name, backend, label_file in self.models:
+            model_dir = os.path.join(kCacheDir, name)
+            saved_model = os.path.join(model_dir, kArtifacts['tf'])
+            artifact = artifact_path(saved_model, backend)
+            if not os.path.exists(artifact):
+                # The server falls back to TensorFlow without it.
+                artifact = saved_model
+            link_tree(artifact, os.path.join(kDataDir, name, os.path.relpath(artifact,
+                                                                              model_dir)))
+            link_tree(os.path.join(model_dir, label_file),
+                      os.path.join(kDataDir, name, label_file))
+            shipped.append('{} ({})'.format(name, os.path.basename(artifact)))
+        return tree_size(kDataDir), ', '.join(shipped)
+
+    def build_stage(self, stage):
+        tag = '{}:{}'.format(kImage, 'l4t' if stage == 'runtime' else stage)
+        self._docker('build', '--target', stage, '-t', tag, '-f', 'Dockerfile.l4t', '.',
+                     stderr=subprocess.STDOUT)
+        return self.image_size(tag), tag
+
+    def save_image(self):
+        tag = kImage + ':l4t'
+        image_id = self._docker('image', 'inspect', '-f', '{{.Id}}', tag)
+        id_path = kImageTar + '.id'
+        if os.path.exists(kImageTar) and os.path.exists(id_path):
+            with open(id_path) as id_file:
+                if id_file.read().strip() == image_id:
+                    return os.path.getsize(kImageTar), 'image unchanged'
+
+        compressor = ['pigz'] if shutil.which('pigz') else ['gzip']
+        with open(kImageTar, 'wb') as out:
+            save = subprocess.Popen(self.docker + ['save', tag], stdout=subprocess.PIPE)
+            compress = subprocess.Popen(compressor, stdin=save.stdout, stdout=out)
+            save.stdout.close()
+            if compress.wait() != 0 or save.wait() != 0:
+                remove(kImageTar)
+                raise RuntimeError('docker save failed')
+        with open(id_path, 'w') as id_file:
+            id_file.write(image_id + '\n')
+        return os.path.getsize(kImageTar), compressor[0]
+
+    def package(self):
+        # The image tarball is already compressed, so the outer gzip only needs to be quick.
+        with tarfile.open(kSpx, 'w:gz', compresslevel=1) as spx:
+            for path in (kImageTar, 'manifest.json', 'docker-compose.yml', kDataDir):
+                spx.add(path)
+        return os.path.getsize(kSpx), kSpx
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fetch-dir', default=os.path.expanduser('~/fetch'),
+                        help='Where the models and models-with-protos are, default: %(default)s')
+    parser.add_argument('--calibration-images', metavar='DIR',
+                        help='Images for INT8 calibration, default: <fetch-dir>/dogtoy/images/test')
+    parser.add_argument('--docker', default='sudo docker',
+                        help='Command to run docker, default: %(default)s')
+    parser.add_argument('--report', default='package_report.jsonl',
+                        help='Append each build\'s stage times and sizes here')
+    options = parser.parse_args(argv)
+    if options.calibration_images is None:
+        options.calibration_images = os.path.join(options.fetch_dir, 'dogtoy', 'images', 'test')
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    packager = Packager(options)
+    report = Report()
+    try:
+        report.run('sources', packager.sync_sources)
+        report.run('convert', packager.convert)
+        report.run('data', packager.assemble_data)
+        report.run('builder', packager.build_stage, 'builder')
+        report.run('runtime', packager.build_stage, 'runtime')
+        report.run('save', packager.save_image)
+        report.run('package', packager.package)
+    except (subprocess.CalledProcessError, RuntimeError, ValueError) as err:
+        report.show()
+        print('Error: ' + str(err))
+        if isinstance(err, subprocess.CalledProcessError) and err.output:
+            print(err.output.decode('utf-8', 'replace')[-2000:])
+        return False
+
+    report.show()
+    report.append_to(options.report)
+    return True
+
+
+if __name__ == '__main__':
+    if not main(sys.argv[1:]):
+        sys.exit(1)
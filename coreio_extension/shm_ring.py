@@ -0,0 +1,221 @@
+"""Hand images to network_compute_server.py through shared memory instead of gRPC.
+
+When the process producing images runs on the same machine as the server (both on the Core
+I/O), the pixels don't need to be serialized into a protobuf, sent over a socket and decoded
+again.  The producer writes each frame once into a ring of slots in a file in /dev/shm, and sends
+the server an ordinary NetworkComputeRequest that carries no image, only the ring's name and the
+frame's sequence number.  The server maps the same file and runs the model on a numpy view of the
+slot, so the frame is never copied.  The detections come back over gRPC as usual.
+
+    ring = FrameRingWriter('spot-frames', num_slots=8, slot_size=640 * 480 * 3)
+    seq = ring.write(image)
+    pack_frame_ref(request.input_data, ring.name, seq)
+    response = stub.NetworkCompute(request)
+
+Each ring has a single writer.  A slot is reused num_slots frames later, so a frame the server
+hasn't finished with can be overwritten; readers check the slot's sequence number before and
+after using it and drop the frame if it changed.  Make the ring longer than the number of
+requests in flight.
+
+Layout: a 64 byte header (magic, num_slots, slot_size, frames written), then num_slots slots of
+a 64 byte slot header (seq, rows, cols, channels, timestamp) followed by slot_size bytes of
+uint8 pixels, rows x cols x channels.  seq is 0 while a slot is being written.
+"""
+
+import mmap
+import os
+import re
+import struct
+import time
+
+import numpy as np
+from google.protobuf import struct_pb2
+
+kMagic = b'SHMRING1'
+kDefaultDirectory = '/dev/shm'
+kHeaderSize = 64
+kSlotHeaderSize = 64
+
+kHeader = struct.Struct('<8sIIQ')
+kCountOffset = 16
+kCount = struct.Struct('<Q')
+kSlotHeader = struct.Struct('<QIIId')
+kSeq = struct.Struct('<Q')
+
+# Ring names become file names; keep them to one plain path component.
+kNamePattern = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9_.-]*$')
+
+
+def ring_path(name, directory=kDefaultDirectory):
+    if not kNamePattern.match(name):
+        raise ValueError('Invalid ring name: ' + repr(name))
+    return os.path.join(directory, name)
+
+
+def slot_stride(slot_size):
+    # Keep every slot's pixels 64 byte aligned.
+    return kSlotHeaderSize + (slot_size + 63) // 64 * 64
+
+
+def pack_frame_ref(input_data, ring_name, seq):
+    """Point a NetworkComputeInputData at frame seq of a ring instead of carrying the image.
+
+    Merges with whatever else the request already packed into other_data (e.g. roi.py's window).
+    """
+    params = struct_pb2.Struct()
+    if input_data.other_data.Is(struct_pb2.Struct.DESCRIPTOR):
+        input_data.other_data.Unpack(params)
+    params.update({'shm_ring': ring_name, 'shm_seq': seq})
+    input_data.other_data.Pack(params)
+
+
+class FrameRingWriter:
+    """Creates a ring in /dev/shm and writes frames into it.  The file is removed on close()."""
+
+    def __init__(self, name, num_slots=8, slot_size=640 * 480 * 3, directory=kDefaultDirectory):
+        self.name = name
+        self.path = ring_path(name, directory)
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.count = 0
+
+        size = kHeaderSize + num_slots * slot_stride(slot_size)
+        # Replace any ring left behind by a previous run; readers notice the new file.
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        kHeader.pack_into(self._mmap, 0, kMagic, num_slots, slot_size, 0)
+
+    def _slot_offset(self, seq):
+        return kHeaderSize + (seq % self.num_slots) * slot_stride(self.slot_size)
+
+    def reserve(self, shape):
+        """Claim the next slot for a frame of shape (rows, cols[, channels]).
+
+        Returns (seq, array): fill in the array, e.g. as the dst of cv2.cvtColor, then commit().
+        """
+        rows, cols = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+        if rows * cols * channels > self.slot_size:
+            raise ValueError('Frame of {} bytes does not fit in {} byte slots'.format(
+                rows * cols * channels, self.slot_size))
+
+        seq = self.count + 1
+        offset = self._slot_offset(seq)
+        # Readers of the frame this slot held stop trusting it from here on.
+        kSeq.pack_into(self._mmap, offset, 0)
+        array = np.ndarray(shape, np.uint8, buffer=self._mmap, offset=offset + kSlotHeaderSize)
+        return seq, array
+
+    def commit(self, seq, shape, timestamp=None):
+        rows, cols = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+        offset = self._slot_offset(seq)
+        kSlotHeader.pack_into(self._mmap, offset, 0, rows, cols, channels,
+                              time.time() if timestamp is None else timestamp)
+        # Publish the sequence number last: a reader that sees it sees the whole frame.
+        kSeq.pack_into(self._mmap, offset, seq)
+        kCount.pack_into(self._mmap, kCountOffset, seq)
+        self.count = seq
+
+    def write(self, image, timestamp=None):
+        """Copy a uint8 image into the next slot.  Returns its sequence number."""
+        seq, array = self.reserve(image.shape)
+        array[...] = image
+        self.commit(seq, image.shape, timestamp)
+        return seq
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Arrays from reserve() are still alive; the mapping goes when they do.
+            pass
+
+
+class FrameRingReader:
+    """Maps an existing ring read-only and hands out views of its frames."""
+
+    def __init__(self, name, directory=kDefaultDirectory):
+        self.name = name
+        self.path = ring_path(name, directory)
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.inode = os.fstat(fd).st_ino
+            self._mmap = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, self.num_slots, self.slot_size, _ = kHeader.unpack_from(self._mmap, 0)
+        if magic != kMagic:
+            raise ValueError(self.path + ' is not a frame ring')
+
+    def count(self):
+        """Frames written so far, i.e. the sequence number of the newest one."""
+        return kCount.unpack_from(self._mmap, kCountOffset)[0]
+
+    def _slot_offset(self, seq):
+        return kHeaderSize + (seq % self.num_slots) * slot_stride(self.slot_size)
+
+    def frame(self, seq):
+        """(image, timestamp) for frame seq, or None if its slot holds another frame by now.
+
+        The image is a read-only view into the ring, not a copy.  Check valid(seq) once done
+        with it: if the writer came around to the slot in the meantime, the pixels are torn.
+        """
+        if seq <= 0:
+            return None
+        offset = self._slot_offset(seq)
+        slot_seq, rows, cols, channels, timestamp = kSlotHeader.unpack_from(self._mmap, offset)
+        if slot_seq != seq or rows * cols * channels > self.slot_size:
+            return None
+        shape = (rows, cols) if channels == 1 else (rows, cols, channels)
+        image = np.ndarray(shape, np.uint8, buffer=self._mmap, offset=offset + kSlotHeaderSize)
+        if not self.valid(seq):
+            return None
+        return image, timestamp
+
+    def valid(self, seq):
+        return kSeq.unpack_from(self._mmap, self._slot_offset(seq))[0] == seq
+
+    def replaced(self):
+        """True if the writer has since recreated the ring, so this mapping is stale."""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return True
+
+
+class SharedFrames:
+    """The server's side: rings by name, opened on first use and reopened if recreated."""
+
+    def __init__(self, directory=kDefaultDirectory):
+        self.directory = directory
+        self._readers = {}
+
+    def get(self, name, seq):
+        """The view of frame seq in ring name, or None if it isn't there (any more)."""
+        try:
+            reader = self._readers.get(name)
+            # A producer that restarts makes a new ring under the same name and counts from 1
+            # again, so an old mapping could hold a different frame with the same number.
+            if reader is None or reader.replaced():
+                reader = FrameRingReader(name, self.directory)
+                self._readers[name] = reader
+            found = reader.frame(seq)
+        except (OSError, ValueError) as err:
+            print('Error: cannot read frame {} of ring {}: {}'.format(seq, name, err))
+            return None
+        return found[0] if found is not None else None
+
+    def valid(self, name, seq):
+        reader = self._readers.get(name)
+        return reader is not None and reader.valid(seq)